@@ -13,7 +13,23 @@
     See the License for the specific language governing permissions and
     limitations under the License.
 """
-from geedim.collection import MaskedCollection
+import importlib
+
 from geedim.enums import CloudMaskMethod, CompositeMethod, ResamplingMethod
-from geedim.mask import MaskedImage
-from geedim.utils import Initialize
+
+# attributes imported on first access, so that importing geedim (e.g. for the CLI) does not import ee, rasterio etc.
+_lazy_attrs = dict(MaskedCollection='geedim.collection', MaskedImage='geedim.mask', Initialize='geedim.utils')
+
+__all__ = ['CloudMaskMethod', 'CompositeMethod', 'ResamplingMethod', *_lazy_attrs.keys()]
+
+
+def __getattr__(name: str):
+    if name in _lazy_attrs:
+        value = getattr(importlib.import_module(_lazy_attrs[name]), name)
+        globals()[name] = value  # cache the attribute so that __getattr__ is not called again
+        return value
+    raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
+
+
+def __dir__():
+    return sorted({*globals().keys(), *_lazy_attrs.keys()})
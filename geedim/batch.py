@@ -0,0 +1,377 @@
+"""
+    Copyright 2021 Dugal Harris - dugalh@gmail.com
+
+    Licensed under the Apache License, Version 2.0 (the "License");
+    you may not use this file except in compliance with the License.
+    You may obtain a copy of the License at
+
+       http://www.apache.org/licenses/LICENSE-2.0
+
+    Unless required by applicable law or agreed to in writing, software
+    distributed under the License is distributed on an "AS IS" BASIS,
+    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+    See the License for the specific language governing permissions and
+    limitations under the License.
+"""
+"""
+    Batch search, composite and download jobs, with a persistent SQLite job queue.
+
+    A job is a dict with some or all of the following keys:
+
+    * Images to search / composite / download: ``id`` (an image ID or list of image IDs), or ``collection``,
+      ``start_date``, ``end_date``, ``fill_portion`` and ``cloudless_portion`` to search a collection.
+    * Region: ``region`` (a geojson polygon dict, or path of a geojson or raster file), or ``bbox`` (a
+      [xmin, ymin, xmax, ymax] list).
+    * Compositing: ``method`` and ``date``.  If ``method`` is not specified, images are downloaded individually.
+    * Download: ``download_dir``, ``crs``, ``scale``, ``dtype``, ``mask``, ``resampling``, ``scale_offset`` and
+      ``overwrite``.
+    * Cloud/shadow masking: ``cloud_kwargs``, a dict of :meth:`geedim.mask.MaskedImage.__init__` ``**kwargs``.
+"""
+import csv
+import hashlib
+import json
+import logging
+import os
+import pathlib
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Tuple, Union
+
+from geedim.collection import MaskedCollection
+from geedim.enums import CompositeMethod, ResamplingMethod
+from geedim.mask import MaskedImage
+from geedim.utils import get_bounds
+
+logger = logging.getLogger(__name__)
+
+job_keys = [
+    'id', 'collection', 'start_date', 'end_date', 'fill_portion', 'cloudless_portion', 'region', 'bbox', 'method',
+    'date', 'download_dir', 'crs', 'scale', 'dtype', 'mask', 'resampling', 'scale_offset', 'overwrite', 'cloud_kwargs'
+]
+
+
+def _parse_csv_value(value: str):
+    """ Parse a CSV job value as JSON (e.g. numbers, booleans, lists and dicts), or return it as is. """
+    try:
+        return json.loads(value)
+    except ValueError:
+        return value
+
+
+def read_jobs(filename: Union[str, pathlib.Path]) -> List[Dict]:
+    """
+    Read and validate a list of jobs from a CSV, JSON or YAML file.
+
+    CSV files should have a header row of job keys, and a row per job.  Empty values are ignored, and values are
+    parsed as JSON where possible (e.g. ``["A/B/C", "A/B/D"]`` for a list of image IDs).  JSON & YAML files should
+    contain a list of job dicts.  Reading YAML files requires the ``pyyaml`` package.
+
+    Parameters
+    ----------
+    filename: str, pathlib.Path
+        Path of the job file.
+
+    Returns
+    -------
+    list of dict
+        Jobs.
+    """
+    filename = pathlib.Path(filename)
+    suffix = filename.suffix.lower()
+    with open(filename, 'r', newline='') as f:
+        if suffix == '.csv':
+            jobs = [
+                {key: _parse_csv_value(value) for key, value in row.items() if value not in [None, '']}
+                for row in csv.DictReader(f)
+            ]  # yapf: disable
+        elif suffix == '.json':
+            jobs = json.load(f)
+        elif suffix in ['.yaml', '.yml']:
+            try:
+                import yaml
+            except ImportError:
+                raise ImportError('The pyyaml package is required for reading YAML job files.')
+            jobs = yaml.safe_load(f)
+        else:
+            raise ValueError(f'Unsupported job file type: {filename.suffix}.  Use a .csv, .json or .yaml file.')
+
+    if not isinstance(jobs, list):
+        raise ValueError(f'{filename.name} should contain a list of jobs.')
+    validate_jobs(jobs)
+    return jobs
+
+
+def validate_jobs(jobs: List[Dict]):
+    """ Validate the keys of a list of jobs, raising a ValueError if they are invalid. """
+    for i, job in enumerate(jobs):
+        if not isinstance(job, dict):
+            raise ValueError(f'Job {i + 1} should be a dict.')
+        unknown_keys = set(job.keys()).difference(job_keys)
+        if len(unknown_keys) > 0:
+            raise ValueError(f'Job {i + 1} has unknown key(s): {", ".join(sorted(unknown_keys))}')
+        if ('id' in job) == ('collection' in job):
+            raise ValueError(f'Job {i + 1} should have one of `id` or `collection`.')
+
+
+def _job_region(job: Dict) -> Union[Dict, None]:
+    """ Return the geojson region of a job, if it has one. """
+    if 'bbox' in job:
+        xmin, ymin, xmax, ymax = job['bbox']
+        coordinates = [[xmax, ymax], [xmax, ymin], [xmin, ymin], [xmin, ymax], [xmax, ymax]]
+        return dict(type='Polygon', coordinates=[coordinates])
+    region = job.get('region', None)
+    if isinstance(region, str):
+        if 'json' in region:
+            with open(region, 'r') as f:
+                return json.load(f)
+        return get_bounds(region, expand=10)
+    return region
+
+
+def run_job(job: Dict, num_threads: int = None):
+    """
+    Run a search / composite / download job.
+
+    Parameters
+    ----------
+    job: dict
+        Job to run.  See :mod:`geedim.batch` for the job keys.
+    num_threads: int, optional
+        Number of tiles to download concurrently for each image.
+    """
+    region = _job_region(job)
+    cloud_kwargs = job.get('cloud_kwargs', {})
+    mask = job.get('mask', MaskedImage._default_mask)
+    resampling = ResamplingMethod(job['resampling']) if 'resampling' in job else None
+
+    if 'collection' in job:
+        gd_collection = MaskedCollection.from_name(job['collection']).search(
+            job['start_date'], job['end_date'], region, fill_portion=job.get('fill_portion', None),
+            cloudless_portion=job.get('cloudless_portion', None), **cloud_kwargs
+        )
+        im_ids = list(gd_collection.properties.keys())
+        if len(im_ids) == 0:
+            logger.info(f'No {job["collection"]} images found.')
+            return
+    else:
+        im_ids = [job['id']] if isinstance(job['id'], str) else job['id']
+        gd_collection = MaskedCollection.from_list(im_ids) if 'method' in job else None
+
+    if 'method' in job:
+        image_list = [
+            gd_collection.composite(
+                method=CompositeMethod(job['method']), mask=mask, resampling=resampling, date=job.get('date', None),
+                region=region, **cloud_kwargs
+            )
+        ]  # yapf: disable
+    else:
+        image_list = [MaskedImage.from_id(im_id, mask=mask, **cloud_kwargs) for im_id in im_ids]
+
+    download_dir = pathlib.Path(job.get('download_dir', os.getcwd()))
+    download_kwargs = {key: job[key] for key in ['crs', 'scale', 'dtype', 'scale_offset'] if key in job}
+    if resampling:
+        download_kwargs['resampling'] = resampling
+    for im in image_list:
+        filename = download_dir.joinpath(im.name + '.tif')
+        im.download(
+            filename, overwrite=job.get('overwrite', False), num_threads=num_threads, region=region, **download_kwargs
+        )
+
+
+class JobQueue:
+    # job states
+    pending = 'pending'
+    running = 'running'
+    done = 'done'
+    failed = 'failed'
+
+    def __init__(self, filename: Union[str, pathlib.Path]):
+        """
+        A persistent SQLite queue of batch jobs and their states.
+
+        Jobs are identified by a hash of their contents, so that adding the same jobs again does not duplicate them,
+        and unfinished jobs can be resumed.  The queue can be shared between threads.
+
+        Parameters
+        ----------
+        filename: str, pathlib.Path
+            Path of the SQLite queue file.  It is created if it does not exist.
+        """
+        self._filename = pathlib.Path(filename)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(self._filename), check_same_thread=False)
+        with self._conn:
+            self._conn.execute(
+                'CREATE TABLE IF NOT EXISTS jobs (key TEXT PRIMARY KEY, position INTEGER, job TEXT, state TEXT, '
+                'error TEXT, updated REAL)'
+            )
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def close(self):
+        """ Close the queue file. """
+        self._conn.close()
+
+    @staticmethod
+    def _job_key(job: Dict) -> str:
+        """ Return a key uniquely identifying a job. """
+        return hashlib.sha1(json.dumps(job, sort_keys=True, default=str).encode()).hexdigest()
+
+    def add(self, jobs: List[Dict]) -> List[str]:
+        """
+        Add jobs to the queue, in the pending state.  Jobs that are already queued keep their existing state.
+
+        Parameters
+        ----------
+        jobs: list of dict
+            Jobs to add.
+
+        Returns
+        -------
+        list of str
+            Keys of the added jobs.
+        """
+        keys = [self._job_key(job) for job in jobs]
+        with self._lock, self._conn:
+            position = self._conn.execute('SELECT COALESCE(MAX(position), -1) + 1 FROM jobs').fetchone()[0]
+            for key, job in zip(keys, jobs):
+                cursor = self._conn.execute(
+                    'INSERT OR IGNORE INTO jobs VALUES (?, ?, ?, ?, NULL, ?)',
+                    (key, position, json.dumps(job), self.pending, time.time())
+                )
+                position += cursor.rowcount
+        return keys
+
+    def resume(self, retry_failed: bool = False):
+        """
+        Return interrupted (running) jobs, and optionally failed jobs, to the pending state.
+
+        Parameters
+        ----------
+        retry_failed: bool, optional
+            Whether to return failed jobs to the pending state.
+        """
+        states = [self.running, self.failed] if retry_failed else [self.running]
+        with self._lock, self._conn:
+            self._conn.execute(
+                f'UPDATE jobs SET state = ?, error = NULL, updated = ? WHERE state IN ({", ".join("?" * len(states))})',
+                (self.pending, time.time(), *states)
+            )
+
+    def get_pending(self, keys: List[str] = None) -> List[Tuple[str, Dict]]:
+        """
+        Return pending jobs in the order they were added, as a list of (key, job) tuples.
+
+        Parameters
+        ----------
+        keys: list of str, optional
+            Restrict the pending jobs to those with these keys.  By default, all pending jobs are returned.
+        """
+        with self._lock:
+            rows = self._conn.execute(
+                'SELECT key, job FROM jobs WHERE state = ? ORDER BY position', (self.pending,)
+            ).fetchall()
+        keys = set(keys) if keys is not None else None
+        return [(key, json.loads(job)) for key, job in rows if (keys is None) or (key in keys)]
+
+    def set_state(self, key: str, state: str, error: str = None):
+        """ Set the state, and any error message, of a job. """
+        with self._lock, self._conn:
+            self._conn.execute(
+                'UPDATE jobs SET state = ?, error = ?, updated = ? WHERE key = ?', (state, error, time.time(), key)
+            )
+
+    def get_state(self, key: str) -> Tuple[str, Union[str, None]]:
+        """ Return the (state, error) of a job. """
+        with self._lock:
+            row = self._conn.execute('SELECT state, error FROM jobs WHERE key = ?', (key,)).fetchone()
+        if row is None:
+            raise ValueError(f'There is no job with key: {key}')
+        return row
+
+    def get_counts(self, keys: List[str] = None) -> Dict[str, int]:
+        """
+        Return the number of jobs in each state.
+
+        Parameters
+        ----------
+        keys: list of str, optional
+            Restrict the count to jobs with these keys.  By default, all jobs are counted.
+        """
+        with self._lock:
+            rows = self._conn.execute('SELECT key, state FROM jobs').fetchall()
+        keys = set(keys) if keys is not None else None
+        counts = {state: 0 for state in [self.pending, self.running, self.done, self.failed]}
+        for key, state in rows:
+            if (keys is None) or (key in keys):
+                counts[state] += 1
+        return counts
+
+
+def _job_threads(max_jobs: int, max_threads: int = None) -> int:
+    """ Return the number of tile download threads per job, sharing ``max_threads`` between ``max_jobs`` jobs. """
+    max_threads = max_threads or min(32, (os.cpu_count() or 1) + 4)
+    return max(1, max_threads // max_jobs)
+
+
+def run_queued(queue: JobQueue, key: str, job: Dict, num_threads: int = None):
+    """
+    Run a queued job, recording its state in the queue.
+
+    Parameters
+    ----------
+    queue: JobQueue
+        Job queue.
+    key: str
+        Key of the job.
+    job: dict
+        Job to run.
+    num_threads: int, optional
+        Number of tiles to download concurrently for each image.
+    """
+    queue.set_state(key, queue.running)
+    try:
+        run_job(job, num_threads=num_threads)
+    except Exception as ex:
+        logger.warning(f'Job {key} failed: {str(ex)}')
+        queue.set_state(key, queue.failed, error=str(ex))
+    else:
+        queue.set_state(key, queue.done)
+
+
+def run_jobs(queue: JobQueue, keys: List[str] = None, max_jobs: int = 4, max_threads: int = None) -> Dict[str, int]:
+    """
+    Run pending jobs from a queue concurrently, recording their states in the queue.
+
+    Parameters
+    ----------
+    queue: JobQueue
+        Job queue.
+    keys: list of str, optional
+        Keys of the jobs to run.  By default, all pending jobs are run.
+    max_jobs: int, optional
+        Maximum number of jobs to run concurrently.
+    max_threads: int, optional
+        Maximum number of tiles to download concurrently, shared between concurrent jobs.  Defaults to a value based
+        on the number of CPUs.
+
+    Returns
+    -------
+    dict
+        The number of jobs in each state, after running.
+    """
+    num_threads = _job_threads(max_jobs, max_threads)
+    with ThreadPoolExecutor(max_workers=max_jobs) as executor:
+        futures = [
+            executor.submit(run_queued, queue, key, job, num_threads=num_threads)
+            for key, job in queue.get_pending(keys=keys)
+        ]  # yapf: disable
+        for future in futures:
+            future.result()
+    return queue.get_counts(keys=keys)
@@ -19,20 +19,25 @@ import os
 import pathlib
 import re
 import sys
+from copy import copy
 from types import SimpleNamespace
 from typing import List
 
 import click
-import rasterio.crs as rio_crs
 from click.core import ParameterSource
-from geedim import schema, Initialize, version
-from geedim.collection import MaskedCollection
-from geedim.download import BaseImage
+from geedim import version
 from geedim.enums import CloudMaskMethod, CompositeMethod, ResamplingMethod
-from geedim.mask import MaskedImage
-from geedim.utils import get_bounds, Spinner
-from rasterio.dtypes import dtype_ranges
-from rasterio.errors import CRSError
+
+# Note that ee, rasterio and the geedim modules that depend on them, are imported where they are needed, rather than
+# here, so that e.g. --help and option validation are not delayed by their import.  Defaults that would otherwise
+# require these imports are duplicated below (and tested for consistency in tests/test_cli.py).
+
+# BaseImage._default_resampling
+_default_resampling = ResamplingMethod.near
+# MaskedImage._default_mask
+_default_mask = False
+# data types supported by BaseImage._convert_dtype()
+_dtypes = ['uint8', 'uint16', 'uint32', 'int8', 'int16', 'int32', 'float32', 'float64']
 
 logger = logging.getLogger(__name__)
 
@@ -79,6 +84,7 @@ class ChainedCommand(click.Command):
         """Manage shared `image_list` and `region` parameters."""
 
         # initialise earth engine (do it here, rather than in cli() so that it does not delay --help)
+        from geedim.utils import Initialize
         Initialize()
 
         # combine `region` and `bbox` into a single region in the context object
@@ -113,6 +119,7 @@ def _configure_logging(verbosity):
 
 def _collection_cb(ctx, param, value):
     """click callback to validate collection name"""
+    from geedim import schema
     if value in schema.gd_to_ee:
         value = schema.gd_to_ee[value]
     return value
@@ -121,6 +128,8 @@ def _collection_cb(ctx, param, value):
 def _crs_cb(ctx, param, crs):
     """click callback to validate and parse the CRS."""
     if crs is not None:
+        import rasterio.crs as rio_crs
+        from rasterio.errors import CRSError
         try:
             wkt_fn = pathlib.Path(crs)
             if wkt_fn.exists():  # read WKT from file, if it exists
@@ -152,6 +161,7 @@ def _region_cb(ctx, param, value):
             with click.open_file(value, encoding='utf-8') as f:
                 value = json.load(f)
         else:
+            from geedim.utils import get_bounds
             value = get_bounds(value, expand=10)
     elif value is not None and len(value) != 0:
         raise click.BadParameter(f'Invalid region: {filename}.', param=param)
@@ -173,8 +183,9 @@ def _comp_method_cb(ctx, param, value):
     return CompositeMethod(value) if value else None
 
 
-def _prepare_image_list(obj: SimpleNamespace, mask=False) -> List[MaskedImage, ]:
+def _prepare_image_list(obj: SimpleNamespace, mask=False, pack_masks=False) -> List['MaskedImage', ]:
     """Validate and prepare the obj.image_list for export/download.  Returns a list of MaskedImage objects."""
+    from geedim.mask import MaskedImage
     if len(obj.image_list) == 0:
         raise click.BadOptionUsage(
             'image_id', 'Either pass --id, or chain this command with a successful `search` or `composite`'
@@ -188,6 +199,10 @@ def _prepare_image_list(obj: SimpleNamespace, mask=False) -> List[MaskedImage, ]
                 im_obj.mask_clouds()
         else:
             raise ValueError(f'Unsupported image object type: {type(im_obj)}')
+        if pack_masks:
+            # pack a copy, so that chained images keep their mask bands
+            im_obj = copy(im_obj)
+            im_obj.pack_masks()
         image_list.append(im_obj)
 
     if obj.region is None and any([not im.has_fixed_projection for im in image_list]):
@@ -213,24 +228,34 @@ scale_option = click.option(
     help='Pixel scale (size) to resample image(s) to (m).'
 )
 dtype_option = click.option(
-    '-dt', '--dtype', type=click.Choice(list(dtype_ranges.keys()), case_sensitive=False), default=None,
+    '-dt', '--dtype', type=click.Choice(_dtypes, case_sensitive=False), default=None,
     show_default='smallest data type able to represent the range of pixel values.',
     help='Data type to convert image(s) to.'
 )
 mask_option = click.option(
-    '-m/-nm', '--mask/--no-mask', default=MaskedImage._default_mask, show_default=True,
+    '-m/-nm', '--mask/--no-mask', default=_default_mask, show_default=True,
     help='Whether to apply cloud/shadow mask(s); or fill mask(s), in the case of images without '
     'support for cloud/shadow masking.'
 )
 resampling_option = click.option(
     '-rs', '--resampling', type=click.Choice([rm.value for rm in ResamplingMethod], case_sensitive=True),
-    default=BaseImage._default_resampling.value, show_default=True, callback=_resampling_method_cb,
+    default=_default_resampling.value, show_default=True, callback=_resampling_method_cb,
     help='Resampling method.'
 )
 scale_offset_option = click.option(
     '-so/-nso', '--scale-offset/--no-scale-offset', default=False, show_default=True,
     help='Whether to apply any EE band scales and offsets to the image.'
 )
+data_dtype_option = click.option(
+    '-ddt/-nddt', '--data-dtype/--no-data-dtype', default=False, show_default=True,
+    help='Whether to auto select the data type from the actual range of pixel values in the region, rather than from '
+    'the range of the image band data types.  Used when :option:`--dtype` is not specified.'
+)
+pack_masks_option = click.option(
+    '-pm/-npm', '--pack-masks/--no-pack-masks', default=False, show_default=True,
+    help='Whether to pack the auxiliary mask bands into a single uint8 MASK_BITS band (FILL_MASK, CLOUD_MASK, '
+    'SHADOW_MASK and CLOUDLESS_MASK in bits 0-3).'
+)
 
 
 # geedim CLI and chained command group
@@ -292,8 +317,17 @@ def cli(ctx, verbose, quiet):
     help='Maximum distance (m) to look for clouds.  Used to form the cloud distance band for the `q-mosaic` '
     'compositing ``--method``.'
 )
+@click.option(
+    '-cd/-ncd', '--cloud-dist/--no-cloud-dist', default=True, show_default=True,
+    help='Whether to include the cloud distance (CLOUD_DIST) band in downloaded / exported images.  Composites only '
+    'include it when ``--cloud-dist`` is specified, or for the `q-mosaic` compositing ``--method``.  Cloud distance '
+    'is never found for ``search``.'
+)
 @click.pass_context
-def config(ctx, mask_cirrus, mask_shadows, mask_method, prob, dark, shadow_dist, buffer, cdi_thresh, max_cloud_dist):
+def config(
+    ctx, mask_cirrus, mask_shadows, mask_method, prob, dark, shadow_dist, buffer, cdi_thresh, max_cloud_dist,
+    cloud_dist
+):
     # @formatter:off
     """
     Configure cloud/shadow masking.
@@ -372,12 +406,46 @@ cli.add_command(config)
     help='Lower limit on the cloud/shadow free portion of the region (%).  If cloud/shadow masking is not supported '
     'for the specified collection, :option:`--cloudless-portion` will operate like :option:`--fill-portion`.'
 )
+@click.option(
+    '-sp', '--split-days', type=click.IntRange(min=1), default=None,
+    help='Split the search date range into intervals of this many days, and search the intervals concurrently.  '
+    'Can speed up searches over long date ranges.'
+)
+@click.option(
+    '-pfm', '--prefilter-margin', type=click.FloatRange(min=0, max=100), default=None,
+    help='Exclude images whose granule cloud cover is more than 100 - :option:`--cloudless-portion` + '
+    ':option:`--prefilter-margin` (%), before finding region statistics.  Valid for cloud/shadow maskable collections. '
+    ' By default, no pre-filtering is done.'
+)
+@click.option(
+    '-ss', '--stats-scale', type=click.FloatRange(min=0, min_open=True), default=None,
+    help='Scale (m) at which to find filled/cloudless portions.  A coarse scale speeds up searches of large regions, '
+    'at the cost of accuracy.  By default, the nominal scale of the collection is used.'
+)
+@click.option(
+    '-st', '--stats-tolerance', type=click.FloatRange(min=0, max=100), default=None,
+    help='Re-find filled/cloudless portions at the nominal scale for images whose :option:`--stats-scale` portions are '
+    'within this tolerance (%) of the portion thresholds.  By default, no re-finding is done.'
+)
+@click.option(
+    '-inc', '--incremental', is_flag=True, default=False,
+    help='Cache search results, and only search for images captured after the latest cached image on subsequent '
+    'searches with the same collection, region and options.  The cache location can be set with the '
+    '`GEEDIM_CACHE_DIR` environment variable.'
+)
+@click.option(
+    '-ix', '--index', type=click.Path(exists=False, dir_okay=False, writable=True), default=None,
+    help='SQLite file in which to index search results (with footprints) for offline filtering.'
+)
 @click.option(
     '-op', '--output', type=click.Path(exists=False, dir_okay=False, writable=True), default=None,
     help='JSON file to write search results to.'
 )
 @click.pass_obj
-def search(obj, collection, start_date, end_date, bbox, region, fill_portion, cloudless_portion, output):
+def search(
+    obj, collection, start_date, end_date, bbox, region, fill_portion, cloudless_portion, split_days,
+    prefilter_margin, stats_scale, stats_tolerance, incremental, index, output
+):
     # @formatter:off
     """
     Search for images.
@@ -419,6 +487,9 @@ def search(obj, collection, start_date, end_date, bbox, region, fill_portion, cl
         geedim search -c l9-c2-l2 -s 2022-01-01 -e 2022-03-01 --bbox 23 -34 23.2 -33.8 --cloudless-portion 50
     """
     # @formatter:on
+    from geedim.collection import MaskedCollection
+    from geedim.utils import Spinner
+
     if not obj.region:
         raise click.BadOptionUsage('region', 'Either pass --region or --bbox')
 
@@ -432,7 +503,8 @@ def search(obj, collection, start_date, end_date, bbox, region, fill_portion, cl
     with Spinner(label=label, leave=' '):
         gd_collection = gd_collection.search(
             start_date, end_date, obj.region, fill_portion=fill_portion, cloudless_portion=cloudless_portion,
-            **obj.cloud_kwargs
+            split_days=split_days, prefilter_margin=prefilter_margin,
+            stats_scale=stats_scale, stats_tolerance=stats_tolerance, incremental=incremental, **obj.cloud_kwargs
         )
         num_images = len(gd_collection.properties)  # retrieve search result properties from EE
 
@@ -450,6 +522,10 @@ def search(obj, collection, start_date, end_date, bbox, region, fill_portion, cl
         with open(output, 'w', encoding='utf8', newline='') as f:
             json.dump(gd_collection.properties, f)
 
+    # add results to the search index
+    if (index is not None) and (num_images > 0):
+        gd_collection.to_index(index)
+
 
 cli.add_command(search)
 
@@ -466,12 +542,14 @@ cli.add_command(search)
 @crs_option
 @scale_option
 @dtype_option
+@data_dtype_option
 @mask_option
 @resampling_option
 @scale_offset_option
+@pack_masks_option
 @click.option('-o', '--overwrite', is_flag=True, default=False, help='Overwrite the destination file if it exists.')
 @click.pass_obj
-def download(obj, image_id, bbox, region, download_dir, mask, overwrite, **kwargs):
+def download(obj, image_id, bbox, region, download_dir, mask, pack_masks, overwrite, **kwargs):
     # @formatter:off
     """
     Download image(s).
@@ -499,7 +577,9 @@ def download(obj, image_id, bbox, region, download_dir, mask, overwrite, **kwarg
         CLOUD_DIST      Distance to nearest cloud (m).
         ==============  =========================================
 
-    Images from other collections, will contain the FILL_MASK band only.
+    Images from other collections, will contain the FILL_MASK band only.  With ``--pack-masks``, the *_MASK bands are
+    replaced with a single uint8 MASK_BITS band, containing FILL_MASK, CLOUD_MASK, SHADOW_MASK and CLOUDLESS_MASK in
+    bits 0-3.
 
     If neither ``--bbox`` or ``--region`` are specified, the entire image granule
     will be downloaded.
@@ -521,7 +601,7 @@ def download(obj, image_id, bbox, region, download_dir, mask, overwrite, **kwarg
     # @formatter:on
     logger.info('\nDownloading:\n')
     download_dir = download_dir or os.getcwd()
-    image_list = _prepare_image_list(obj, mask=mask)
+    image_list = _prepare_image_list(obj, mask=mask, pack_masks=pack_masks)
     for im in image_list:
         filename = pathlib.Path(download_dir).joinpath(im.name + '.tif')
         im.download(filename, overwrite=overwrite, region=obj.region, **kwargs)
@@ -542,14 +622,16 @@ cli.add_command(download)
 @crs_option
 @scale_option
 @dtype_option
+@data_dtype_option
 @mask_option
 @resampling_option
 @scale_offset_option
+@pack_masks_option
 @click.option(
     '-w/-nw', '--wait/--no-wait', default=True, show_default=True, help='Whether to wait for the export to complete.'
 )
 @click.pass_obj
-def export(obj, image_id, bbox, region, drive_folder, mask, wait, **kwargs):
+def export(obj, image_id, bbox, region, drive_folder, mask, pack_masks, wait, **kwargs):
     # @formatter:off
     """
     Export image(s) to Google Drive.
@@ -574,7 +656,9 @@ def export(obj, image_id, bbox, region, drive_folder, mask, wait, **kwargs):
         CLOUD_DIST      Distance to nearest cloud.
         ==============  =========================================
 
-    Images from other collections, will contain the FILL_MASK band only.
+    Images from other collections, will contain the FILL_MASK band only.  With ``--pack-masks``, the *_MASK bands are
+    replaced with a single uint8 MASK_BITS band, containing FILL_MASK, CLOUD_MASK, SHADOW_MASK and CLOUDLESS_MASK in
+    bits 0-3.
 
     If neither ``--bbox`` or ``--region`` are specified, the entire image granule
     will be downloaded.
@@ -595,7 +679,7 @@ def export(obj, image_id, bbox, region, drive_folder, mask, wait, **kwargs):
     """
     # @formatter:on
     logger.info('\nExporting:\n')
-    image_list = _prepare_image_list(obj, mask=mask)
+    image_list = _prepare_image_list(obj, mask=mask, pack_masks=pack_masks)
     export_tasks = []
     for im in image_list:
         task = im.export(im.name, folder=drive_folder, wait=False, region=obj.region, **kwargs)
@@ -603,6 +687,7 @@ def export(obj, image_id, bbox, region, drive_folder, mask, wait, **kwargs):
         logger.info(f'Started {im.name}') if not wait else None
 
     if wait:
+        from geedim.download import BaseImage
         for task in export_tasks:
             BaseImage.monitor_export(task)
 
@@ -628,7 +713,7 @@ cli.add_command(export)
 )
 @click.option(
     '-rs', '--resampling', type=click.Choice([rm.value for rm in ResamplingMethod], case_sensitive=True),
-    default=BaseImage._default_resampling.value, callback=_resampling_method_cb, show_default=True,
+    default=_default_resampling.value, callback=_resampling_method_cb, show_default=True,
     help='Resample images with this method before compositing.'
 )
 @click.option(
@@ -666,22 +751,27 @@ def composite(obj, image_id, mask, method, resampling, bbox, region, date):
     pixels.  The following options are available:
     \b
 
-        ==========  ========================================================
-        Method      Description
-        ==========  ========================================================
-        `q-mosaic`  | Use the unmasked pixel with the highest cloud distance
-                    | (i.e. distance to nearest cloud).  Where more than one
-                    | pixel has the same cloud distance, the first one in the
-                    | stack is selected.
-        `mosaic`    Use the first unmasked pixel in the stack.
-        `medoid`    | Use the medoid of the unmasked pixels i.e. the pixels
-                    | of the image with minimum summed difference (across
-                    | bands) to the median over the input images.
-                    | Maintains relationship between bands.
-        `median`    Use the median of the unmasked pixels.
-        `mode`      Use the mode of the unmasked pixels.
-        `mean`      Use the mean of the unmasked pixels.
-        ==========  ========================================================
+        ==============  ========================================================
+        Method          Description
+        ==============  ========================================================
+        `q-mosaic`      | Use the unmasked pixel with the highest cloud distance
+                        | (i.e. distance to nearest cloud).  Where more than one
+                        | pixel has the same cloud distance, the first one in the
+                        | stack is selected.
+        `mosaic`        Use the first unmasked pixel in the stack.
+        `medoid`        | Use the medoid of the unmasked pixels i.e. the pixels
+                        | of the image with minimum summed difference (across
+                        | bands) to the median over the input images.
+                        | Maintains relationship between bands.
+        `array-medoid`  | Use the medoid of the unmasked pixels, as with
+                        | `medoid`, but found with array operations on the
+                        | whole stack, rather than by iterating over the input
+                        | images.  An alternative to `medoid` for large
+                        | collections.
+        `median`        Use the median of the unmasked pixels.
+        `mode`          Use the mode of the unmasked pixels.
+        `mean`          Use the mean of the unmasked pixels.
+        ==============  ========================================================
 
     For the `mosaic` and `q-mosaic` methods there are three ways of ordering (i.e. prioritising) images in the stack:
     \b
@@ -717,6 +807,7 @@ def composite(obj, image_id, mask, method, resampling, bbox, region, date):
     if len(obj.image_list) == 0:
         raise click.BadOptionUsage('image_id', 'Either pass --id, or chain this command with a successful ``search``')
 
+    from geedim.collection import MaskedCollection
     gd_collection = MaskedCollection.from_list(obj.image_list)
     obj.image_list = [
         gd_collection.composite(
@@ -727,4 +818,184 @@ def composite(obj, image_id, mask, method, resampling, bbox, region, date):
 
 cli.add_command(composite)
 
+
+# batch command
+@click.command(cls=ChainedCommand)
+@click.argument('job_file', type=click.Path(exists=True, dir_okay=False, readable=True))
+@click.option(
+    '-qf', '--queue-file', type=click.Path(exists=False, dir_okay=False, writable=True), default=None,
+    show_default='<JOB_FILE>.queue.db', help='SQLite file in which to record job states.'
+)
+@click.option(
+    '-mj', '--max-jobs', type=click.IntRange(min=1), default=4, show_default=True,
+    help='Maximum number of jobs to run concurrently.'
+)
+@click.option(
+    '-mt', '--max-threads', type=click.IntRange(min=1), default=None, show_default='number of CPUs + 4, up to 32.',
+    help='Maximum number of image tiles to download concurrently, shared between concurrent jobs.'
+)
+@click.option('-rf', '--retry-failed', is_flag=True, default=False, help='Re-run jobs that failed on a previous run.')
+@click.pass_obj
+def batch(obj, job_file, queue_file, max_jobs, max_threads, retry_failed):
+    # @formatter:off
+    """
+    Run a file of search, composite and download jobs.
+
+    JOB_FILE is a CSV, JSON or YAML file of jobs.  Each job downloads image(s) specified by ID (``id``), or by a
+    collection search (``collection``, ``start_date``, ``end_date``, and optionally ``fill_portion`` and
+    ``cloudless_portion``).  Images are composited if a ``method`` (and optionally ``date``) is specified.  Other job
+    keys are ``region`` (geojson or raster file), ``bbox``, ``download_dir``, ``crs``, ``scale``, ``dtype``, ``mask``,
+    ``resampling``, ``scale_offset``, ``overwrite`` and ``cloud_kwargs``.  These have the same meaning as the
+    corresponding ``search``, ``composite``, ``download`` and ``config`` options.
+
+    CSV files should have a header row of job keys, and a row per job.  Values are parsed as JSON where possible e.g.
+    a list of image IDs can be specified as ``["<id 1>", "<id 2>"]``.  JSON and YAML files should contain a list of
+    job objects.  Reading YAML files requires the `pyyaml` package.
+
+    Jobs are run concurrently in a single process, sharing the Earth Engine session and metadata caches.  Job states
+    are recorded in a SQLite queue file, so that re-running the command resumes unfinished jobs, and skips completed
+    jobs.  The queue file should not be shared between concurrent ``batch`` commands.
+
+    This command can be chained after the ``config`` command, to configure cloud/shadow masking for jobs that do not
+    specify ``cloud_kwargs``.
+    \b
+
+    Examples
+    --------
+
+    Run the jobs in jobs.csv, downloading up to 8 images at a time::
+
+        geedim batch jobs.csv --max-jobs 8
+
+    Re-run failed jobs, with Sentinel-2 clouds masked using the `qa` ``--mask-method``::
+
+        geedim config --mask-method qa batch jobs.csv --retry-failed
+    """
+    # @formatter:on
+    from geedim.batch import JobQueue, read_jobs, run_jobs
+
+    try:
+        jobs = read_jobs(job_file)
+    except (ValueError, ImportError) as ex:
+        raise click.BadParameter(str(ex), param_hint="'JOB_FILE'")
+    if obj.cloud_kwargs:
+        jobs = [dict(job, cloud_kwargs=job.get('cloud_kwargs', obj.cloud_kwargs)) for job in jobs]
+
+    queue_file = queue_file or pathlib.Path(job_file).with_suffix('.queue.db')
+    with JobQueue(queue_file) as queue:
+        keys = queue.add(jobs)
+        queue.resume(retry_failed=retry_failed)
+        counts = queue.get_counts(keys=keys)
+        logger.info(f'\nRunning {counts[queue.pending]} of {len(keys)} jobs:\n')
+        counts = run_jobs(queue, keys=keys, max_jobs=max_jobs, max_threads=max_threads)
+
+    logger.info(f'\n{counts[queue.done]} of {len(keys)} jobs done.')
+    if counts[queue.failed] > 0:
+        raise click.ClickException(
+            f'{counts[queue.failed]} job(s) failed.  Errors are recorded in {queue_file}.  Re-run with '
+            f'--retry-failed to retry them.'
+        )
+
+
+cli.add_command(batch)
+
+
+# serve command
+@click.command(cls=ChainedCommand)
+@click.option(
+    '-h', '--host', type=click.STRING, default='127.0.0.1', show_default=True, help='Host address to listen on.'
+)
+@click.option(
+    '-p', '--port', type=click.IntRange(min=0, max=65535), default=8765, show_default=True, help='Port to listen on.'
+)
+@click.option(
+    '-qf', '--queue-file', type=click.Path(exists=False, dir_okay=False, writable=True), default=None,
+    show_default='serve.queue.db in the geedim cache directory.',
+    help='SQLite file in which to record jobs and their states.'
+)
+@click.option(
+    '-mj', '--max-jobs', type=click.IntRange(min=1), default=4, show_default=True,
+    help='Maximum number of jobs to run concurrently.'
+)
+@click.option(
+    '-mt', '--max-threads', type=click.IntRange(min=1), default=None, show_default='number of CPUs + 4, up to 32.',
+    help='Maximum number of image tiles to download concurrently, shared between concurrent jobs.'
+)
+def serve(host, port, queue_file, max_jobs, max_threads):
+    # @formatter:off
+    """
+    Run a local job server.
+
+    The server initialises Earth Engine once, and keeps STAC and image metadata caches warm between jobs.  It accepts
+    the same jobs as the ``batch`` command, as JSON objects, and runs them concurrently.  The API is:
+    \b
+
+        ===========================  ===================================================
+        Request                      Response
+        ===========================  ===================================================
+        ``POST /jobs``               Submit a job object, or a list of job objects.
+                                     Responds with ``{"keys": [<job key>, ...]}``.
+        ``GET /jobs``                The number of jobs in each state.
+        ``GET /jobs/<job key>``      ``{"key": <job key>, "state": <job state>,
+                                     "error": <error message>}``.
+        ===========================  ===================================================
+
+    Job states are one of `pending`, `running`, `done` or `failed`.  Jobs are recorded in a SQLite queue file, and
+    unfinished jobs are resumed when the server is restarted.  Use ``geedim.server.Client`` to submit jobs from
+    Python.  Stop the server with Ctrl-C, which waits for running jobs to finish.
+    \b
+
+    Examples
+    --------
+
+    Run the server on port 8765::
+
+        geedim serve --port 8765
+
+    Submit a job to the server, to download a region of a Landsat-9 image::
+
+        curl -d '{"id": "LANDSAT/LC09/C02/T1_L2/LC09_173083_20220308", "bbox": [21.6, -33.5, 21.7, -33.4]}' http://127.0.0.1:8765/jobs
+    """
+    # @formatter:on
+    from geedim.server import JobServer
+    from geedim.utils import cache_dir
+
+    queue_file = queue_file or cache_dir().joinpath('serve.queue.db')
+    server = JobServer(queue_file, host=host, port=port, max_jobs=max_jobs, max_threads=max_threads)
+    logger.info(f'Serving on http://{host}:{server.server_address[1]} (Ctrl-C to stop)')
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        logger.info('Stopping, after running jobs have finished...')
+    finally:
+        server.server_close()
+
+
+cli.add_command(serve)
+
+
+# stac-snapshot command
+@click.command()
+@click.option(
+    '-o', '--output', type=click.Path(exists=False, dir_okay=False, writable=True), default=None,
+    show_default='the snapshot packaged with geedim.', help='JSON file to write the snapshot to.'
+)
+def stac_snapshot(output):
+    """
+    Refresh the packaged EE STAC snapshot.
+
+    Retrieves the latest EE STAC entries of the collections supported by geedim, and writes them to a snapshot file.
+    Band properties, scales & offsets and licenses of these collections are read from the snapshot, rather than from
+    EE STAC.  The command does not need Earth Engine credentials, and should be run before releasing geedim.
+    """
+    from geedim.stac import StacCatalog
+
+    stac_catalog = StacCatalog()
+    stac_catalog.refresh_snapshot()
+    stac_catalog.write_snapshot(filename=output)
+    logger.info(f'Wrote {len(stac_catalog.snapshot)} STAC entries to {output or stac_catalog._snapshot_filename}')
+
+
+cli.add_command(stac_snapshot)
+
 ##
@@ -14,21 +14,33 @@
     limitations under the License.
 """
 
+import hashlib
+import json
 import logging
+import os
+import pathlib
 import re
-from collections import OrderedDict
+import threading
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta, timezone
-from typing import Dict, List, Union
+from functools import reduce
+from typing import Dict, List, Union, Iterator, Tuple
 
 import ee
+import numpy as np
 import tabulate
 from geedim import schema, medoid
+from geedim.composite import composite_array
 from geedim.download import BaseImage
 from geedim.enums import ResamplingMethod, CompositeMethod
 from geedim.errors import UnfilteredError, InputImageError
-from geedim.mask import MaskedImage, class_from_id
+from geedim.index import SearchIndex
+from geedim.mask import MaskedImage, Sentinel2ClImage, Sentinel2SrClImage, class_from_id
 from geedim.stac import StacCatalog, StacItem
-from geedim.utils import split_id, resample
+from geedim.tile import Tile
+from geedim.utils import split_id, resample, cache_dir
+from rasterio import windows
 from tabulate import TableFormat, Line, DataRow
 
 logger = logging.getLogger(__name__)
@@ -81,6 +93,148 @@ def parse_date(date: Union[datetime, str], var_name=None) -> datetime:
     return date
 
 
+class _StackImage(BaseImage):
+
+    def __init__(self, ee_image: ee.Image, image_props: Dict[str, Dict], band_names: List[str]):
+        """
+        A class for describing and downloading a time-series stack of collection images, where the bands of each
+        image are stacked (in collection order) into a single Earth Engine image.
+
+        Parameters
+        ----------
+        ee_image: ee.Image
+            Stacked Earth Engine image to encapsulate.
+        image_props: dict
+            Properties of the stacked images, as returned by :attr:`MaskedCollection.properties`.
+        band_names: list of str
+            Names of the source image bands included in the stack.
+        """
+        super().__init__(ee_image)
+        self._image_props = image_props
+        self._band_names = band_names
+
+    def _get_band_properties(self) -> List[Dict]:
+        """
+        Merge Earth Engine and STAC band properties for this stack.  Each band is labelled with the ID and capture
+        time of its source image.
+        """
+        stac_band_props = self._stac.band_props if self._stac else {}
+        band_props = []
+        for im_id, im_props in self._image_props.items():
+            for band_name in self._band_names:
+                band_dict = dict(stac_band_props[band_name]) if band_name in stac_band_props else {}
+                band_dict['name'] = f'{split_id(im_id)[1]}_{band_name}'
+                band_dict['system:id'] = im_id
+                band_dict['system:time_start'] = im_props['system:time_start']
+                band_props.append(band_dict)
+        return band_props
+
+
+class _LocalCompositeImage(BaseImage):
+
+    def __init__(
+        self, ee_image: ee.Image, method: CompositeMethod, band_properties: List[Dict], refl_bands: List[str] = None
+    ):
+        """
+        A class for downloading a time-series stack of collection images, and compositing it locally, tile by tile.
+
+        Parameters
+        ----------
+        ee_image: ee.Image
+            Stacked Earth Engine image to encapsulate, with the bands of each component image stacked in collection
+            order.
+        method: CompositeMethod
+            Compositing method.
+        band_properties: list of dict
+            Properties of the component image (and composite) bands.
+        refl_bands: list of str, optional
+            Names of the bands to use for finding the medoid.
+        """
+        super().__init__(ee_image)
+        self._method = CompositeMethod(method)
+        self._comp_band_properties = band_properties
+        self._band_names = [bp['name'] for bp in band_properties]
+        self._refl_bands = refl_bands
+        self._out_dtype = None
+
+    def _get_band_properties(self) -> List[Dict]:
+        """ Band properties of the composite (i.e. of a component image). """
+        return self._comp_band_properties
+
+    def _prepare_for_download(self, set_nodata: bool = True, **kwargs) -> ('BaseImage', Dict):
+        """ Prepare the stack image for tiled download, returning it with a rasterio profile for the composite. """
+        exp_image, profile = super()._prepare_for_download(set_nodata=set_nodata, **kwargs)
+        # median and mean composites are floating point, unless a dtype is specified
+        if (self._method in [CompositeMethod.median, CompositeMethod.mean]) and not kwargs.get('dtype', None):
+            self._out_dtype = 'float64'
+        else:
+            self._out_dtype = profile['dtype']
+
+        if not np.issubdtype(np.dtype(exp_image.dtype), np.floating):
+            # download the stack as floating point so that masked pixels are NaN, and are not confused with valid
+            # pixels equal to the integer nodata value (e.g. zero valued mask bands, or reflectances)
+            stack_dtype = 'float32' if np.dtype(exp_image.dtype).itemsize <= 2 else 'float64'
+            exp_image = BaseImage(self._convert_dtype(exp_image.ee_image, stack_dtype))
+        nodata = self._nodata_dict[self._out_dtype] if set_nodata else None
+        profile.update(count=len(self._band_names), dtype=self._out_dtype, nodata=nodata)
+        return exp_image, profile
+
+    def _process_tile_array(self, array: np.ndarray, exp_image: BaseImage) -> np.ndarray:
+        """ Composite a downloaded stack tile array. """
+        # convert to a 4D floating point (image, band, row, column) array (masked pixels are NaN, as the stack is
+        # downloaded as floating point)
+        stack_array = array.astype('float64').reshape(-1, len(self._band_names), *array.shape[1:])
+
+        comp_array = composite_array(stack_array, self._method, self._band_names, refl_bands=self._refl_bands)
+
+        # convert to the output data type, with nodata masked pixels
+        if np.issubdtype(np.dtype(self._out_dtype), np.integer):
+            comp_array = np.round(comp_array)
+            comp_array[np.isnan(comp_array)] = self._nodata_dict[self._out_dtype]
+        return comp_array.astype(self._out_dtype)
+
+
+class _TileCompositeImage(BaseImage):
+
+    def __init__(self, ee_image: ee.Image, ee_collection: ee.ImageCollection, method: CompositeMethod, refl_bands=None):
+        """
+        A class for downloading a composite image, where the composite of each download tile is created from only
+        those component images that intersect the tile.
+
+        Parameters
+        ----------
+        ee_image: ee.Image
+            Composite Earth Engine image of the whole ``ee_collection`` to encapsulate.
+        ee_collection: ee.ImageCollection
+            Earth Engine collection of component images, prepared for compositing.
+        method: CompositeMethod
+            Compositing method.
+        refl_bands: list of str, optional
+            Names of the bands to use for finding the medoid.
+        """
+        super().__init__(ee_image)
+        self._ee_collection = ee_collection
+        self._method = CompositeMethod(method)
+        self._refl_bands = refl_bands
+
+    def _tiles(self, exp_image: BaseImage, tile_shape: Tuple[int, int] = None) -> Iterator[Tile]:
+        """ Iterator over downloadable composite tiles, each composited from the images that intersect it. """
+        # a fully masked component image, for compositing tiles that no images intersect
+        masked_collection = self._ee_collection.limit(1).map(lambda ee_image: ee_image.updateMask(0))
+        for tile in BaseImage._tiles(exp_image, tile_shape=tile_shape):
+            tile_bounds = ee.Geometry.Rectangle(
+                list(windows.bounds(tile.window, exp_image.transform)), proj=exp_image.crs, geodesic=False
+            )
+            tile_collection = self._ee_collection.filterBounds(tile_bounds)
+            tile_collection = ee.ImageCollection(
+                ee.Algorithms.If(tile_collection.size().gt(0), tile_collection, masked_collection)
+            )
+            tile_image = MaskedCollection._composite_collection(tile_collection, self._method, self._refl_bands)
+            # clip and convert the tile composite as the export image was
+            tile_image = self._convert_dtype(tile_image.clip(exp_image.ee_image.geometry()), exp_image.dtype)
+            yield Tile(exp_image, tile.window, ee_image=tile_image)
+
+
 class MaskedCollection:
 
     def __init__(self, ee_collection: ee.ImageCollection):
@@ -103,6 +257,8 @@ class MaskedCollection:
         self._image_type = None
         self.__stac = None
         self.__stats_scale = None
+        self._shards = None
+        self._region_stats = None
 
     @classmethod
     def from_name(cls, name: str) -> 'MaskedCollection':
@@ -120,16 +276,7 @@ class MaskedCollection:
             A MaskedCollection instance.
         """
         # this is separate from __init__ for consistency with MaskedImage.from_id()
-        if (name == 'COPERNICUS/S2') or (name == 'COPERNICUS/S2_SR'):
-            # Recent images in S2_SR do not always have matching images in S2_CLOUD_PROBABILITY (which is needed for
-            # 'cloud_prob' cloud masking), so this is a special case to return a filtered S2/S2_SR collection that has
-            # matching images in S2_CLOUD_PROBABILITY.
-            cloud_prob_coll = ee.ImageCollection('COPERNICUS/S2_CLOUD_PROBABILITY')
-            s2_coll = ee.ImageCollection(name)
-            filt = ee.Filter.equals(leftField='system:index', rightField='system:index')
-            ee_collection = ee.ImageCollection(ee.Join.simple().apply(s2_coll, cloud_prob_coll, filt))
-        else:
-            ee_collection = ee.ImageCollection(name)
+        ee_collection = ee.ImageCollection(name)
         gd_collection = cls(ee_collection)
         gd_collection._name = name
         return gd_collection
@@ -196,6 +343,84 @@ class MaskedCollection:
         gd_collection._filtered = True
         return gd_collection
 
+    @classmethod
+    def from_index(
+        cls, filename: Union[str, pathlib.Path], name: str = None, start_date: Union[datetime, str] = None,
+        end_date: Union[datetime, str] = None, region: Dict = None, fill_portion: float = None,
+        cloudless_portion: float = None
+    ) -> 'MaskedCollection':
+        """
+        Create a MaskedCollection instance from images in a local search index (see :meth:`to_index`) that match the
+        given criteria.  Properties are read from the index, without querying Earth Engine.
+
+        Parameters
+        ----------
+        filename: str, pathlib.Path
+            Path of the search index file.
+        name: str, optional
+            Name of the Earth Engine collection that images should belong to.
+        start_date: datetime, str, optional
+            Start date (UTC) of the image capture times.  In '%Y-%m-%d' format if a string.
+        end_date: datetime, str, optional
+            End date (UTC) of the image capture times.  In '%Y-%m-%d' format if a string.
+        region: dict, optional
+            Geojson polygon (in WGS84) that image footprint bounds should intersect.
+        fill_portion: float, optional
+            Minimum portion (%) of filled (valid) image pixels.
+        cloudless_portion: float, optional
+            Minimum portion (%) of cloud/shadow free image pixels.
+
+        Returns
+        -------
+        MaskedCollection
+            A MaskedCollection instance.
+        """
+        start_date = parse_date(start_date, 'start_date') if start_date else None
+        end_date = parse_date(end_date, 'end_date') if end_date else None
+        with SearchIndex(filename) as index:
+            properties = index.query(
+                name=name, start_date=start_date, end_date=end_date, region=region, fill_portion=fill_portion,
+                cloudless_portion=cloudless_portion
+            )
+        if len(properties) == 0:
+            raise ValueError('There are no images in the index matching the given criteria.')
+
+        gd_collection = cls.from_list(list(properties.keys()))
+        gd_collection._properties = properties
+        return gd_collection
+
+    def to_index(self, filename: Union[str, pathlib.Path]):
+        """
+        Add the images in this collection, with their properties and footprints, to a local search index.  The index
+        can be queried with :meth:`from_index`.
+
+        Parameters
+        ----------
+        filename: str, pathlib.Path
+            Path of the search index file.  It is created if it does not exist.
+        """
+        # retrieve footprints as a list of [ID, footprint] pairs, excluding images without footprints
+        footprint_list = self._ee_collection.reduceColumns(
+            ee.Reducer.toList(2), ['system:id', 'system:footprint']
+        ).get('list').getInfo()
+        footprints = {im_id: footprint for im_id, footprint in footprint_list}
+        with SearchIndex(filename) as index:
+            index.add(self.name, self.properties, footprints=footprints)
+
+    @staticmethod
+    def _join_image_collection(
+        ee_collection: ee.ImageCollection, coll_name: Union[str, ee.ImageCollection], property_name: str,
+        outer: bool = True
+    ) -> ee.ImageCollection:
+        """
+        Join the first image in ``coll_name`` with a matching ``system:index`` to each image in ``ee_collection``,
+        storing it in the ``property_name`` image property.  If ``outer`` is False, images without a match are
+        excluded.
+        """
+        filt = ee.Filter.equals(leftField='system:index', rightField='system:index')
+        join = ee.Join.saveFirst(matchKey=property_name, outer=outer)
+        return ee.ImageCollection(join.apply(ee_collection, ee.ImageCollection(coll_name), filt))
+
     @property
     def _stac(self) -> Union[StacItem, None]:
         """ STAC info, if any.  """
@@ -246,7 +471,11 @@ class MaskedCollection:
                 '`properties` can only be retrieved for collections returned by `search()` and `from_list()`'
             )
         if not self._properties:
-            self._properties = self._get_properties(self._ee_collection)
+            if self._shards:
+                shards = [self._add_region_stats(shard) for shard in self._shards]
+                self._properties = self._get_shard_properties(shards)
+            else:
+                self._properties = self._get_properties(self._add_region_stats(self._ee_collection))
         return self._properties
 
     @property
@@ -280,23 +509,107 @@ class MaskedCollection:
             return None
         return [bname for bname, bdict in self._stac.band_props.items() if 'center_wavelength' in bdict]
 
-    def _get_properties(self, ee_collection: ee.ImageCollection) -> Dict:
-        """ Retrieve properties of images in a given Earth Engine image collection. """
+    def _add_region_stats(self, ee_collection: ee.ImageCollection) -> ee.ImageCollection:
+        """
+        Add deferred region statistics (if any) to the images in a given Earth Engine image collection, for retrieving
+        with the collection properties.
+        """
+        return ee_collection.map(self._region_stats) if self._region_stats else ee_collection
 
+    def _get_properties_page(self, ee_collection: ee.ImageCollection, offset: int, page_size: int) -> List[Dict]:
+        """ Retrieve properties of a page of images in a given Earth Engine image collection. """
         # the properties to retrieve
         prop_key_list = ee.List(list(self.schema.keys()))
+        page_list = ee_collection.toList(page_size, offset)
+        return page_list.map(lambda ee_image: ee.Image(ee_image).toDictionary(prop_key_list)).getInfo()
 
-        def aggregrate_props(ee_image, coll_list):
-            im_dict = ee_image.toDictionary(prop_key_list)
-            return ee.List(coll_list).add(im_dict)
+    def _iter_properties(
+        self, ee_collection: ee.ImageCollection, page_size: int = 100, num_threads: int = 4
+    ) -> Iterator[Tuple[str, Dict]]:
+        """
+        Iterate over (ID, properties) items of images in a given Earth Engine image collection, in collection order.
+        Properties are retrieved in pages of ``page_size`` images, with up to ``num_threads`` pages retrieved
+        concurrently.
+        """
+        # retrieve the first page on its own, as most collections will fit into it
+        page = self._get_properties_page(ee_collection, 0, page_size)
+        for prop_dict in page:
+            yield prop_dict['system:id'], prop_dict
+        if len(page) < page_size:
+            return
+
+        # retrieve the remaining pages concurrently, yielding them in order, until a partial page is found
+        offset = page_size
+        futures = deque()
+        with ThreadPoolExecutor(max_workers=num_threads) as executor:
+            try:
+                while len(page) == page_size:
+                    while len(futures) < num_threads:
+                        futures.append(executor.submit(self._get_properties_page, ee_collection, offset, page_size))
+                        offset += page_size
+                    page = futures.popleft().result()
+                    for prop_dict in page:
+                        yield prop_dict['system:id'], prop_dict
+            finally:
+                for future in futures:
+                    future.cancel()
 
-        # retrieve list of dicts of properties of images in ee_collection
-        props_list = ee.List(ee_collection.iterate(aggregrate_props, ee.List([]))).getInfo()
+    def _get_properties(self, ee_collection: ee.ImageCollection) -> Dict:
+        """ Retrieve properties of images in a given Earth Engine image collection. """
         # add image properties to the return dict in the same order as the underlying collection
-        props_dict = OrderedDict()
-        for prop_dict in props_list:
-            props_dict[prop_dict['system:id']] = prop_dict
-        return props_dict
+        return OrderedDict(self._iter_properties(ee_collection))
+
+    @staticmethod
+    def _get_id_time_properties(ee_collection: ee.ImageCollection) -> Dict:
+        """ Retrieve only the ID and capture time properties of images in a given Earth Engine image collection. """
+        prop_keys = ['system:id', 'system:time_start']
+        prop_list = ee_collection.reduceColumns(ee.Reducer.toList(2), prop_keys).get('list').getInfo()
+        return OrderedDict([(prop_vals[0], dict(zip(prop_keys, prop_vals))) for prop_vals in prop_list])
+
+    def _get_shard_properties(self, shards: List[ee.ImageCollection], num_threads: int = 4) -> Dict:
+        """
+        Retrieve properties of images in a list of Earth Engine image collections (shards) concurrently, merging
+        them in capture time order.
+        """
+        with ThreadPoolExecutor(max_workers=num_threads) as executor:
+            shard_props = list(executor.map(self._get_properties, shards))
+        prop_items = [item for props in shard_props for item in props.items()]
+        return OrderedDict(sorted(prop_items, key=lambda item: item[1]['system:time_start']))
+
+    def iter_properties(self, page_size: int = 100, num_threads: int = 4) -> Iterator[Tuple[str, Dict]]:
+        """
+        Iterate over the image properties in the collection, retrieving them from Earth Engine page by page.
+
+        This allows the properties of large collections to be processed as they are retrieved.  Once all properties
+        have been retrieved, they are stored in :attr:`properties`.
+
+        Parameters
+        ----------
+        page_size: int, optional
+            Number of images whose properties are retrieved in each Earth Engine request.
+        num_threads: int, optional
+            Maximum number of pages to retrieve concurrently.
+
+        Yields
+        ------
+        tuple(str, dict)
+            Image ID and dictionary of image properties, in collection order.
+        """
+        if not self._filtered:
+            raise UnfilteredError(
+                '`properties` can only be retrieved for collections returned by `search()` and `from_list()`'
+            )
+        if self._properties or self._shards:
+            # sharded properties are retrieved concurrently, and are only ordered once all are retrieved
+            yield from self.properties.items()
+            return
+
+        properties = OrderedDict()
+        ee_collection = self._add_region_stats(self._ee_collection)
+        for im_id, prop_dict in self._iter_properties(ee_collection, page_size, num_threads):
+            properties[im_id] = prop_dict
+            yield im_id, prop_dict
+        self._properties = properties
 
     def _get_properties_table(self, properties: Dict, schema: Dict = None) -> str:
         """
@@ -344,6 +657,9 @@ class MaskedCollection:
                 f'{cloud_coll_str} collections only.'
             )
 
+        # cloud distance is only needed for q-mosaic compositing (unless it is requested)
+        kwargs['cloud_dist'] = kwargs.get('cloud_dist', False) or (method == CompositeMethod.q_mosaic)
+
         def prepare_image(ee_image: ee.Image):
             """ Prepare an Earth Engine image for use in compositing. """
             if date and (method in [CompositeMethod.mosaic, CompositeMethod.q_mosaic]):
@@ -374,9 +690,25 @@ class MaskedCollection:
 
         return ee_collection
 
+    @staticmethod
+    def _split_dates(start_date: datetime, end_date: datetime, split_days: float) -> List[Tuple[datetime, datetime]]:
+        """
+        Split a date range into consecutive (start, end) intervals of ``split_days`` days, where the last interval
+        ends at ``end_date``.
+        """
+        intervals = []
+        interval_start = start_date
+        while interval_start < end_date:
+            interval_end = min(interval_start + timedelta(days=split_days), end_date)
+            intervals.append((interval_start, interval_end))
+            interval_start = interval_end
+        return intervals
+
     def search(
         self, start_date: Union[datetime, str], end_date: Union[datetime, str], region: dict,
-        fill_portion: float = None, cloudless_portion: float = None, **kwargs
+        fill_portion: float = None, cloudless_portion: float = None, split_days: int = None,
+        prefilter_margin: float = None, stats_scale: float = None, stats_tolerance: float = None,
+        incremental: bool = False, **kwargs
     ) -> 'MaskedCollection':
         """
         Search for images based on date, region and filled/cloudless portion criteria.
@@ -394,6 +726,31 @@ class MaskedCollection:
             Minimum portion (%) of filled (valid) image pixels.
         cloudless_portion: float, optional
             Minimum portion (%) of cloud/shadow free image pixels.
+        split_days: int, optional
+            Split the search date range into intervals of this many days, whose search results are retrieved
+            concurrently, and merged in capture date order.  Useful for speeding up searches over long date ranges.
+            If None, the date range is searched in one request (the default).
+        prefilter_margin: float, optional
+            Before finding region statistics, exclude images whose granule cloud cover (%) is greater than
+            ``100 - cloudless_portion + prefilter_margin``.  This avoids finding region statistics for images that are
+            unlikely to meet the ``cloudless_portion`` threshold.  As granule and region cloud cover can differ,
+            ``prefilter_margin`` should allow for this difference.  Valid for cloud/shadow maskable collections, when
+            ``cloudless_portion`` is specified.  If None, no pre-filtering is done (the default).
+        stats_scale: float, optional
+            Scale (m) at which to find the filled and cloudless portions of the search region.  A coarse scale
+            speeds up searches of large regions, at the cost of accuracy.  If None, portions are found at the nominal
+            scale of the collection (the default).
+        stats_tolerance: float, optional
+            Re-find the filled and cloudless portions at the nominal collection scale for images whose ``stats_scale``
+            portions are within this tolerance (%) of the ``fill_portion`` or ``cloudless_portion`` thresholds.
+            Valid when ``stats_scale`` and a portion threshold are specified.  If None, no re-finding is done (the
+            default).
+        incremental: bool, optional
+            Store the search results in a local cache, and only search for images captured after the latest cached
+            image on subsequent searches with the same collection, region and parameters.  Cached and new results are
+            merged.  Useful for repeated (e.g. monitoring) searches.  Note that images ingested into Earth Engine
+            after later images were cached, are not found.  The cache location can be set with the `GEEDIM_CACHE_DIR`
+            environment variable.
         **kwargs
             Optional cloud/shadow masking parameters - see :meth:`geedim.mask.MaskedImage.__init__` for details.
 
@@ -413,27 +770,175 @@ class MaskedCollection:
         if end_date <= start_date:
             raise ValueError('`end_date` must be at least a day later than `start_date`')
 
+        if incremental:
+            return self._search_incremental(
+                start_date, end_date, region, fill_portion=fill_portion, cloudless_portion=cloudless_portion,
+                split_days=split_days, prefilter_margin=prefilter_margin, stats_scale=stats_scale,
+                stats_tolerance=stats_tolerance, **kwargs
+            )
+
+        # cloud distance is not needed for region statistics
+        kwargs['cloud_dist'] = False
+        # find region statistics only when they are needed for filtering, otherwise defer them until properties are
+        # retrieved
+        filter_stats = bool(fill_portion or cloudless_portion)
+
+        thresholds = dict(FILL_PORTION=fill_portion, CLOUDLESS_PORTION=cloudless_portion)
+        thresholds = {key: value for key, value in thresholds.items() if value}
+
         def set_region_stats(ee_image: ee.Image):
             """ Find filled and cloud/shadow free portions inside the search region for a given image.  """
             gd_image = self.image_type(ee_image, **kwargs)
-            gd_image._set_region_stats(region, scale=self._stats_scale)
-            return gd_image.ee_image
-
-        # filter the image collection, finding cloud/shadow masks and region stats
-        ee_collection = self._ee_collection.filterDate(start_date, end_date).filterBounds(region).map(set_region_stats)
-        if fill_portion:
-            ee_collection = ee_collection.filter(ee.Filter.gte('FILL_PORTION', fill_portion))
-        if cloudless_portion and self.image_type != MaskedImage:
-            ee_collection = ee_collection.filter(ee.Filter.gte('CLOUDLESS_PORTION', cloudless_portion))
-        ee_collection = ee_collection.sort('system:time_start')
+            gd_image._set_region_stats(region, scale=stats_scale or self._stats_scale)
+            if not (stats_scale and stats_tolerance and thresholds):
+                return gd_image.ee_image
+
+            # re-find portions at the nominal scale if any of the stats_scale portions are near their thresholds
+            near_thresh = ee.Number(0)
+            for key, value in thresholds.items():
+                near_thresh = near_thresh.Or(
+                    ee.Number(gd_image.ee_image.get(key)).subtract(value).abs().lte(stats_tolerance)
+                )
+            refine_image = self.image_type(ee_image, **kwargs)
+            refine_image._set_region_stats(region, scale=self._stats_scale)
+            return ee.Image(ee.Algorithms.If(near_thresh, refine_image.ee_image, gd_image.ee_image))
+
+        def search_interval(interval_start: datetime, interval_end: datetime) -> ee.ImageCollection:
+            """ Search the image collection between the given dates. """
+            # filter the image collection, finding cloud/shadow masks and region stats
+            ee_collection = self._ee_collection.filterDate(interval_start, interval_end).filterBounds(region)
+            if issubclass(self.image_type, Sentinel2ClImage):
+                # join matching cloud probability images, for finding cloud masks, once here rather than image by
+                # image.  Recent images in S2/S2_SR do not always have matching images in S2_CLOUD_PROBABILITY (which
+                # is needed for 'cloud_prob' cloud masking), so these collections are also filtered to those images
+                # with matches.
+                cloud_prob_collection = ee.ImageCollection('COPERNICUS/S2_CLOUD_PROBABILITY')
+                cloud_prob_collection = cloud_prob_collection.filterDate(interval_start, interval_end)
+                cloud_prob_collection = cloud_prob_collection.filterBounds(region)
+                ee_collection = self._join_image_collection(
+                    ee_collection, cloud_prob_collection, Sentinel2ClImage._cloud_prob_property,
+                    outer=self.name not in ['COPERNICUS/S2', 'COPERNICUS/S2_SR']
+                )
+            if issubclass(self.image_type, Sentinel2SrClImage) and (kwargs.get('cdi_thresh', None) is not None):
+                # join matching TOA images, for finding CDI cloud masks, once here rather than image by image
+                toa_collection = ee.ImageCollection('COPERNICUS/S2').filterDate(interval_start, interval_end)
+                toa_collection = toa_collection.filterBounds(region)
+                ee_collection = self._join_image_collection(
+                    ee_collection, toa_collection, Sentinel2ClImage._toa_property
+                )
+            if cloudless_portion and (prefilter_margin is not None) and self.image_type._cloud_cover_property:
+                # exclude images with too much granule cloud cover before finding (expensive) region stats,
+                # retaining any images without granule cloud cover
+                cover_property = self.image_type._cloud_cover_property
+                max_cover = 100 - cloudless_portion + prefilter_margin
+                ee_collection = ee_collection.filter(
+                    ee.Filter.Or(ee.Filter.lte(cover_property, max_cover), ee.Filter.notNull([cover_property]).Not())
+                )
+            if filter_stats:
+                ee_collection = ee_collection.map(set_region_stats)
+            if fill_portion:
+                ee_collection = ee_collection.filter(ee.Filter.gte('FILL_PORTION', fill_portion))
+            if cloudless_portion and self.image_type != MaskedImage:
+                ee_collection = ee_collection.filter(ee.Filter.gte('CLOUDLESS_PORTION', cloudless_portion))
+            return ee_collection.sort('system:time_start')
+
+        if split_days:
+            # search date intervals (shards) separately, so that their properties can be retrieved concurrently
+            shards = [search_interval(*interval) for interval in self._split_dates(start_date, end_date, split_days)]
+            ee_collection = reduce(lambda coll1, coll2: coll1.merge(coll2), shards).sort('system:time_start')
+        else:
+            shards = None
+            ee_collection = search_interval(start_date, end_date)
 
         # return a new MaskedCollection containing the filtered EE collection (the EE collection
         # wrapped by MaskedCollection remains fixed)
         gd_collection = MaskedCollection(ee_collection)
         gd_collection._name = self._name
         gd_collection._filtered = True
+        gd_collection._shards = shards
+        gd_collection._region_stats = None if filter_stats else set_region_stats
         return gd_collection
 
+    def _search_incremental(
+        self, start_date: datetime, end_date: datetime, region: dict, **kwargs
+    ) -> 'MaskedCollection':
+        """
+        Search for images, re-using cached results from previous searches with the same collection, region and
+        parameters, and searching only for images captured after the latest cached image.  See :meth:`search` for
+        parameter details.
+        """
+
+        def timestamp(date: datetime) -> float:
+            # note that we must specify the timezone as utc, otherwise .timestamp() assumes local time.
+            return date.replace(tzinfo=timezone.utc).timestamp() * 1000
+
+        # read cached results for the collection, region and search parameters (split_days does not affect results)
+        key_dict = dict(name=self.name, region=region, **{k: v for k, v in kwargs.items() if k != 'split_days'})
+        key = hashlib.sha1(json.dumps(key_dict, sort_keys=True, default=str).encode()).hexdigest()
+        cache_file = cache_dir().joinpath('search', f'{key}.json')
+        cache = json.loads(cache_file.read_text()) if cache_file.exists() else None
+        if not cache or (cache['start'] > timestamp(start_date)) or (cache['watermark'] is None):
+            # the cache does not exist or does not cover start_date
+            cache = dict(start=timestamp(start_date), watermark=None, properties={})
+            search_start = start_date
+        else:
+            # search from just after the latest cached image
+            watermark_date = datetime.utcfromtimestamp((cache['watermark'] + 1) / 1000)
+            search_start = max(start_date, watermark_date)
+
+        new_props = {}
+        if search_start < end_date:
+            logger.debug(f'Searching from {search_start} to {end_date}.')
+            new_props = self.search(search_start, end_date, region, **kwargs).properties
+
+        # update the cache
+        cache['properties'].update(new_props)
+        if len(new_props) > 0:
+            new_watermark = max([prop_dict['system:time_start'] for prop_dict in new_props.values()])
+            cache['watermark'] = max(cache['watermark'] or new_watermark, new_watermark)
+        cache_file.parent.mkdir(parents=True, exist_ok=True)
+        tmp_file = cache_file.with_suffix(f'.{os.getpid()}.{threading.get_ident()}.tmp')
+        tmp_file.write_text(json.dumps(cache))
+        os.replace(tmp_file, cache_file)
+
+        # merge cached and new results inside the search dates, and return a collection containing them
+        prop_items = [
+            item for item in cache['properties'].items()
+            if timestamp(start_date) <= item[1]['system:time_start'] < timestamp(end_date)
+        ]
+        properties = OrderedDict(sorted(prop_items, key=lambda item: item[1]['system:time_start']))
+        indexes = [split_id(im_id)[1] for im_id in properties.keys()]
+        ee_collection = self._ee_collection.filter(ee.Filter.inList('system:index', indexes))
+
+        gd_collection = MaskedCollection(ee_collection.sort('system:time_start'))
+        gd_collection._name = self._name
+        gd_collection._filtered = True
+        gd_collection._properties = properties
+        return gd_collection
+
+    @staticmethod
+    def _composite_collection(
+        ee_collection: ee.ImageCollection, method: CompositeMethod, refl_bands: List[str] = None
+    ) -> ee.Image:
+        """ Composite a prepared Earth Engine collection with the given method. """
+        if method == CompositeMethod.q_mosaic:
+            comp_image = ee_collection.qualityMosaic('CLOUD_DIST')
+        elif method == CompositeMethod.mosaic:
+            comp_image = ee_collection.mosaic()
+        elif method == CompositeMethod.median:
+            comp_image = ee_collection.median()
+        elif method == CompositeMethod.medoid:
+            comp_image = medoid.medoid(ee_collection, bands=refl_bands)
+        elif method == CompositeMethod.array_medoid:
+            comp_image = medoid.array_medoid(ee_collection, bands=refl_bands)
+        elif method == CompositeMethod.mode:
+            comp_image = ee_collection.mode()
+        elif method == CompositeMethod.mean:
+            comp_image = ee_collection.mean()
+        else:
+            raise ValueError(f'Unsupported composite method: {method}')
+        return comp_image
+
     def composite(
         self, method: Union[CompositeMethod, str] = None, mask: bool = True,
         resampling: Union[ResamplingMethod, str] = None, date: Union[datetime, str] = None, region: dict = None,
@@ -465,6 +970,8 @@ class MaskedCollection:
             ``region`` are not specified, collection images are sorted by their capture date.
         **kwargs
             Optional cloud/shadow masking parameters - see :meth:`geedim.mask.MaskedImage.__init__` for details.
+            Unlike images, composites include the CLOUD_DIST band only when ``cloud_dist=True`` is specified, or
+            ``method`` is `q-mosaic`.
 
         Returns
         -------
@@ -486,25 +993,21 @@ class MaskedCollection:
         ee_collection = self._prepare_for_composite(
             method=method, mask=mask, resampling=resampling, date=date, region=region, **kwargs
         )
+        return self._composite_prepared(ee_collection, method, date=date)
 
-        if method == CompositeMethod.q_mosaic:
-            comp_image = ee_collection.qualityMosaic('CLOUD_DIST')
-        elif method == CompositeMethod.mosaic:
-            comp_image = ee_collection.mosaic()
-        elif method == CompositeMethod.median:
-            comp_image = ee_collection.median()
-        elif method == CompositeMethod.medoid:
-            # limit medoid to surface reflectance bands
-            comp_image = medoid.medoid(ee_collection, bands=self.refl_bands)
-        elif method == CompositeMethod.mode:
-            comp_image = ee_collection.mode()
-        elif method == CompositeMethod.mean:
-            comp_image = ee_collection.mean()
-        else:
-            raise ValueError(f'Unsupported composite method: {method}')
+    def _composite_prepared(
+        self, ee_collection: ee.ImageCollection, method: CompositeMethod, date: datetime = None
+    ) -> MaskedImage:
+        """
+        Composite an Earth Engine collection prepared with :meth:`_prepare_for_composite`, and populate the composite
+        metadata.  See :meth:`composite` for parameter descriptions.
+        """
+        # limit medoid to surface reflectance bands
+        comp_image = self._composite_collection(ee_collection, method, refl_bands=self.refl_bands)
 
-        # populate composite image metadata with info on component images
-        props = self._get_properties(ee_collection)
+        # populate composite image metadata with info on component images, re-using any cached properties, and
+        # otherwise retrieving only IDs and capture times
+        props = self._properties if self._properties else self._get_id_time_properties(self._ee_collection)
         if len(props) == 0:
             raise ValueError('The collection is empty.')
         props_str = self._get_properties_table(props)
@@ -530,3 +1033,249 @@ class MaskedCollection:
         gd_comp_image = self.image_type(comp_image)
         gd_comp_image._id = comp_id  # avoid getInfo() for id property
         return gd_comp_image
+
+    def download_stack(
+        self, filename: Union[pathlib.Path, str], region: Dict = None, bands: List[str] = None, mask: bool = True,
+        crs: str = None, scale: float = None, resampling: Union[ResamplingMethod, str] = None, dtype: str = None,
+        scale_offset: bool = False, overwrite: bool = False, num_threads: int = None, **kwargs
+    ):
+        """
+        Download the encapsulated images as a time-series stack in a single GeoTIFF file.
+
+        Images are stacked in collection order, and aligned to a common grid, so that each is downloaded through the
+        same tiled pipeline, and with a single preparation of the export image.  File bands are named
+        ``<system:index>_<band name>``, where ``<system:index>`` is the source image ID without its collection name
+        (e.g. `LC08_172083_20220104_SR_B4`), and the ID and capture time of the source image are written to the
+        metadata of each band.
+
+        Parameters
+        ----------
+        filename: pathlib.Path, str
+            Name of the destination file.
+        region : dict, ee.Geometry, optional
+            Region defined by geojson polygon in WGS84.  Should be specified unless the stack has a footprint.
+        bands: list of str, optional
+            Names of the image bands to include in the stack.  Defaults to all bands.
+        mask: bool, optional
+            Whether to apply the cloud/shadow mask; or fill (valid pixel) mask, in the case of images without
+            support for cloud/shadow masking.
+        crs : str, optional
+            Reproject images to this EPSG or WKT CRS.  Defaults to the CRS of the minimum scale band of the first
+            image.
+        scale : float, optional
+            Resample images to this pixel scale (size) (m).  Defaults to the minimum scale of the first image bands.
+        resampling : ResamplingMethod, str, optional
+            Resampling method - see :class:`~geedim.enums.ResamplingMethod` for available options.
+        dtype: str, optional
+            Convert to this data type (`uint8`, `int8`, `uint16`, `int16`, `uint32`, `int32`, `float32`
+            or `float64`).  Defaults to auto select a minimum size type that can represent the range of pixel values.
+        scale_offset: bool, optional
+            Whether to apply any EE band scales and offsets to the images.
+        overwrite : bool, optional
+            Overwrite the destination file if it exists.
+        num_threads: int, optional
+            Number of tiles to download concurrently.  Defaults to a sensible auto value.
+        **kwargs
+            Optional cloud/shadow masking parameters - see :meth:`geedim.mask.MaskedImage.__init__` for details.
+        """
+        if not self._filtered:
+            raise UnfilteredError(
+                'Stacks can only be downloaded from collections returned by `search()` and `from_list()`'
+            )
+
+        props = self.properties
+        if len(props) == 0:
+            raise ValueError('The collection is empty.')
+
+        def prepare_image(ee_image: ee.Image):
+            """ Prepare an Earth Engine image for stacking. """
+            gd_image = self.image_type(ee_image, **kwargs)
+            if mask:
+                gd_image.mask_clouds()
+            return gd_image.ee_image.select(bands) if bands else gd_image.ee_image
+
+        ee_collection = self._ee_collection.map(prepare_image)
+        band_names = bands or ee_collection.first().bandNames().getInfo()
+
+        # stack the images into a single image with unique, known band names
+        stack_band_names = [f'{split_id(im_id)[1]}_{band_name}' for im_id in props for band_name in band_names]
+        stack_image = ee_collection.toBands().rename(stack_band_names)
+
+        # populate stack image metadata with info on component images
+        dates = [datetime.utcfromtimestamp(item['system:time_start'] / 1000) for item in props.values()]
+        start_date = min(dates).strftime('%Y_%m_%d')
+        end_date = max(dates).strftime('%Y_%m_%d')
+        stack_id = f'{self.name}/{start_date}-{end_date}-STACK'
+        timestamp = min(dates).replace(tzinfo=timezone.utc).timestamp() * 1000
+        stack_image = stack_image.set(
+            {
+                'STACK_IMAGES': 'TABLE:\n' + self._get_properties_table(props),
+                'system:id': stack_id,
+                'system:time_start': timestamp
+            }
+        )
+
+        gd_stack_image = _StackImage(stack_image, props, band_names)
+        gd_stack_image._id = stack_id  # avoid getInfo() for id property
+        resampling = resampling or BaseImage._default_resampling
+        gd_stack_image.download(
+            filename, overwrite=overwrite, num_threads=num_threads, region=region, crs=crs, scale=scale,
+            resampling=resampling, dtype=dtype, scale_offset=scale_offset
+        )
+
+    def local_composite(
+        self, filename: Union[pathlib.Path, str], method: Union[CompositeMethod, str] = None, mask: bool = True,
+        resampling: Union[ResamplingMethod, str] = None, date: Union[datetime, str] = None, region: Dict = None,
+        crs: str = None, scale: float = None, dtype: str = None, overwrite: bool = False, num_threads: int = None,
+        **kwargs
+    ):
+        """
+        Create a composite image locally, and write it to a GeoTIFF file.
+
+        The masked component images are downloaded as a stack, tile by tile, and each tile is composited with numpy
+        on the local machine.  This avoids Earth Engine memory and time limits for large composites, especially with
+        the `medoid` and `median` methods.  Memory usage is bounded by the tile size and ``num_threads``.
+
+        Parameters
+        ----------
+        filename: pathlib.Path, str
+            Name of the destination file.
+        method: CompositeMethod, str, optional
+            Method for finding each composite pixel from the stack of corresponding input image pixels. See
+            :class:`~geedim.enums.CompositeMethod` for available options.  By default, `q-mosaic` is used for
+            cloud/shadow mask supported collections, `mosaic` otherwise.
+        mask: bool, optional
+            Whether to apply the cloud/shadow mask; or fill (valid pixel) mask, in the case of images without
+            support for cloud/shadow masking.
+        resampling: ResamplingMethod, str, optional
+            Resampling method to use on collection images prior to compositing.  If None, `near` resampling is used
+            (the default).  See :class:`~geedim.enums.ResamplingMethod` for available options.
+        date: datetime, str, optional
+            Sort collection images by their absolute difference in capture time from this date.  Valid for the
+            `q-mosaic` and `mosaic` ``method`` only.  If None, collection images are sorted by their capture date (the
+            default).
+        region : dict, ee.Geometry
+            Region to composite, defined by a geojson polygon in WGS84.
+        crs : str, optional
+            Reproject images to this EPSG or WKT CRS.  Defaults to the CRS of the minimum scale band of the first
+            image.
+        scale : float, optional
+            Resample images to this pixel scale (size) (m).  Defaults to the minimum scale of the first image bands.
+        dtype: str, optional
+            Convert to this data type (`uint8`, `int8`, `uint16`, `int16`, `uint32`, `int32`, `float32`
+            or `float64`).  Defaults to the component image data type for the `q-mosaic`, `mosaic`, `medoid`,
+            `array-medoid` and `mode` methods, and to `float64` for the `median` and `mean` methods.
+        overwrite : bool, optional
+            Overwrite the destination file if it exists.
+        num_threads: int, optional
+            Number of tiles to download and composite concurrently.  Defaults to the number of CPUs.
+        **kwargs
+            Optional cloud/shadow masking parameters - see :meth:`geedim.mask.MaskedImage.__init__` for details.
+            Unlike images, composites include the CLOUD_DIST band only when ``cloud_dist=True`` is specified, or
+            ``method`` is `q-mosaic`.
+        """
+        if method is None:
+            method = CompositeMethod.mosaic if self.image_type == MaskedImage else CompositeMethod.q_mosaic
+        method = CompositeMethod(method)
+
+        # mask, sort & resample the EE collection
+        ee_collection = self._prepare_for_composite(
+            method=method, mask=mask, resampling=resampling, date=date, **kwargs
+        )
+        props = self._properties if self._properties else self._get_id_time_properties(self._ee_collection)
+        if len(props) == 0:
+            raise ValueError('The collection is empty.')
+        band_properties = BaseImage(ee.Image(ee_collection.first())).band_properties
+
+        # populate composite image metadata with info on component images
+        dates = [datetime.utcfromtimestamp(item['system:time_start'] / 1000) for item in props.values()]
+        start_date = min(dates).strftime('%Y_%m_%d')
+        end_date = max(dates).strftime('%Y_%m_%d')
+        comp_id = f'{self.name}/{start_date}-{end_date}-{method.value.upper()}-COMP'
+        timestamp = min(dates).replace(tzinfo=timezone.utc).timestamp() * 1000
+        stack_image = ee_collection.toBands().set(
+            {
+                'INPUT_IMAGES': 'TABLE:\n' + self._get_properties_table(props),
+                'system:id': comp_id,
+                'system:time_start': timestamp
+            }
+        )
+
+        gd_comp_image = _LocalCompositeImage(stack_image, method, band_properties, refl_bands=self.refl_bands)
+        gd_comp_image._id = comp_id  # avoid getInfo() for id property
+        gd_comp_image.download(
+            filename, overwrite=overwrite, num_threads=num_threads or os.cpu_count(), region=region, crs=crs,
+            scale=scale, dtype=dtype
+        )
+
+    def download_composite(
+        self, filename: Union[pathlib.Path, str], method: Union[CompositeMethod, str] = None, mask: bool = True,
+        resampling: Union[ResamplingMethod, str] = None, date: Union[datetime, str] = None, region: Dict = None,
+        crs: str = None, scale: float = None, dtype: str = None, overwrite: bool = False, num_threads: int = None,
+        **kwargs
+    ):
+        """
+        Create a composite image and download it to a GeoTIFF file, compositing each download tile from only those
+        component images that intersect it.
+
+        This reduces the Earth Engine computation per tile for large composites of many images, compared to
+        downloading the image returned by :meth:`composite`.
+
+        Parameters
+        ----------
+        filename: pathlib.Path, str
+            Name of the destination file.
+        method: CompositeMethod, str, optional
+            Method for finding each composite pixel from the stack of corresponding input image pixels. See
+            :class:`~geedim.enums.CompositeMethod` for available options.  By default, `q-mosaic` is used for
+            cloud/shadow mask supported collections, `mosaic` otherwise.
+        mask: bool, optional
+            Whether to apply the cloud/shadow mask; or fill (valid pixel) mask, in the case of images without
+            support for cloud/shadow masking.
+        resampling: ResamplingMethod, str, optional
+            Resampling method to use on collection images prior to compositing.  If None, `near` resampling is used
+            (the default).  See :class:`~geedim.enums.ResamplingMethod` for available options.
+        date: datetime, str, optional
+            Sort collection images by their absolute difference in capture time from this date.  Valid for the
+            `q-mosaic` and `mosaic` ``method`` only.  If None, collection images are sorted by their capture date (the
+            default).
+        region : dict, ee.Geometry
+            Region to download, defined by a geojson polygon in WGS84.  Required.
+        crs : str
+            EPSG or WKT CRS to download the composite in.  Required.
+        scale : float
+            Pixel scale (size) (m) to download the composite at.  Required.
+        dtype: str, optional
+            Convert to this data type (`uint8`, `int8`, `uint16`, `int16`, `uint32`, `int32`, `float32`
+            or `float64`).  Defaults to auto select a minimum size type that can represent the range of pixel values.
+        overwrite : bool, optional
+            Overwrite the destination file if it exists.
+        num_threads: int, optional
+            Number of tiles to download concurrently.  Defaults to a sensible auto value.
+        **kwargs
+            Optional cloud/shadow masking parameters - see :meth:`geedim.mask.MaskedImage.__init__` for details.
+            Unlike images, composites include the CLOUD_DIST band only when ``cloud_dist=True`` is specified, or
+            ``method`` is `q-mosaic`.
+        """
+        if not region or not crs or not scale:
+            raise ValueError('`region`, `crs` and `scale` are required to download a tiled composite.')
+
+        if method is None:
+            method = CompositeMethod.mosaic if self.image_type == MaskedImage else CompositeMethod.q_mosaic
+        method = CompositeMethod(method)
+        date = parse_date(date, 'date')
+
+        # prepare the collection for compositing tiles, and create the composite of the whole collection for the
+        # download metadata and grid
+        ee_collection = self._prepare_for_composite(
+            method=method, mask=mask, resampling=resampling, date=date, **kwargs
+        )
+        gd_comp_image = self._composite_prepared(ee_collection, method, date=date)
+
+        gd_tile_comp_image = _TileCompositeImage(
+            gd_comp_image.ee_image, ee_collection, method, refl_bands=self.refl_bands
+        )
+        gd_tile_comp_image._id = gd_comp_image.id  # avoid getInfo() for id property
+        gd_tile_comp_image.download(
+            filename, overwrite=overwrite, num_threads=num_threads, region=region, crs=crs, scale=scale, dtype=dtype
+        )
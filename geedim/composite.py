@@ -0,0 +1,144 @@
+"""
+    Copyright 2021 Dugal Harris - dugalh@gmail.com
+
+    Licensed under the Apache License, Version 2.0 (the "License");
+    you may not use this file except in compliance with the License.
+    You may obtain a copy of the License at
+
+       http://www.apache.org/licenses/LICENSE-2.0
+
+    Unless required by applicable law or agreed to in writing, software
+    distributed under the License is distributed on an "AS IS" BASIS,
+    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+    See the License for the specific language governing permissions and
+    limitations under the License.
+"""
+"""
+    Client-side (numpy) equivalents of the Earth Engine compositing methods.  Functions operate on 4D stack arrays
+    with dimensions (image, band, row, column), where masked pixels are NaN, and return 3D (band, row, column) composite
+    arrays.  As with Earth Engine, images later in the stack take priority in the `mosaic` and `q-mosaic` methods.
+"""
+import warnings
+from typing import List, Union
+
+import numpy as np
+from geedim.enums import CompositeMethod
+
+
+def _select(array: np.ndarray, index: np.ndarray) -> np.ndarray:
+    """ Select the stack pixels at the (row, column) image ``index`` from all bands of a stack ``array``. """
+    index = np.broadcast_to(index[np.newaxis, np.newaxis], (1, *array.shape[1:]))
+    return np.take_along_axis(array, index, axis=0)[0]
+
+
+def mosaic(array: np.ndarray) -> np.ndarray:
+    """ Composite with the last unmasked pixel in the stack, for each band. """
+    valid = ~np.isnan(array)
+    # index of the last valid pixel along the image axis (or the last pixel if there are none)
+    last_index = array.shape[0] - 1 - np.argmax(valid[::-1], axis=0)
+    return np.take_along_axis(array, last_index[np.newaxis], axis=0)[0]
+
+
+def q_mosaic(array: np.ndarray, cloud_dist_index: int) -> np.ndarray:
+    """ Composite with the unmasked pixel having the highest cloud distance, preferring pixels later in the stack. """
+    cloud_dist = array[:, cloud_dist_index]
+    cloud_dist = np.where(np.isnan(cloud_dist), -np.inf, cloud_dist)
+    max_index = array.shape[0] - 1 - np.argmax(cloud_dist[::-1], axis=0)
+    return _select(array, max_index)
+
+
+def median(array: np.ndarray) -> np.ndarray:
+    """ Composite with the median of the unmasked pixels. """
+    with warnings.catch_warnings():
+        # suppress all-NaN slice warnings
+        warnings.simplefilter('ignore', category=RuntimeWarning)
+        return np.nanmedian(array, axis=0)
+
+
+def mean(array: np.ndarray) -> np.ndarray:
+    """ Composite with the mean of the unmasked pixels. """
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore', category=RuntimeWarning)
+        return np.nanmean(array, axis=0)
+
+
+def mode(array: np.ndarray) -> np.ndarray:
+    """ Composite with the mode of the unmasked pixels.  Where there is more than one mode, the smallest is used. """
+    # sort the stack so that equal values are adjacent (NaNs sort to the end, and are never equal)
+    sort_array = np.sort(array, axis=0)
+    run_start = np.ones(sort_array.shape, dtype=bool)
+    run_start[1:] = sort_array[1:] != sort_array[:-1]
+
+    # find the length of each run of equal values, at each position in the sorted stack
+    index = np.arange(sort_array.shape[0]).reshape(-1, *([1] * (sort_array.ndim - 1)))
+    start_index = np.maximum.accumulate(np.where(run_start, index, 0), axis=0)
+    run_length = index - start_index + 1
+    return np.take_along_axis(sort_array, np.argmax(run_length, axis=0)[np.newaxis], axis=0)[0]
+
+
+def medoid(
+    array: np.ndarray, band_index: Union[List[int], np.ndarray] = None, discard_zeros: bool = True
+) -> np.ndarray:
+    """
+    Composite with the medoid of the unmasked pixels i.e. the pixel with the minimum sum of euclidean distances (across
+    ``band_index`` bands) to the other unmasked pixels.  Band values of zero are ignored in the distance between two
+    pixels if ``discard_zeros`` is True.  Equivalent to :func:`geedim.medoid.medoid`.
+    """
+    band_index = np.arange(array.shape[1]) if band_index is None else band_index
+    valid = ~np.any(np.isnan(array), axis=1)
+    # replace values <= 0 with 0 for finding distances (as in geedim.medoid.euclideanDistance()), and ignore masked
+    # pixels
+    dist_array = np.nan_to_num(array[:, band_index], nan=0).clip(min=0)
+
+    # find distance sums one image at a time, to limit memory usage
+    sum_dist = np.zeros(valid.shape)
+    for i in range(array.shape[0]):
+        diff = dist_array - dist_array[i]
+        if discard_zeros:
+            diff[(dist_array == 0) | (dist_array[i] == 0)] = 0
+        dist = np.sqrt(np.sum(diff**2, axis=1))
+        sum_dist[i] = np.sum(np.where(valid, dist, 0), axis=0)
+    sum_dist[~valid] = np.inf
+    return _select(array, np.argmin(sum_dist, axis=0))
+
+
+def composite_array(
+    array: np.ndarray, method: Union[CompositeMethod, str], band_names: List[str], refl_bands: List[str] = None
+) -> np.ndarray:
+    """
+    Composite a stack array with the given method.
+
+    Parameters
+    ----------
+    array: numpy.ndarray
+        4D stack array with dimensions (image, band, row, column), where masked pixels are NaN.
+    method: CompositeMethod, str
+        Compositing method.  See :class:`~geedim.enums.CompositeMethod` for available options.
+    band_names: list of str
+        Names of the ``array`` bands.
+    refl_bands: list of str, optional
+        Names of the bands to use for finding the medoid.  If None, all bands are used.
+
+    Returns
+    -------
+    numpy.ndarray
+        3D composite array with dimensions (band, row, column).
+    """
+    method = CompositeMethod(method)
+    if method == CompositeMethod.q_mosaic:
+        if 'CLOUD_DIST' not in band_names:
+            raise ValueError('The `q-mosaic` method requires a CLOUD_DIST band.')
+        return q_mosaic(array, band_names.index('CLOUD_DIST'))
+    elif method == CompositeMethod.mosaic:
+        return mosaic(array)
+    elif method == CompositeMethod.median:
+        return median(array)
+    elif method in [CompositeMethod.medoid, CompositeMethod.array_medoid]:
+        band_index = [band_names.index(bn) for bn in refl_bands] if refl_bands else None
+        return medoid(array, band_index=band_index)
+    elif method == CompositeMethod.mode:
+        return mode(array)
+    elif method == CompositeMethod.mean:
+        return mean(array)
+    else:
+        raise ValueError(f'Unsupported composite method: {method}')
@@ -47,6 +47,22 @@ class BaseImage:
     _float_nodata = float('nan')
     _desc_width = 70
     _default_resampling = ResamplingMethod.near
+    # scale factor, maximum pixels, and relative range margin for estimating pixel value ranges in
+    # _get_data_min_dtype()
+    _data_dtype_scale_factor = 4
+    _data_dtype_max_pixels = 1e6
+    _data_dtype_margin = 0.1
+    # see float nodata workaround note in Tile.download(...)
+    _nodata_dict = dict(
+        float32=_float_nodata,
+        float64=_float_nodata,
+        uint8=0,
+        int8=np.iinfo('int8').min,
+        uint16=0,
+        int16=np.iinfo('int16').min,
+        uint32=0,
+        int32=np.iinfo('int32').min
+    )  # yapf: disable
 
     def __init__(self, ee_image: ee.Image):
         """
@@ -66,6 +82,7 @@ class BaseImage:
         self._id = None
         self.__min_projection = None
         self._min_dtype = None
+        self.__ee_info_lock = threading.Lock()
 
     @classmethod
     def from_id(cls, image_id: str) -> 'BaseImage':
@@ -91,7 +108,10 @@ class BaseImage:
     def _ee_info(self) -> Dict:
         """ Earth Engine image metadata. """
         if self.__ee_info is None:
-            self.__ee_info = self._ee_image.getInfo()
+            # retrieve the metadata once only, when it is requested from concurrent threads
+            with self.__ee_info_lock:
+                if self.__ee_info is None:
+                    self.__ee_info = self._ee_image.getInfo()
         return self.__ee_info
 
     @property
@@ -247,16 +267,58 @@ class BaseImage:
                 dtype_min = min(0, int(dtype_minmax[:, 0].min()))  # minimum image pixel value
                 dtype_max = max(0, int(dtype_minmax[:, 1].max()))  # maximum image pixel value
 
-                # determine the number of integer bits required to represent the value range
-                bits = 2**np.ceil(np.log2(np.log2(dtype_max - dtype_min)))
-                bits = min(max(bits, 8), 32)  # clamp bits to allowed values
-                dtype = f'{"u" if dtype_min >= 0 else ""}int{int(bits)}'
+                # find the smallest integer type that can represent the value range, clamping to 32 bits
+                for bits in [8, 16, 32]:
+                    dtype = f'{"u" if dtype_min >= 0 else ""}int{bits}'
+                    if (dtype_min >= np.iinfo(dtype).min) and (dtype_max <= np.iinfo(dtype).max):
+                        break
             elif any(precisions == 'double'):
                 dtype = 'float64'
             else:
                 dtype = 'float32'
         return dtype
 
+    @classmethod
+    def _get_data_min_dtype(cls, ee_image: ee.Image, region: Dict, crs: Union[str, ee.Projection], scale: float) -> str:
+        """
+        Return the minimum size data type able to represent the estimated pixel values of an Earth Engine image
+        inside a region.
+
+        Pixel value ranges are estimated with a best effort ``reduceRegion`` at a coarse scale (``scale`` multiplied
+        by ``_data_dtype_scale_factor``, or coarser for large regions), so that the check costs a fraction of the
+        download.  As extreme values may be missed at this scale, the estimated ranges are widened by a margin of
+        ``_data_dtype_margin`` times their largest absolute value.  Values outside the widened ranges are clamped on
+        conversion.  Integer bands are sized to their widened value ranges (within their declared ranges), and double
+        precision bands are reduced to single precision when their values lie in the ``float32`` range.
+        """
+        # retrieve the band types and value ranges in one call
+        minmax = ee_image.reduceRegion(
+            reducer=ee.Reducer.minMax(), geometry=region, crs=crs, scale=scale * cls._data_dtype_scale_factor,
+            bestEffort=True, maxPixels=cls._data_dtype_max_pixels
+        )
+        info = ee.Dictionary(dict(minmax=minmax, band_types=ee_image.bandTypes())).getInfo()
+
+        band_list = []
+        float32_max = np.finfo('float32').max
+        for band_name, data_type in info['band_types'].items():
+            data_type = dict(data_type)
+            band_min = info['minmax'].get(f'{band_name}_min', None)
+            band_max = info['minmax'].get(f'{band_name}_max', None)
+            if (band_min is not None) and (band_max is not None):
+                # band has valid pixels in the region, so replace the declared range with the widened estimated range
+                margin = cls._data_dtype_margin * max(abs(band_min), abs(band_max))
+                band_min, band_max = band_min - margin, band_max + margin
+                if data_type['precision'] == 'int':
+                    # EE int data types always have declared min & max values
+                    data_type.update(
+                        min=max(int(np.floor(band_min)), data_type['min']),
+                        max=min(int(np.ceil(band_max)), data_type['max'])
+                    )
+                elif max(abs(band_min), abs(band_max)) <= float32_max:
+                    data_type['precision'] = 'float'
+            band_list.append(dict(id=band_name, data_type=data_type))
+        return BaseImage._get_min_dtype(dict(bands=band_list))
+
     @staticmethod
     def _str_format_size(byte_size: float, units=['bytes', 'KB', 'MB', 'GB', 'TB', 'PB', 'EB']) -> str:
         """
@@ -341,7 +403,8 @@ class BaseImage:
 
     def _prepare_for_export(
         self, region: Dict = None, crs: str = None, scale: float = None,
-        resampling: ResamplingMethod = _default_resampling, dtype: str = None, scale_offset: bool = False
+        resampling: ResamplingMethod = _default_resampling, dtype: str = None, scale_offset: bool = False,
+        data_dtype: bool = False
     ) -> 'BaseImage':
         """
         Prepare the encapsulated image for export/download.  Will reproject, resample, clip and convert the image
@@ -364,6 +427,11 @@ class BaseImage:
            or `float64`). Defaults to auto select a minimal type that can represent the range of pixel values.
         scale_offset: bool, optional
             Whether to apply any EE band scales and offsets to the image.
+        data_dtype: bool, optional
+            When ``dtype`` is not specified, whether to auto select the data type from the actual range of pixel
+            values in ``region`` (rather than from the range of the image band data types).  This requires an extra
+            call to Earth Engine.  Pixel value ranges are estimated at a coarse scale, with a margin, and any values
+            outside the estimated ranges are clamped.
 
         Returns
         -------
@@ -414,6 +482,8 @@ class BaseImage:
                 )
             ee_image = utils.resample(ee_image, resampling)
 
+        if not dtype and data_dtype:
+            im_dtype = self._get_data_min_dtype(ee_image, region, crs, scale)
         ee_image = self._convert_dtype(ee_image, dtype=dtype or im_dtype)
         # TODO: Specify `crs_transform` and `dimensions` (as in tile), so that everything stays on the source grid
         #  where possible i.e. where the export CRS and scale are the same as the source.
@@ -421,29 +491,89 @@ class BaseImage:
         ee_image, _ = ee_image.prepare_for_export(export_args)
         return BaseImage(ee_image)
 
-    def _prepare_for_download(self, set_nodata: bool = True, **kwargs) -> ('BaseImage', Dict):
+    @staticmethod
+    def _scale_offset_array(
+        array: np.ndarray, band_properties: List[Dict], nodata: float = None, dtype: str = 'float64',
+        mask: np.ndarray = None
+    ) -> np.ndarray:
+        """
+        Apply STAC band scales and offsets to a downloaded array.
+
+        This is the client-side equivalent of :meth:`BaseImage._scale_offset`, allowing image data to be downloaded
+        in its native integer type, and converted to the floating point ranges of physical quantities locally.  Bands
+        without a scale or offset are converted to ``dtype``, but otherwise left unaltered.
+
+        Parameters
+        ----------
+        array: numpy.ndarray
+            3D array of image data with bands down the first dimension.
+        band_properties: list(dict)
+            A list of dictionaries specifying band names and corresponding scale and or offset values e.g.
+            :attr:`BaseImage.band_properties`, in the same order as the ``array`` bands.
+        nodata: float, optional
+            Nodata value of ``array``.  When ``mask`` is not provided, nodata pixels in the scaled and offset bands are
+            set to NaN in the returned array.
+        dtype: str, optional
+            Floating point data type of the returned array.
+        mask: numpy.ndarray, optional
+            Boolean array, with the same shape as ``array``, that is True for masked pixels.  Masked pixels in all
+            bands are set to NaN in the returned array.
+
+        Returns
+        -------
+        numpy.ndarray
+            The scaled and offset array.
+        """
+        adj_array = array.astype(dtype)
+        for band_i, bp in enumerate(band_properties):
+            if ('scale' in bp) or ('offset' in bp):
+                adj_array[band_i] *= bp.get('scale', 1.)
+                adj_array[band_i] += bp.get('offset', 0.)
+                if (mask is None) and (nodata is not None) and not np.isnan(nodata):
+                    # there is no mask, so find masked pixels of scaled bands from the nodata value
+                    adj_array[band_i][array[band_i] == nodata] = np.nan
+        if mask is not None:
+            adj_array[mask] = np.nan
+        return adj_array
+
+    @classmethod
+    def _client_scale_offset(
+        cls, scale_offset: bool, dtype: str = None, resampling: Union[ResamplingMethod, str] = None
+    ) -> bool:
+        """
+        Whether scales and offsets can be applied client-side on download i.e. when the destination data type is
+        floating point, and there is no resampling.  (Resampling native integer data before applying scales and
+        offsets rounds the resampled values, so the result would differ from server-side scaling.)
+        """
+        resampling = ResamplingMethod(resampling) if resampling else cls._default_resampling
+        return (
+            scale_offset and (not dtype or np.issubdtype(np.dtype(dtype), np.floating)) and
+            (resampling == ResamplingMethod.near)
+        )
+
+    def _prepare_for_download(
+        self, set_nodata: bool = True, scale_offset: bool = False, dtype: str = None, **kwargs
+    ) -> ('BaseImage', Dict):
         """
         Prepare the encapsulated image for tiled GeoTIFF download. Will reproject, resample, clip and convert the image
         according to the provided parameters.
 
-        Returns the prepared image and a rasterio profile for the downloaded GeoTIFF.
+        Returns the prepared image and a rasterio profile for the downloaded GeoTIFF.  If ``scale_offset`` is True,
+        the destination data type is floating point, and there is no resampling, the prepared image retains its native
+        data type, and scales and offsets should be applied to the downloaded data with
+        :meth:`BaseImage._scale_offset_array`.
         """
         # resample, convert, clip and reproject image according to download params
-        exp_image = self._prepare_for_export(**kwargs)
-        # see float nodata workaround note in Tile.download(...)
-        nodata_dict = dict(
-            float32=self._float_nodata,
-            float64=self._float_nodata,
-            uint8=0,
-            int8=np.iinfo('int8').min,
-            uint16=0,
-            int16=np.iinfo('int16').min,
-            uint32=0,
-            int32=np.iinfo('int32').min
-        )  # yapf: disable
-        nodata = nodata_dict[exp_image.dtype] if set_nodata else None
+        if self._client_scale_offset(scale_offset, dtype, kwargs.get('resampling', None)):
+            exp_image = self._prepare_for_export(**kwargs)
+            out_dtype = dtype or 'float64'
+        else:
+            exp_image = self._prepare_for_export(scale_offset=scale_offset, dtype=dtype, **kwargs)
+            out_dtype = exp_image.dtype
+
+        nodata = self._nodata_dict[out_dtype] if set_nodata else None
         profile = dict(
-            driver='GTiff', dtype=exp_image.dtype, nodata=nodata, width=exp_image.shape[1], height=exp_image.shape[0],
+            driver='GTiff', dtype=out_dtype, nodata=nodata, width=exp_image.shape[1], height=exp_image.shape[0],
             count=exp_image.count, crs=CRS.from_string(exp_image.crs), transform=exp_image.transform,
             compress='deflate', interleave='band', tiled=True, photometric=None, BIGTIFF='YES',
         )
@@ -527,6 +657,13 @@ class BaseImage:
                 dataset.set_band_description(band_i + 1, clean_band_dict['name'])
             dataset.update_tags(band_i + 1, **clean_band_dict)
 
+    def _process_tile_array(self, array: np.ndarray, exp_image: 'BaseImage') -> np.ndarray:
+        """
+        Process a downloaded tile array before it is written to the destination file.  Derived classes can override
+        this method to e.g. composite the tile data locally.  By default, the array is returned unaltered.
+        """
+        return array
+
     @staticmethod
     def _tiles(exp_image: 'BaseImage', tile_shape: Tuple[int, int] = None) -> Iterator[Tile]:
         """
@@ -624,6 +761,10 @@ class BaseImage:
            or `float64`). Defaults to auto select a minimal type that can represent the range of pixel values.
         scale_offset: bool, optional
             Whether to apply any EE band scales and offsets to the image.
+        data_dtype: bool, optional
+            When ``dtype`` is not specified, whether to auto select the data type from the actual range of pixel
+            values in ``region`` (rather than from the range of the image band data types).  Pixel value ranges are
+            estimated at a coarse scale, with a margin, and any values outside the estimated ranges are clamped.
 
         Returns
         -------
@@ -676,7 +817,13 @@ class BaseImage:
             Convert to this data type (`uint8`, `int8`, `uint16`, `int16`, `uint32`, `int32`, `float32`
             or `float64`).  Defaults to auto select a minimum size type that can represent the range of pixel values.
         scale_offset: bool, optional
-            Whether to apply any EE band scales and offsets to the image.
+            Whether to apply any EE band scales and offsets to the image.  Where ``dtype`` is not specified, or is a
+            floating point type, and ``resampling`` is `near`, scales and offsets are applied client-side, so that
+            image data is downloaded in its (smaller) native data type.
+        data_dtype: bool, optional
+            When ``dtype`` is not specified, whether to auto select the data type from the actual range of pixel
+            values in ``region`` (rather than from the range of the image band data types).  Pixel value ranges are
+            estimated at a coarse scale, with a margin, and any values outside the estimated ranges are clamped.
         """
 
         max_threads = num_threads or min(32, (os.cpu_count() or 1) + 4)
@@ -690,6 +837,10 @@ class BaseImage:
 
         # prepare (resample, convert, reproject) the image for download
         exp_image, profile = self._prepare_for_download(**kwargs)
+        client_scale_offset = self._client_scale_offset(
+            kwargs.get('scale_offset', False), kwargs.get('dtype', None), kwargs.get('resampling', None)
+        )
+        band_properties = self.band_properties if client_scale_offset else None
 
         # get the dimensions of an image tile that will satisfy GEE download limits
         tile_shape, num_tiles = self._get_tile_shape(exp_image)
@@ -731,7 +882,13 @@ class BaseImage:
 
             def download_tile(tile):
                 """Download a tile and write into the destination GeoTIFF. """
-                tile_array = tile.download(session=session, bar=bar)
+                tile_array, tile_mask = tile.download(session=session, bar=bar, masked=True)
+                tile_array = self._process_tile_array(tile_array, exp_image)
+                if client_scale_offset:
+                    tile_array = self._scale_offset_array(
+                        tile_array, band_properties, nodata=self._nodata_dict[exp_image.dtype], dtype=profile['dtype'],
+                        mask=tile_mask
+                    )
                 with out_lock:
                     out_ds.write(tile_array, window=tile.window)
 
@@ -37,6 +37,13 @@ class CompositeMethod(str, Enum):
     https://www.mdpi.com/2072-4292/5/12/6481 for detail.    
     """
 
+    array_medoid = 'array-medoid'
+    """
+    Use the medoid of the unmasked pixels, as with `medoid`, but found with array operations on the whole stack of 
+    pixels, rather than by iterating over the input images.  An alternative to `medoid` for large collections, where 
+    the sequential Earth Engine computation of `medoid` can exceed memory limits.  
+    """
+
     median = 'median'
     """ Use the median of the unmasked pixels. """
 
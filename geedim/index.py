@@ -0,0 +1,164 @@
+"""
+    Copyright 2021 Dugal Harris - dugalh@gmail.com
+
+    Licensed under the Apache License, Version 2.0 (the "License");
+    you may not use this file except in compliance with the License.
+    You may obtain a copy of the License at
+
+       http://www.apache.org/licenses/LICENSE-2.0
+
+    Unless required by applicable law or agreed to in writing, software
+    distributed under the License is distributed on an "AS IS" BASIS,
+    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+    See the License for the specific language governing permissions and
+    limitations under the License.
+"""
+
+import json
+import logging
+import pathlib
+import sqlite3
+from collections import OrderedDict
+from datetime import datetime, timezone
+from typing import Dict, Union, Tuple
+
+from rasterio.features import bounds
+
+logger = logging.getLogger(__name__)
+
+
+class SearchIndex:
+
+    def __init__(self, filename: Union[str, pathlib.Path]):
+        """
+        A local SQLite index of search result image properties and footprints, for filtering search results offline.
+
+        Filled and cloudless portions are those of the region in which the images were searched.  Images that are
+        added again, replace their existing entries.
+
+        Parameters
+        ----------
+        filename: str, pathlib.Path
+            Path of the SQLite index file.  It is created if it does not exist.
+        """
+        self._filename = pathlib.Path(filename)
+        self._conn = sqlite3.connect(str(self._filename))
+        with self._conn:
+            self._conn.execute(
+                'CREATE TABLE IF NOT EXISTS images (rid INTEGER PRIMARY KEY, id TEXT UNIQUE NOT NULL, name TEXT, '
+                'time_start REAL, fill_portion REAL, cloudless_portion REAL, properties TEXT, footprint TEXT)'
+            )
+            self._conn.execute('CREATE INDEX IF NOT EXISTS images_name_time ON images (name, time_start)')
+            self._conn.execute(
+                'CREATE VIRTUAL TABLE IF NOT EXISTS images_rtree USING rtree(rid, min_x, max_x, min_y, max_y)'
+            )
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def close(self):
+        """ Close the index file. """
+        self._conn.close()
+
+    @staticmethod
+    def _timestamp(date: datetime) -> float:
+        """ Convert a naive UTC datetime to an Earth Engine timestamp (ms). """
+        # note that we must specify the timezone as utc, otherwise .timestamp() assumes local time.
+        return date.replace(tzinfo=timezone.utc).timestamp() * 1000
+
+    def add(self, name: str, properties: Dict[str, Dict], footprints: Dict[str, Dict] = None):
+        """
+        Add search result images to the index.
+
+        Parameters
+        ----------
+        name: str
+            Name of the Earth Engine collection that the images belong to.
+        properties: dict
+            Image properties, as returned by :attr:`~geedim.collection.MaskedCollection.properties`.
+        footprints: dict, optional
+            Dictionary of geojson image footprints, with image IDs as keys.  Images without footprints are indexed,
+            but are excluded from region queries.
+        """
+        footprints = footprints or {}
+        with self._conn:
+            for im_id, prop_dict in properties.items():
+                # remove any existing entry for this image
+                row = self._conn.execute('SELECT rid FROM images WHERE id = ?', (im_id,)).fetchone()
+                if row:
+                    self._conn.execute('DELETE FROM images WHERE rid = ?', row)
+                    self._conn.execute('DELETE FROM images_rtree WHERE rid = ?', row)
+
+                footprint = footprints.get(im_id, None)
+                cursor = self._conn.execute(
+                    'INSERT INTO images (id, name, time_start, fill_portion, cloudless_portion, properties, footprint) '
+                    'VALUES (?, ?, ?, ?, ?, ?, ?)', (
+                        im_id, name, prop_dict.get('system:time_start', None), prop_dict.get('FILL_PORTION', None),
+                        prop_dict.get('CLOUDLESS_PORTION', None), json.dumps(prop_dict),
+                        json.dumps(footprint) if footprint else None,
+                    )
+                )  # yapf: disable
+                if footprint:
+                    min_x, min_y, max_x, max_y = bounds(footprint)
+                    self._conn.execute(
+                        'INSERT INTO images_rtree VALUES (?, ?, ?, ?, ?)',
+                        (cursor.lastrowid, min_x, max_x, min_y, max_y)
+                    )
+
+    def query(
+        self, name: str = None, start_date: datetime = None, end_date: datetime = None, region: Dict = None,
+        fill_portion: float = None, cloudless_portion: float = None
+    ) -> Dict[str, Dict]:
+        """
+        Query the index for images matching the given criteria.
+
+        Parameters
+        ----------
+        name: str, optional
+            Name of the Earth Engine collection that images should belong to.
+        start_date: datetime, optional
+            Start date (UTC) of the image capture times.
+        end_date: datetime, optional
+            End date (UTC) of the image capture times.
+        region: dict, optional
+            Geojson polygon (in WGS84) that image footprint bounds should intersect.
+        fill_portion: float, optional
+            Minimum portion (%) of filled (valid) image pixels.
+        cloudless_portion: float, optional
+            Minimum portion (%) of cloud/shadow free image pixels.
+
+        Returns
+        -------
+        dict
+            Dictionary of image properties, with image IDs as keys, in capture time order.
+        """
+        sql = 'SELECT images.id, images.properties FROM images'
+        conditions = []
+        params = []
+        if region:
+            min_x, min_y, max_x, max_y = bounds(region)
+            sql += ' JOIN images_rtree ON images.rid = images_rtree.rid'
+            conditions += [
+                'images_rtree.max_x >= ?', 'images_rtree.min_x <= ?', 'images_rtree.max_y >= ?',
+                'images_rtree.min_y <= ?'
+            ]
+            params += [min_x, max_x, min_y, max_y]
+        for condition, value in [
+            ('images.name = ?', name),
+            ('images.time_start >= ?', self._timestamp(start_date) if start_date else None),
+            ('images.time_start < ?', self._timestamp(end_date) if end_date else None),
+            ('images.fill_portion >= ?', fill_portion),
+            ('images.cloudless_portion >= ?', cloudless_portion),
+        ]:  # yapf: disable
+            if value is not None:
+                conditions.append(condition)
+                params.append(value)
+        if len(conditions) > 0:
+            sql += ' WHERE ' + ' AND '.join(conditions)
+        sql += ' ORDER BY images.time_start'
+
+        rows = self._conn.execute(sql, params).fetchall()
+        return OrderedDict([(im_id, json.loads(prop_str)) for im_id, prop_str in rows])
@@ -17,7 +17,7 @@ import logging
 from typing import Dict
 
 import ee
-import geedim.schema
+import numpy as np
 from geedim.download import BaseImage
 from geedim.enums import CloudMaskMethod
 from geedim.utils import split_id, get_projection
@@ -25,10 +25,14 @@ from geedim.utils import split_id, get_projection
 logger = logging.getLogger(__name__)
 
 ##
+# bit positions of the auxiliary mask bands in the packed MASK_BITS band
+_mask_bits = dict(FILL_MASK=0, CLOUD_MASK=1, SHADOW_MASK=2, CLOUDLESS_MASK=3)
 
 
 class MaskedImage(BaseImage):
     _default_mask = False
+    # name of the granule cloud cover (%) property, if any
+    _cloud_cover_property = None
 
     def __init__(self, ee_image: ee.Image, mask: bool = _default_mask, region: dict = None, **kwargs):
         """
@@ -70,6 +74,11 @@ class MaskedImage(BaseImage):
         max_cloud_dist: int, optional
             Maximum distance (m) to look for clouds when forming the 'cloud distance' band.  Valid for
             Sentinel-2 images.
+        cloud_dist: bool, optional
+            Whether to add the 'cloud distance' (CLOUD_DIST) band.  Omitting it avoids the cost of finding cloud
+            distance when it is not needed.  Valid for Landsat and Sentinel-2 images.  Note that
+            :meth:`~geedim.collection.MaskedCollection.composite` defaults to omitting it, unless the `q-mosaic` method
+            is used.
         """
         # TODO: consider adding proj_scale parameter here, rather than in _set_region_stats, then it can be re-used in
         #  S2 cloud masking and distance
@@ -174,6 +183,27 @@ class MaskedImage(BaseImage):
         """ Apply the cloud/shadow mask if supported, otherwise apply the fill mask. """
         self.ee_image = self.ee_image.updateMask(self.ee_image.select('FILL_MASK'))
 
+    def pack_masks(self):
+        """
+        Pack the auxiliary mask bands into a single ``uint8`` MASK_BITS band, to reduce the size of downloaded or
+        exported images.
+
+        FILL_MASK, CLOUD_MASK, SHADOW_MASK and CLOUDLESS_MASK are packed into bits 0, 1, 2 and 3 respectively,
+        and are removed from the encapsulated image.  Bits corresponding to mask bands the image does not have are
+        zero.  Packing should be done after any call to :meth:`mask_clouds`.  Downloaded MASK_BITS data can be
+        unpacked with :func:`unpack_masks`.
+        """
+        mask_names = list(_mask_bits.keys())
+        # add zero valued defaults for any mask bands the image does not have, keeping FILL_MASK first so that the
+        # packed band has its projection
+        zero_masks = ee.Image.constant([0] * len(mask_names)).rename(mask_names)
+        masks = zero_masks.addBands(self.ee_image.select('.*_MASK'), overwrite=True).select(mask_names).unmask()
+        weights = ee.Image.constant([1 << bit for bit in _mask_bits.values()])
+        mask_bits = masks.multiply(weights).reduce(ee.Reducer.sum()).toUint8().rename('MASK_BITS')
+
+        band_names = self.ee_image.bandNames().removeAll(mask_names)
+        self.ee_image = self.ee_image.select(band_names).addBands(mask_bits)
+
 
 class CloudMaskedImage(MaskedImage):
     """ A base class for encapsulating cloud/shadow masked images. """
@@ -267,8 +297,11 @@ class LandsatImage(CloudMaskedImage):
     * LANDSAT/LC08/C02/T1_L2
     * LANDSAT/LC09/C02/T1_L2
     """
+    _cloud_cover_property = 'CLOUD_COVER'
 
-    def _aux_image(self, mask_shadows: bool = True, mask_cirrus: bool = True, max_cloud_dist: int = 5000) -> ee.Image:
+    def _aux_image(
+        self, mask_shadows: bool = True, mask_cirrus: bool = True, max_cloud_dist: int = 5000, cloud_dist: bool = True
+    ) -> ee.Image:
         """
         Retrieve the auxiliary image containing cloud/shadow masks and cloud distance.
 
@@ -281,11 +314,13 @@ class LandsatImage(CloudMaskedImage):
         max_cloud_dist: int, optional
             Maximum distance (m) to look for clouds when forming the 'cloud distance' band.  Valid for
             Sentinel-2 images.
+        cloud_dist: bool, optional
+            Whether to include the 'cloud distance' band.
 
         Returns
         -------
         ee.Image
-            An Earth Engine image containing *_MASK and CLOUD_DIST bands.
+            An Earth Engine image containing *_MASK and (optionally) CLOUD_DIST bands.
         """
         ee_image = self._ee_image
         qa_pixel = ee_image.select('QA_PIXEL')
@@ -304,20 +339,29 @@ class LandsatImage(CloudMaskedImage):
         cloud_shadow_mask = (cloud_mask.Or(shadow_mask)) if mask_shadows else cloud_mask
         cloudless_mask = cloud_shadow_mask.Not().And(fill_mask).rename('CLOUDLESS_MASK')
 
-        # copy cloud distance from existing ST_CDIST band, scale to meters, and clip to max_cloud_dist
-        cloud_dist = ee_image.select('ST_CDIST').rename('CLOUD_DIST').multiply(10).toUint32()
-        cloud_dist = cloud_dist.where(cloud_dist.gt(ee.Image(max_cloud_dist)), max_cloud_dist)
+        aux_bands = [fill_mask, cloud_mask, shadow_mask, cloudless_mask]
+        if cloud_dist:
+            # copy cloud distance from existing ST_CDIST band, scale to meters, and clip to max_cloud_dist
+            cloud_dist = ee_image.select('ST_CDIST').rename('CLOUD_DIST').multiply(10).toUint32()
+            cloud_dist = cloud_dist.where(cloud_dist.gt(ee.Image(max_cloud_dist)), max_cloud_dist)
+            aux_bands.append(cloud_dist)
 
-        return ee.Image([fill_mask, cloud_mask, shadow_mask, cloudless_mask, cloud_dist])
+        return ee.Image(aux_bands)
 
 
 class Sentinel2ClImage(CloudMaskedImage):
     """ Base class for cloud/shadow masking of Sentinel-2 TOA and SR images. """
+    # names of the properties that hold any corresponding cloud probability and TOA images, joined to this image by
+    # MaskedCollection
+    _cloud_prob_property = 'CLOUD_PROB_IMAGE'
+    _toa_property = 'TOA_IMAGE'
+    _cloud_cover_property = 'CLOUDY_PIXEL_PERCENTAGE'
 
     def _aux_image(
         self, s2_toa: bool = False, mask_cirrus: bool = True, mask_shadows: bool = True,
         mask_method: CloudMaskMethod = CloudMaskMethod.cloud_prob, prob: float = 60, dark: float = 0.15,
-        shadow_dist: int = 1000, buffer: int = 50, cdi_thresh: float = None, max_cloud_dist: int = 5000
+        shadow_dist: int = 1000, buffer: int = 50, cdi_thresh: float = None, max_cloud_dist: int = 5000,
+        cloud_dist: bool = True
     ) -> ee.Image:
         """
         Derive cloud, shadow and validity masks for the encapsulated image.
@@ -353,18 +397,30 @@ class Sentinel2ClImage(CloudMaskedImage):
         max_cloud_dist: int, optional
             Maximum distance (m) to look for clouds when forming the 'cloud distance' band.  Valid for
             Sentinel-2 images.
+        cloud_dist: bool, optional
+            Whether to include the 'cloud distance' band.
 
         Returns
         -------
         ee.Image
-            An Earth Engine image containing *_MASK and CLOUD_DIST bands.
+            An Earth Engine image containing *_MASK and (optionally) CLOUD_DIST bands.
         """
         mask_method = CloudMaskMethod(mask_method)
 
+        def get_joined_image(ee_im, property_name, coll_name):
+            """
+            Get the image from `coll_name` that corresponds to `ee_im`.  Uses the image joined to `ee_im` by
+            MaskedCollection if it exists, otherwise searches `coll_name`.
+            """
+            filt = ee.Filter.eq('system:index', ee_im.get('system:index'))
+            joined_image = ee.Algorithms.If(
+                ee_im.get(property_name), ee_im.get(property_name), ee.ImageCollection(coll_name).filter(filt).first()
+            )
+            return ee.Image(joined_image)
+
         def get_cloud_prob(ee_im):
             """Get the cloud probability image from COPERNICUS/S2_CLOUD_PROBABILITY that corresponds to `ee_im`."""
-            filt = ee.Filter.eq('system:index', ee_im.get('system:index'))
-            cloud_prob = ee.ImageCollection('COPERNICUS/S2_CLOUD_PROBABILITY').filter(filt).first()
+            cloud_prob = get_joined_image(ee_im, self._cloud_prob_property, 'COPERNICUS/S2_CLOUD_PROBABILITY')
             return cloud_prob.rename('CLOUD_PROB')
 
         def get_cloud_mask(ee_im, cloud_prob=None):
@@ -389,8 +445,7 @@ class Sentinel2ClImage(CloudMaskedImage):
                 s2_toa_image = ee_im
             else:
                 # get the Sentinel-2 TOA image that corresponds to ee_im
-                idx = ee_im.get('system:index')
-                s2_toa_image = (ee.ImageCollection('COPERNICUS/S2').filter(ee.Filter.eq('system:index', idx)).first())
+                s2_toa_image = get_joined_image(ee_im, self._toa_property, 'COPERNICUS/S2')
             cdi_image = ee.Algorithms.Sentinel2.CDI(s2_toa_image)
             return cdi_image.lt(cdi_thresh).rename('CDI_CLOUD_MASK')
 
@@ -439,8 +494,9 @@ class Sentinel2ClImage(CloudMaskedImage):
         if mask_method == CloudMaskMethod.cloud_prob:
             aux_bands.append(cloud_prob)
 
-        cloud_dist = self._cloud_dist(cloudless_mask=cloudless_mask, max_cloud_dist=max_cloud_dist)
-        return ee.Image(aux_bands + [cloud_dist])
+        if cloud_dist:
+            aux_bands.append(self._cloud_dist(cloudless_mask=cloudless_mask, max_cloud_dist=max_cloud_dist))
+        return ee.Image(aux_bands)
 
 
 class Sentinel2SrClImage(Sentinel2ClImage):
@@ -457,12 +513,125 @@ class Sentinel2ToaClImage(Sentinel2ClImage):
         return Sentinel2ClImage._aux_image(self, s2_toa=True, **kwargs)
 
 
+def unpack_masks(mask_bits: np.ndarray) -> Dict[str, np.ndarray]:
+    """
+    Unpack a MASK_BITS array, as created by :meth:`MaskedImage.pack_masks` and downloaded, into boolean mask arrays.
+
+    Parameters
+    ----------
+    mask_bits: numpy.ndarray
+        MASK_BITS band data.
+
+    Returns
+    -------
+    dict
+        Dictionary of boolean mask arrays, with the same shape as ``mask_bits``.  Keys are the mask band names i.e.
+        FILL_MASK, CLOUD_MASK, SHADOW_MASK and CLOUDLESS_MASK.
+    """
+    # nodata in floating point downloads is nan, so convert this to zero before casting
+    mask_bits = np.nan_to_num(np.asarray(mask_bits)).astype('uint8', copy=False)
+    return {mask_name: (mask_bits & (1 << bit)) != 0 for mask_name, bit in _mask_bits.items()}
+
+
+def _combine_masks(
+    fill_mask: np.ndarray, cloud_mask: np.ndarray, shadow_mask: np.ndarray, mask_shadows: bool
+) -> Dict[str, np.ndarray]:
+    """ Combine fill, cloud and shadow masks into a dictionary of mask arrays, including a cloudless mask. """
+    cloud_shadow_mask = (cloud_mask | shadow_mask) if mask_shadows else cloud_mask
+    cloudless_mask = ~cloud_shadow_mask & fill_mask
+    return dict(FILL_MASK=fill_mask, CLOUD_MASK=cloud_mask, SHADOW_MASK=shadow_mask, CLOUDLESS_MASK=cloudless_mask)
+
+
+def landsat_qa_masks(
+    qa_pixel: np.ndarray, fill_mask: np.ndarray = None, mask_shadows: bool = True, mask_cirrus: bool = True
+) -> Dict[str, np.ndarray]:
+    """
+    Derive cloud/shadow masks from a downloaded Landsat QA_PIXEL array.  This is the client-side equivalent of the
+    :class:`LandsatImage` masks, allowing masks to be found locally from the QA_PIXEL band alone.
+
+    Parameters
+    ----------
+    qa_pixel: numpy.ndarray
+        QA_PIXEL band data.
+    fill_mask: numpy.ndarray, optional
+        Boolean mask of valid surface reflectance pixels.  If None, all pixels are assumed valid, and only the
+        QA_PIXEL fill bit is used.
+    mask_shadows: bool, optional
+        Whether to mask cloud shadows.
+    mask_cirrus: bool, optional
+        Whether to mask cirrus clouds.  Valid for Landsat 8-9 images.
+
+    Returns
+    -------
+    dict
+        Dictionary of boolean mask arrays, with the same shape as ``qa_pixel``.  Keys are the mask band names i.e.
+        FILL_MASK, CLOUD_MASK, SHADOW_MASK and CLOUDLESS_MASK.
+    """
+    # nodata in floating point downloads is nan, so convert this to the fill bit before casting
+    qa_pixel = np.nan_to_num(np.asarray(qa_pixel), nan=1).astype('uint16', copy=False)
+    qa_fill_mask = (qa_pixel & 1) == 0
+    fill_mask = qa_fill_mask if fill_mask is None else (qa_fill_mask & fill_mask)
+    shadow_mask = (qa_pixel & 0b10000) != 0
+    cloud_mask = (qa_pixel & (0b1100 if mask_cirrus else 0b1000)) != 0
+    return _combine_masks(fill_mask, cloud_mask, shadow_mask, mask_shadows)
+
+
+def sentinel2_qa_masks(
+    qa60: np.ndarray, scl: np.ndarray = None, fill_mask: np.ndarray = None, mask_shadows: bool = True,
+    mask_cirrus: bool = True
+) -> Dict[str, np.ndarray]:
+    """
+    Derive approximate cloud/shadow masks from downloaded Sentinel-2 QA60 and (optionally) SCL arrays.
+
+    The cloud mask is the client-side equivalent of the :class:`Sentinel2ClImage` `qa` ``mask_method`` cloud mask.
+    The shadow and cloudless masks approximate those of :class:`Sentinel2ClImage`: the shadow mask is taken from the
+    SCL cloud shadow class, rather than from the projected cloud mask and dark NIR pixels, and the cloudless mask is
+    not morphologically opened or buffered.  Nodata (NaN) QA60 or SCL pixels, and SCL no data class pixels, are
+    unfilled.
+
+    Parameters
+    ----------
+    qa60: numpy.ndarray
+        QA60 band data.
+    scl: numpy.ndarray, optional
+        SCL (scene classification) band data.  Valid for Sentinel-2 SR images.  If None, the shadow mask is empty.
+    fill_mask: numpy.ndarray, optional
+        Boolean mask of valid surface reflectance pixels.  If None, all QA60 (and SCL) data pixels are assumed valid.
+    mask_shadows: bool, optional
+        Whether to mask cloud shadows.
+    mask_cirrus: bool, optional
+        Whether to mask cirrus clouds.
+
+    Returns
+    -------
+    dict
+        Dictionary of boolean mask arrays, with the same shape as ``qa60``.  Keys are the mask band names i.e.
+        FILL_MASK, CLOUD_MASK, SHADOW_MASK and CLOUDLESS_MASK.
+    """
+    # nodata in floating point downloads is nan, so exclude it from the fill mask before casting
+    qa60 = np.asarray(qa60)
+    qa_fill_mask = ~np.isnan(qa60) if np.issubdtype(qa60.dtype, np.floating) else np.ones(qa60.shape, dtype=bool)
+    qa60 = np.nan_to_num(qa60).astype('uint16', copy=False)
+    if scl is not None:
+        scl = np.asarray(scl)
+        qa_fill_mask &= ~np.isnan(scl) & (np.nan_to_num(scl) != 0)  # SCL class 0 is no data
+    fill_mask = qa_fill_mask if fill_mask is None else (qa_fill_mask & np.asarray(fill_mask, dtype=bool))
+
+    cloud_mask = (qa60 & (1 << 10)) != 0
+    if mask_cirrus:
+        cloud_mask |= (qa60 & (1 << 11)) != 0
+    shadow_mask = (scl == 3) if scl is not None else np.zeros(qa60.shape, dtype=bool)
+    return _combine_masks(fill_mask, cloud_mask, shadow_mask, mask_shadows)
+
+
 def class_from_id(image_id: str) -> type:
     """ Return the *Image class that corresponds to the provided Earth Engine image/collection ID. """
+    from geedim.schema import collection_schema  # avoid circular import
+
     ee_coll_name, _ = split_id(image_id)
-    if image_id in geedim.schema.collection_schema:
-        return geedim.schema.collection_schema[image_id]['image_type']
-    elif ee_coll_name in geedim.schema.collection_schema:
-        return geedim.schema.collection_schema[ee_coll_name]['image_type']
+    if image_id in collection_schema:
+        return collection_schema[image_id]['image_type']
+    elif ee_coll_name in collection_schema:
+        return collection_schema[ee_coll_name]['image_type']
     else:
         return MaskedImage
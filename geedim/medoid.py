@@ -21,6 +21,8 @@
     OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
     SOFTWARE.
 """
+from typing import List
+
 import ee
 """
     This module contains Medoid related functionality copied from 'Google Earth Engine tools' under MIT license.
@@ -360,3 +362,60 @@ def medoid(collection, bands=None, discard_zeros=True):
     final = removeBands(comp, ['sumdist'])
     return final
 # yapf: enable
+
+
+def array_medoid(collection: ee.ImageCollection, bands: List[str] = None, discard_zeros: bool = True) -> ee.Image:
+    """
+    Medoid composite, found with array image operations on the whole stack of collection pixels, rather than by
+    iterating over collection images.  Equivalent to :func:`medoid`.
+
+    Parameters
+    ----------
+    collection: ee.ImageCollection
+        The collection to composite.
+    bands: list of str, optional
+        The bands to use for finding the medoid.  The composite includes all bands.  If None, all bands are used.
+    discard_zeros: bool, optional
+        Whether to ignore band values of zero when finding the distance between two pixels (i.e. to fill them with
+        the corresponding band values of the other pixel).
+
+    Returns
+    -------
+    ee.Image
+        The medoid composite.
+    """
+    first_image = ee.Image(collection.first())
+    band_names = first_image.bandNames()
+    bands = bands or band_names
+
+    def mask_all_bands(ee_image: ee.Image) -> ee.Image:
+        # mask pixels that are masked in any band, so that array rows correspond across band selections
+        ee_image = ee.Image(ee_image)
+        return ee_image.updateMask(ee_image.mask().reduce(ee.Reducer.min()))
+
+    collection = collection.map(mask_all_bands)
+
+    # N x B arrays of the N unmasked stack pixels, with values <= 0 replaced by 0 for finding distances (as in
+    # euclideanDistance())
+    stack_array = collection.toArray().toDouble()
+    dist_array = collection.select(bands).toArray().toDouble().max(0)
+
+    # sum of euclidean distances between each stack pixel and all others.  With a_i the distance band values of
+    # pixel i, and m_i the band weights (1 for bands that count in the distance, 0 for zero bands that are
+    # discarded), |a_i - a_j|^2 = a_i^2.m_j + m_i.a_j^2 - 2a_i.a_j, as a_i is already 0 where m_i is 0.
+    weights = dist_array.gt(0) if discard_zeros else dist_array.multiply(0).add(1)
+    sq_weighted = dist_array.pow(2).matrixMultiply(weights.toDouble().matrixTranspose())  # N x N
+    gram = dist_array.matrixMultiply(dist_array.matrixTranspose())  # N x N
+    sq_dist = sq_weighted.add(sq_weighted.matrixTranspose()).subtract(gram.multiply(2)).max(0)
+    sum_dist = sq_dist.sqrt().arrayReduce(ee.Reducer.sum(), [1])  # N x 1
+
+    # append a dummy row with maximum distance, so that pixels without unmasked stack pixels have a (masked) medoid
+    dummy_row = first_image.unmask(0).toArray().toDouble().toArray(1).matrixTranspose()  # 1 x B
+    stack_array = stack_array.arrayCat(dummy_row, 0)
+    sum_dist = sum_dist.arrayCat(ee.Image(ee.Array([[1e38]])), 0)
+
+    # the medoid is the stack pixel with the minimum sum of distances
+    medoid_row = stack_array.arraySort(sum_dist).arraySlice(0, 0, 1)  # 1 x B
+    medoid_image = medoid_row.arrayProject([1]).arrayFlatten([band_names])
+    medoid_image = medoid_image.updateMask(collection.toArray().arrayLength(0).gt(0))
+    return medoid_image.cast(first_image.bandTypes(), band_names)
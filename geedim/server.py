@@ -0,0 +1,239 @@
+"""
+    Copyright 2021 Dugal Harris - dugalh@gmail.com
+
+    Licensed under the Apache License, Version 2.0 (the "License");
+    you may not use this file except in compliance with the License.
+    You may obtain a copy of the License at
+
+       http://www.apache.org/licenses/LICENSE-2.0
+
+    Unless required by applicable law or agreed to in writing, software
+    distributed under the License is distributed on an "AS IS" BASIS,
+    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+    See the License for the specific language governing permissions and
+    limitations under the License.
+"""
+"""
+    A long-running local HTTP job server, and its client.  The server keeps one initialised Earth Engine client, and
+    warm STAC & metadata caches, between :mod:`geedim.batch` jobs.
+
+    The server API is:
+
+    * ``POST /jobs``: Submit a job dict, or a list of job dicts.  Responds with ``{"keys": [<job key>, ...]}``.
+    * ``GET /jobs``: Responds with the number of jobs in each state e.g. ``{"pending": 1, "running": 2, ...}``.
+    * ``GET /jobs/<job key>``: Responds with ``{"key": <job key>, "state": <job state>, "error": <error message>}``.
+"""
+import json
+import logging
+import pathlib
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http import HTTPStatus
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn
+from typing import Dict, List, Union
+
+from geedim import utils
+from geedim.batch import JobQueue, _job_threads, run_queued, validate_jobs
+
+logger = logging.getLogger(__name__)
+
+default_host = '127.0.0.1'
+default_port = 8765
+
+
+class _JobHandler(BaseHTTPRequestHandler):
+    """ HTTP request handler for :class:`JobServer`. """
+
+    def _send_json(self, status: HTTPStatus, obj: Dict):
+        """ Send a JSON response. """
+        body = json.dumps(obj).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):
+        if self.path.rstrip('/') != '/jobs':
+            return self._send_json(HTTPStatus.NOT_FOUND, dict(error=f'Unknown path: {self.path}'))
+        try:
+            jobs = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))))
+            jobs = [jobs] if isinstance(jobs, dict) else jobs
+            if not isinstance(jobs, list):
+                raise ValueError('Request body should be a job, or a list of jobs.')
+            keys = self.server.submit(jobs)
+        except ValueError as ex:
+            return self._send_json(HTTPStatus.BAD_REQUEST, dict(error=str(ex)))
+        self._send_json(HTTPStatus.ACCEPTED, dict(keys=keys))
+
+    def do_GET(self):
+        path = self.path.rstrip('/')
+        if path == '/jobs':
+            return self._send_json(HTTPStatus.OK, self.server.queue.get_counts())
+        if path.startswith('/jobs/'):
+            key = path[len('/jobs/'):]
+            try:
+                state, error = self.server.queue.get_state(key)
+            except ValueError as ex:
+                return self._send_json(HTTPStatus.NOT_FOUND, dict(error=str(ex)))
+            return self._send_json(HTTPStatus.OK, dict(key=key, state=state, error=error))
+        self._send_json(HTTPStatus.NOT_FOUND, dict(error=f'Unknown path: {self.path}'))
+
+    def log_message(self, format: str, *args):
+        logger.debug(f'{self.address_string()} - {format % args}')
+
+
+class JobServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+    def __init__(
+        self, queue_file: Union[str, pathlib.Path], host: str = default_host, port: int = default_port,
+        max_jobs: int = 4, max_threads: int = None
+    ):
+        """
+        A local HTTP server that runs :mod:`geedim.batch` jobs submitted by a :class:`Client`.
+
+        Jobs are recorded in a persistent :class:`~geedim.batch.JobQueue`, and unfinished jobs from a previous server
+        are resumed.  Earth Engine should be initialised before the server is started.
+
+        Parameters
+        ----------
+        queue_file: str, pathlib.Path
+            Path of the SQLite file in which to record jobs and their states.
+        host: str, optional
+            Host address to listen on.
+        port: int, optional
+            Port to listen on.
+        max_jobs: int, optional
+            Maximum number of jobs to run concurrently.
+        max_threads: int, optional
+            Maximum number of tiles to download concurrently, shared between concurrent jobs.  Defaults to a value
+            based on the number of CPUs.
+        """
+        HTTPServer.__init__(self, (host, port), _JobHandler)
+        self.queue = JobQueue(queue_file)
+        self._executor = ThreadPoolExecutor(max_workers=max_jobs)
+        self._num_threads = _job_threads(max_jobs, max_threads)
+        self._submitted = set()
+        self._lock = threading.Lock()
+        self._stopping = False
+
+        # resume unfinished jobs from a previous server
+        self.queue.resume()
+        self._submit_pending()
+
+    def _run(self, key: str, job: Dict):
+        """ Run a queued job, unless the server is stopping. """
+        if not self._stopping:
+            run_queued(self.queue, key, job, num_threads=self._num_threads)
+
+    def _submit_pending(self, keys: List[str] = None):
+        """ Submit pending jobs that have not already been submitted, to the executor. """
+        with self._lock:
+            for key, job in self.queue.get_pending(keys=keys):
+                if key not in self._submitted:
+                    self._submitted.add(key)
+                    self._executor.submit(self._run, key, job)
+
+    def submit(self, jobs: List[Dict]) -> List[str]:
+        """
+        Queue and run jobs.  Jobs that are already queued are not run again.
+
+        Parameters
+        ----------
+        jobs: list of dict
+            Jobs to run.
+
+        Returns
+        -------
+        list of str
+            Keys of the jobs.
+        """
+        validate_jobs(jobs)
+        keys = self.queue.add(jobs)
+        self._submit_pending(keys=keys)
+        return keys
+
+    def server_close(self):
+        """ Stop running jobs, waiting for any running jobs to finish, and close the server. """
+        # pending jobs stay pending in the queue, and are resumed when a server is next started
+        self._stopping = True
+        self._executor.shutdown(wait=True)
+        HTTPServer.server_close(self)
+        self.queue.close()
+
+
+class Client:
+
+    def __init__(self, url: str = f'http://{default_host}:{default_port}'):
+        """
+        Client for submitting jobs to, and retrieving job states from, a :class:`JobServer`.
+
+        Parameters
+        ----------
+        url: str, optional
+            URL of the server.
+        """
+        self._url = url.rstrip('/')
+        self._session = utils.retry_session()
+
+    def _request(self, method: str, path: str, **kwargs) -> Dict:
+        """ Make a request to the server, and return the JSON response. """
+        response = self._session.request(method, self._url + path, **kwargs)
+        if response.status_code in [HTTPStatus.BAD_REQUEST, HTTPStatus.NOT_FOUND]:
+            raise ValueError(response.json()['error'])
+        response.raise_for_status()
+        return response.json()
+
+    def submit(self, jobs: Union[Dict, List[Dict]]) -> List[str]:
+        """
+        Submit job(s) to the server.
+
+        Parameters
+        ----------
+        jobs: dict, list of dict
+            Job, or list of jobs.  See :mod:`geedim.batch` for the job keys.
+
+        Returns
+        -------
+        list of str
+            Keys of the submitted jobs.
+        """
+        return self._request('POST', '/jobs', json=jobs)['keys']
+
+    def status(self, key: str) -> Dict:
+        """ Return the state and any error message of a job, as a dict. """
+        return self._request('GET', f'/jobs/{key}')
+
+    def counts(self) -> Dict[str, int]:
+        """ Return the number of server jobs in each state. """
+        return self._request('GET', '/jobs')
+
+    def wait(self, keys: List[str], interval: float = 1, timeout: float = None) -> Dict[str, Dict]:
+        """
+        Wait for jobs to finish i.e. to be done or failed.
+
+        Parameters
+        ----------
+        keys: list of str
+            Keys of the jobs to wait for.
+        interval: float, optional
+            Interval (s) between job state requests.
+        timeout: float, optional
+            Maximum time (s) to wait.  By default, there is no limit.
+
+        Returns
+        -------
+        dict
+            Job states, with job keys as keys.
+        """
+        start = time.time()
+        while True:
+            statuses = {key: self.status(key) for key in keys}
+            if all([status['state'] in [JobQueue.done, JobQueue.failed] for status in statuses.values()]):
+                return statuses
+            if timeout is not None and (time.time() - start) > timeout:
+                raise TimeoutError(f'Jobs did not finish within {timeout} seconds.')
+            time.sleep(interval)
@@ -15,11 +15,14 @@
 """
 import json
 import logging
+import os
 import threading
-from concurrent.futures import ThreadPoolExecutor, as_completed
-from typing import Dict, Union
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Dict, Tuple, Union
 
 from geedim import utils
+from tqdm.auto import tqdm
 
 logger = logging.getLogger(__name__)
 root_stac_url = 'https://earthengine-stac.storage.googleapis.com/catalog/catalog.json'
@@ -118,14 +121,21 @@ class StacItem:
 
 @utils.singleton
 class StacCatalog:
+    # time (s) for which STAC items cached on disk are used without revalidation
+    _cache_ttl = 7 * 24 * 60 * 60
+    # maximum number of threads for crawling EE STAC
+    _crawl_workers = 16
 
     def __init__(self):
         """ Singleton class to interface to the EE STAC, and retrieve image/collection STAC data. """
         self._filename = utils.root_path.joinpath('geedim/data/ee_stac_urls.json')
+        self._snapshot_filename = utils.root_path.joinpath('geedim/data/ee_stac_snapshot.json')
         self._session = utils.retry_session()
         self._url_dict = None
+        self._snapshot = None
         self._cache = {}
         self._lock = threading.Lock()
+        self._single_flight = utils.SingleFlight()
 
     @property
     def url_dict(self) -> Dict[str, str]:
@@ -136,35 +146,161 @@ class StacCatalog:
                 self._url_dict = json.load(f)
         return self._url_dict
 
-    def _traverse_stac(self, url: str, url_dict: Dict) -> Dict:
+    @property
+    def snapshot(self) -> Dict[str, Dict]:
+        """
+        Dictionary with image/collection IDs/names as keys, and compact STAC dicts as values, for the collections in
+        :attr:`geedim.schema.collection_schema`.  Read from the package snapshot file, so that STAC data for these
+        collections is available without network access.
+        """
+        if self._snapshot is None:
+            try:
+                with open(self._snapshot_filename, 'r') as f:
+                    self._snapshot = json.load(f)
+            except OSError:
+                self._snapshot = {}
+        return self._snapshot
+
+    @staticmethod
+    def _compact_item_dict(item_dict: Dict) -> Dict:
+        """ Return a compact copy of a raw STAC dict, containing only what :class:`StacItem` uses. """
+        summaries = item_dict.get('summaries', {})
+        summary_keys = ['eo:bands', 'gsd', 'gee:schema', 'gee:collection_schema']
+        return dict(
+            summaries={key: summaries[key] for key in summary_keys if key in summaries},
+            links=[link for link in item_dict.get('links', []) if link.get('rel', None) == 'license'],
+        )
+
+    def refresh_snapshot(self):
+        """
+        Update :attr:`snapshot` with the latest from EE STAC.  Raises an error if an entry cannot be retrieved, so
+        that a partial snapshot is never written.
+        """
+        from geedim.schema import collection_schema  # avoid circular import
+
+        snapshot = {}
+        for name in collection_schema.keys():
+            if name not in self.url_dict:
+                logger.warning(f'There is no STAC entry for: {name}')
+                continue
+            response = self._session.get(self.url_dict[name])
+            response.raise_for_status()
+            snapshot[name] = self._compact_item_dict(response.json())
+        self._snapshot = snapshot
+
+    def write_snapshot(self, filename=None):
+        """ Write the :attr:`snapshot` to file. """
+        if filename is None:
+            filename = self._snapshot_filename
+        with open(filename, 'w') as f:
+            json.dump(self.snapshot, f)
+
+    @staticmethod
+    def _crawl_state_filename():
+        """ Return the path of the on-disk EE STAC crawl state file. """
+        return utils.cache_dir().joinpath('stac', 'crawl_state.json')
+
+    def _read_crawl_state(self) -> Dict[str, Dict]:
+        """ Read the crawl state of the last EE STAC traversal, if it exists. """
+        try:
+            with open(self._crawl_state_filename(), 'r') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _write_crawl_state(self, state: Dict[str, Dict]):
+        """ Atomically write the EE STAC crawl state. """
+        filename = self._crawl_state_filename()
+        try:
+            filename.parent.mkdir(parents=True, exist_ok=True)
+            tmp_filename = filename.with_suffix(f'.{os.getpid()}.{threading.get_ident()}.tmp')
+            with open(tmp_filename, 'w') as f:
+                json.dump(state, f)
+            os.replace(tmp_filename, filename)
+        except OSError as ex:
+            logger.debug(f'Could not write the STAC crawl state: {str(ex)}')
+
+    def _fetch_stac_node(self, url: str, prev_node: Dict = None) -> Tuple[Union[Dict, None], bool]:
         """
-        Recursive & threaded EE STAC tree traversal that returns the `url_dict` i.e. a dict with image/collection
-        IDs/names as keys, and the corresponding json STAC URLs as values.
+        Fetch and parse an EE STAC catalog / collection node into a dict of its ETag, Last-Modified time, image /
+        collection ID (for image & image collection leaf nodes) and child URLs.  If ``prev_node`` is supplied, a
+        conditional request is made, and ``(prev_node, True)`` is returned when the node is unchanged.
         """
-        response = self._session.get(url)
+        headers = {}
+        if prev_node and prev_node.get('etag', None):
+            headers['If-None-Match'] = prev_node['etag']
+        if prev_node and prev_node.get('last_modified', None):
+            headers['If-Modified-Since'] = prev_node['last_modified']
+
+        response = self._session.get(url, headers=headers)
+        if prev_node and (response.status_code == 304):
+            return prev_node, True
         if not response.ok:
             logger.warning(f'Error reading {url}: ' + str(response.content))
-            return url_dict
+            return None, False
+
         response_dict = response.json()
+        node = dict(
+            etag=response.headers.get('ETag', None), last_modified=response.headers.get('Last-Modified', None),
+            id=None, children=[]
+        )
         if 'type' in response_dict:
-            if (response_dict['type'].lower() == 'collection'):
+            if response_dict['type'].lower() == 'collection':
                 # we have reached a leaf node
-                if (('gee:type' in response_dict) and
-                    (response_dict['gee:type'].lower() in ['image_collection', 'image'])):
+                if response_dict.get('gee:type', '').lower() in ['image_collection', 'image']:
                     # we have reached an image / image collection leaf node
-                    with self._lock:
-                        url_dict[response_dict['id']] = url
-                        logger.debug(f'ID: {response_dict["id"]}, Type: {response_dict["gee:type"]}, URL: {url}')
-                return url_dict
-
-            with ThreadPoolExecutor() as executor:
-                # traverse the sub-tree links in a thread pool
-                futures = []
-                for link in response_dict['links']:
-                    if link['rel'].lower() == 'child':
-                        futures.append(executor.submit(self._traverse_stac, link['href'], url_dict))
-                for future in as_completed(futures):
-                    url_dict = future.result()
+                    node['id'] = response_dict['id']
+                    logger.debug(f'ID: {response_dict["id"]}, Type: {response_dict["gee:type"]}, URL: {url}')
+            else:
+                node['children'] = [link['href'] for link in response_dict['links'] if link['rel'].lower() == 'child']
+        return node, False
+
+    def _traverse_stac(self, url: str, url_dict: Dict) -> Dict:
+        """
+        Threaded EE STAC tree traversal that returns the `url_dict` i.e. a dict with image/collection IDs/names as
+        keys, and the corresponding json STAC URLs as values.
+
+        Nodes are fetched from a single work queue by at most :attr:`_crawl_workers` threads.  The ETag & Last-Modified
+        time of each node are persisted between traversals, and used to make conditional requests.  Every node is
+        requested, as a node being unchanged says nothing about its descendants, but unchanged nodes are not re-parsed.
+        """
+        prev_state = self._read_crawl_state()
+        state = {}
+        queued = {url}
+        num_unchanged = 0
+
+        bar_format = '{desc}: |{bar}| {n_fmt}/{total_fmt} nodes [{elapsed}<{remaining}]'
+        with ThreadPoolExecutor(max_workers=self._crawl_workers) as executor, tqdm(
+            desc='Crawling EE STAC', total=1, bar_format=bar_format, dynamic_ncols=True, leave=False
+        ) as bar:  # yapf: disable
+            futures = {executor.submit(self._fetch_stac_node, url, prev_state.get(url, None)): url}
+            while len(futures) > 0:
+                done, _ = wait(futures, return_when=FIRST_COMPLETED)
+                for future in done:
+                    node_url = futures.pop(future)
+                    bar.update(1)
+                    try:
+                        node, unchanged = future.result()
+                    except Exception as ex:
+                        logger.warning(f'Error reading {node_url}: {str(ex)}')
+                        continue
+                    if not node:
+                        continue
+
+                    num_unchanged += unchanged
+                    state[node_url] = node
+                    if node['id']:
+                        url_dict[node['id']] = node_url
+                    for child_url in node['children']:
+                        if child_url not in queued:
+                            queued.add(child_url)
+                            future = executor.submit(self._fetch_stac_node, child_url, prev_state.get(child_url, None))
+                            futures[future] = child_url
+                            bar.total += 1
+
+        logger.debug(f'Crawled {len(state)} EE STAC nodes, of which {num_unchanged} were unchanged.')
+        # write the state of visited nodes only, so that nodes removed from EE STAC are dropped
+        self._write_crawl_state(state)
         return url_dict
 
     def refresh_url_dict(self):
@@ -179,6 +315,63 @@ class StacCatalog:
         with open(filename, 'w') as f:
             json.dump(self.url_dict, f)
 
+    @staticmethod
+    def _cache_filename(name: str):
+        """ Return the path of the on-disk cache file for a given image/collection name. """
+        return utils.cache_dir().joinpath('stac', name.replace('/', '_') + '.json')
+
+    def _read_cached_item(self, name: str) -> Union[Dict, None]:
+        """ Read the on-disk cache entry for a given image/collection name, if it exists. """
+        filename = self._cache_filename(name)
+        try:
+            with open(filename, 'r') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            # the entry does not exist, or is corrupt
+            return None
+
+    def _write_cached_item(self, name: str, item_dict: Dict, etag: str = None):
+        """ Atomically write an on-disk cache entry for a given image/collection name. """
+        filename = self._cache_filename(name)
+        try:
+            filename.parent.mkdir(parents=True, exist_ok=True)
+            # write to a temporary file unique to this process & thread, then replace, so that concurrent processes
+            # never read a partially written entry
+            tmp_filename = filename.with_suffix(f'.{os.getpid()}.{threading.get_ident()}.tmp')
+            with open(tmp_filename, 'w') as f:
+                json.dump(dict(time=time.time(), etag=etag, item=item_dict), f)
+            os.replace(tmp_filename, filename)
+        except OSError as ex:
+            logger.debug(f'Could not write STAC cache entry for {name}: {str(ex)}')
+
+    def _fetch_item_dict(self, name: str) -> Dict:
+        """
+        Fetch the raw STAC dict for a given image/collection name, using the on-disk cache where it is fresh, and
+        revalidating it with its ETag where it is stale.
+        """
+        cached = self._read_cached_item(name)
+        if cached and (time.time() - cached['time']) < self._cache_ttl:
+            return cached['item']
+
+        headers = {'If-None-Match': cached['etag']} if cached and cached['etag'] else {}
+        try:
+            response = self._session.get(self.url_dict[name], headers=headers)
+            if cached and (response.status_code == 304):
+                # the cached entry is unchanged, so refresh its time
+                self._write_cached_item(name, cached['item'], etag=cached['etag'])
+                return cached['item']
+            response.raise_for_status()
+            item_dict = response.json()
+        except Exception as ex:
+            if not cached:
+                raise ex
+            # use the stale entry as is, without refreshing its time, so that it is revalidated on the next request
+            logger.warning(f'Could not revalidate the cached STAC entry for {name}, using it as is: {str(ex)}')
+            return cached['item']
+
+        self._write_cached_item(name, item_dict, etag=response.headers.get('ETag', None))
+        return item_dict
+
     def get_item_dict(self, name: str):
         """
         Get the raw STAC dict for a given an image/collection name/ID.
@@ -197,15 +390,22 @@ class StacCatalog:
         if coll_name in self.url_dict:
             name = coll_name
 
-        # store item dicts in a cache so we don't have to request them more than once
+        # store item dicts in memory and on-disk caches so we don't have to request them more than once, and
+        # de-duplicate concurrent requests for the same item
+        if name not in self._cache:
+            self._single_flight.do(name, self._load_item_dict, name)
+        return self._cache[name]
+
+    def _load_item_dict(self, name: str):
+        """ Load the raw STAC dict for a given image/collection name into the memory cache, if it is not there. """
         if name not in self._cache:
             if name not in self.url_dict:
                 logger.warning(f'There is no STAC entry for: {name}')
                 self._cache[name] = None
+            elif name in self.snapshot:
+                self._cache[name] = self.snapshot[name]
             else:
-                response = self._session.get(self.url_dict[name])
-                self._cache[name] = response.json()
-        return self._cache[name]
+                self._cache[name] = self._fetch_item_dict(name)
 
     def get_item(self, name: str) -> StacItem:
         """
@@ -20,13 +20,14 @@ from io import BytesIO
 import numpy as np
 import requests
 from rasterio import Affine, MemoryFile
+from rasterio.enums import MaskFlags
 from rasterio.windows import Window
 from tqdm.auto import tqdm
 
 
 class Tile:
 
-    def __init__(self, exp_image, window: Window):
+    def __init__(self, exp_image, window: Window, ee_image=None):
         """
         Class for downloading an Earth Engine image tile (a rectangular region of interest in the image).
 
@@ -36,8 +37,12 @@ class Tile:
             BaseImage instance to derive the tile from.
         window: Window
             rasterio window into `exp_image`, specifying the region of interest for this tile.
+        ee_image: ee.Image, optional
+            Earth Engine image to download the tile from, in place of the `exp_image` Earth Engine image.  Should have
+            the same bands and data type as `exp_image`.
         """
         self._exp_image = exp_image
+        self._ee_image = ee_image if ee_image is not None else exp_image.ee_image
         self._window = window
         # offset the image geo-transform origin so that it corresponds to the UL corner of the tile.
         self._transform = exp_image.transform * Affine.translation(window.col_off, window.row_off)
@@ -51,7 +56,7 @@ class Tile:
     def _get_download_url_response(self, session=None):
         """ Get tile download url and response. """
         session = session if session else requests
-        url = self._exp_image.ee_image.getDownloadURL(
+        url = self._ee_image.getDownloadURL(
             dict(
                 crs=self._exp_image.crs, crs_transform=tuple(self._transform)[:6], dimensions=self._shape[::-1],
                 filePerBand=False, fileFormat='GeoTIFF'
@@ -59,9 +64,9 @@ class Tile:
         )
         return session.get(url, stream=True), url
 
-    def download(self, session=None, response=None, bar: tqdm = None):
+    def download(self, session=None, response=None, bar: tqdm = None, masked: bool = False):
         """
-        Download the image tile into a numpy array.
+        Download the image tile into a numpy array, and optionally, its mask.
 
         Parameters
         ----------
@@ -71,11 +76,17 @@ class Tile:
             Response to a get request on the tile download url.
         bar: tqdm, optional
             tqdm propgress bar instance to update with incremental (0-1) download progress.
+        masked: bool, optional
+            Whether to also return the tile mask.
 
         Returns
         -------
         array: numpy.ndarray
             3D numpy array of the tile pixel data with bands down the first dimension.
+        mask: numpy.ndarray, None
+            3D boolean numpy array that is True for masked pixels, with the same shape as ``array``.  Only returned
+            when ``masked`` is True.  None when the mask is already encoded as NaN pixels in a floating point
+            ``array``, or the downloaded GeoTIFF has no nodata value or internal mask.
         """
 
         # get image download url and response
@@ -111,5 +122,10 @@ class Tile:
                     # GEE sets nodata to -inf for float data types, (but does not populate the nodata field).
                     # rasterio won't allow nodata=-inf, so this is a workaround to change nodata to nan at source.
                     array[np.isinf(array)] = np.nan
+                    mask = None
+                elif ds.nodata is None and all([flags == [MaskFlags.all_valid] for flags in ds.mask_flag_enums]):
+                    mask = None
+                else:
+                    mask = ds.read_masks() == 0
 
-        return array
+        return (array, mask) if masked else array
@@ -21,8 +21,9 @@ import os
 import pathlib
 import sys
 import time
-from threading import Thread
-from typing import Tuple
+from concurrent.futures import Future
+from threading import Lock, Thread
+from typing import Callable, Dict, Hashable, Tuple
 
 import ee
 import rasterio as rio
@@ -179,6 +180,40 @@ def get_projection(image, min_scale=True):
     return ee.Projection(bands.iterate(compare_scale, init_proj))
 
 
+class SingleFlight:
+
+    def __init__(self):
+        """
+        Thread-safe de-duplication of concurrent calls.  Calls to :meth:`do` with the same key, while a call with that
+        key is in flight, wait for and share its result, rather than repeating it.
+        """
+        self._lock = Lock()
+        self._futures: Dict[Hashable, Future] = {}
+
+    def do(self, key: Hashable, func: Callable, *args, **kwargs):
+        """
+        Call ``func(*args, **kwargs)``, or wait for the in-flight call with the same ``key``, and return its result.
+        Exceptions raised by the call are raised in all waiting threads.
+        """
+        with self._lock:
+            future = self._futures.get(key, None)
+            leader = future is None
+            if leader:
+                future = self._futures[key] = Future()
+
+        if not leader:
+            return future.result()
+
+        try:
+            future.set_result(func(*args, **kwargs))
+        except BaseException as ex:
+            future.set_exception(ex)
+        finally:
+            with self._lock:
+                del self._futures[key]
+        return future.result()
+
+
 class Spinner(Thread):
 
     def __init__(self, label='', interval=0.2, leave=True, **kwargs):
@@ -293,3 +328,18 @@ def retry_session(
     session.mount('http://', adapter)
     session.mount('https://', adapter)
     return session
+
+
+def cache_dir() -> pathlib.Path:
+    """
+    Return the geedim cache directory, creating it if it does not exist.  The directory is read from the
+    `GEEDIM_CACHE_DIR` environment variable if it exists, otherwise it defaults to the platform's user cache directory.
+    """
+    if 'GEEDIM_CACHE_DIR' in os.environ:
+        path = pathlib.Path(os.environ['GEEDIM_CACHE_DIR'])
+    elif sys.platform == 'win32':
+        path = pathlib.Path(os.environ.get('LOCALAPPDATA', pathlib.Path.home())).joinpath('geedim', 'cache')
+    else:
+        path = pathlib.Path(os.environ.get('XDG_CACHE_HOME', pathlib.Path.home().joinpath('.cache'))).joinpath('geedim')
+    path.mkdir(parents=True, exist_ok=True)
+    return path
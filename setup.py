@@ -47,7 +47,7 @@ setup(
     url='https://github.com/dugalh/geedim',
     license='Apache-2.0',
     packages=find_packages(include=['geedim']),
-    package_data={'geedim': ['data/ee_stac_urls.json']},
+    package_data={'geedim': ['data/ee_stac_urls.json', 'data/ee_stac_snapshot.json']},
     install_requires=[
         'numpy>=1.19',
         'rasterio>=1.1',
@@ -57,7 +57,7 @@ setup(
         'requests>=2.2',
         'tabulate>=0.8',
     ],
-    python_requires='>=3.6',
+    python_requires='>=3.7',
     classifiers=[
         'Programming Language :: Python :: 3',
         'License :: OSI Approved :: Apache Software License',
@@ -0,0 +1,114 @@
+"""
+    Copyright 2021 Dugal Harris - dugalh@gmail.com
+
+    Licensed under the Apache License, Version 2.0 (the "License");
+    you may not use this file except in compliance with the License.
+    You may obtain a copy of the License at
+
+       http://www.apache.org/licenses/LICENSE-2.0
+
+    Unless required by applicable law or agreed to in writing, software
+    distributed under the License is distributed on an "AS IS" BASIS,
+    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+    See the License for the specific language governing permissions and
+    limitations under the License.
+"""
+import json
+import pathlib
+from typing import Dict, List
+
+import pytest
+from geedim import batch
+from geedim.batch import JobQueue, read_jobs, run_jobs
+
+
+@pytest.fixture
+def jobs() -> List[Dict]:
+    """ A list of synthetic jobs. """
+    return [
+        dict(id='A/B/image1', bbox=[23, -34, 23.1, -33.9], scale=30, mask=True),
+        dict(id=['A/B/image1', 'A/B/image2'], method='mosaic', region='region.geojson'),
+        dict(collection='A/B', start_date='2022-01-01', end_date='2022-02-01', cloudless_portion=50),
+    ]  # yapf: disable
+
+
+def test_read_jobs(jobs: List[Dict], tmp_path: pathlib.Path):
+    """ Test read_jobs() reads the same jobs from CSV and JSON files. """
+    json_file = tmp_path.joinpath('jobs.json')
+    with open(json_file, 'w') as f:
+        json.dump(jobs, f)
+    assert read_jobs(json_file) == jobs
+
+    csv_file = tmp_path.joinpath('jobs.csv')
+    with open(csv_file, 'w') as f:
+        f.write('id,collection,start_date,end_date,cloudless_portion,method,region,bbox,scale,mask\n')
+        f.write('A/B/image1,,,,,,,"[23, -34, 23.1, -33.9]",30,true\n')
+        f.write('"[""A/B/image1"", ""A/B/image2""]",,,,,mosaic,region.geojson,,,\n')
+        f.write(',A/B,2022-01-01,2022-02-01,50,,,,,\n')
+    assert read_jobs(csv_file) == jobs
+
+
+@pytest.mark.parametrize(
+    'file_jobs, filename', [
+        ([dict(id='A/B/image1', unknown=1)], 'jobs.json'),
+        ([dict(method='mosaic')], 'jobs.json'),
+        ([dict(id='A/B/image1', collection='A/B')], 'jobs.json'),
+        (dict(id='A/B/image1'), 'jobs.json'),
+        ([dict(id='A/B/image1')], 'jobs.txt'),
+    ]
+)  # yapf: disable
+def test_read_jobs_error(file_jobs, filename: str, tmp_path: pathlib.Path):
+    """ Test read_jobs() raises an error with invalid jobs, or an unsupported file type. """
+    filename = tmp_path.joinpath(filename)
+    with open(filename, 'w') as f:
+        json.dump(file_jobs, f)
+    with pytest.raises(ValueError):
+        read_jobs(filename)
+
+
+def test_job_queue(jobs: List[Dict], tmp_path: pathlib.Path):
+    """ Test JobQueue adds jobs once only, records their states, and resumes unfinished jobs. """
+    filename = tmp_path.joinpath('queue.db')
+    with JobQueue(filename) as queue:
+        keys = queue.add(jobs)
+        assert queue.add(jobs) == keys
+        assert [job for key, job in queue.get_pending()] == jobs
+        queue.set_state(keys[0], queue.done)
+        queue.set_state(keys[1], queue.running)
+        queue.set_state(keys[2], queue.failed, error='error')
+        assert queue.get_state(keys[2]) == (queue.failed, 'error')
+        assert len(queue.get_pending()) == 0
+
+    with JobQueue(filename) as queue:
+        queue.resume()
+        assert [key for key, job in queue.get_pending()] == [keys[1]]
+        queue.resume(retry_failed=True)
+        assert [key for key, job in queue.get_pending()] == keys[1:]
+        assert queue.get_counts() == {queue.pending: 2, queue.running: 0, queue.done: 1, queue.failed: 0}
+        assert queue.get_counts(keys=keys[:1]) == {queue.pending: 0, queue.running: 0, queue.done: 1, queue.failed: 0}
+        with pytest.raises(ValueError):
+            queue.get_state('unknown')
+
+
+def test_run_jobs(jobs: List[Dict], tmp_path: pathlib.Path, monkeypatch: pytest.MonkeyPatch):
+    """ Test run_jobs() runs pending jobs, and records their states. """
+    run = []
+
+    def run_job(job: Dict, num_threads: int = None):
+        assert num_threads == 2
+        run.append(job)
+        if 'collection' in job:
+            raise ValueError('error')
+
+    monkeypatch.setattr(batch, 'run_job', run_job)
+    with JobQueue(tmp_path.joinpath('queue.db')) as queue:
+        keys = queue.add(jobs)
+        counts = run_jobs(queue, max_jobs=2, max_threads=4)
+        assert counts == {queue.pending: 0, queue.running: 0, queue.done: 2, queue.failed: 1}
+        assert sorted(run, key=jobs.index) == jobs
+        assert queue.get_state(keys[2]) == (queue.failed, 'error')
+
+        # test completed jobs are not re-run
+        run = []
+        run_jobs(queue, max_jobs=2, max_threads=4)
+        assert len(run) == 0
@@ -15,15 +15,21 @@
 """
 import json
 import pathlib
+import subprocess
+import sys
 from datetime import datetime
 from glob import glob
 from typing import List, Dict
 
+import ee
 import numpy as np
 import pytest
 import rasterio as rio
 from click.testing import CliRunner
+from geedim import cli as cli_module
 from geedim.cli import cli
+from geedim.download import BaseImage
+from geedim.mask import MaskedImage
 from geedim.utils import root_path
 from rasterio.coords import BoundingBox
 from rasterio.crs import CRS
@@ -31,6 +37,25 @@ from rasterio.features import bounds
 from rasterio.warp import transform_geom
 
 
+def test_lazy_imports():
+    """ Test importing the CLI, and getting its help, does not import ee, rasterio or numpy. """
+    code = (
+        'import sys; from click.testing import CliRunner; from geedim.cli import cli; '
+        'CliRunner().invoke(cli, ["download", "--help"]); '
+        'print(*[mod in sys.modules for mod in ["ee", "rasterio", "numpy"]])'
+    )
+    result = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True, check=True)
+    assert result.stdout.split() == ['False'] * 3
+
+
+def test_lazy_defaults():
+    """ Test the CLI copies of image defaults match the originals. """
+    assert cli_module._default_resampling == BaseImage._default_resampling
+    assert cli_module._default_mask == MaskedImage._default_mask
+    for dtype in cli_module._dtypes:
+        BaseImage._convert_dtype(ee.Image(1), dtype)  # raises TypeError if the dtype is not supported
+
+
 @pytest.fixture
 def runner():
     """ click runner for command line execution. """
@@ -319,6 +344,20 @@ def test_download_params(
     _test_downloaded_file(out_file, region=region, crs=crs, scale=scale, dtype=dtype, scale_offset=scale_offset)
 
 
+def test_download_pack_masks(
+    l9_image_id: str, region_25ha_file: pathlib.Path, tmp_path: pathlib.Path, runner: CliRunner
+):
+    """ Test image download with --pack-masks replaces the mask bands with a MASK_BITS band. """
+    out_file = tmp_path.joinpath(l9_image_id.replace('/', '-') + '.tif')
+    cli_str = f'download -i {l9_image_id} -r {region_25ha_file} -dd {tmp_path} --mask --pack-masks'
+    result = runner.invoke(cli, cli_str.split())
+    assert (result.exit_code == 0)
+    assert (out_file.exists())
+    with rio.open(out_file, 'r') as ds:
+        assert 'MASK_BITS' in ds.descriptions
+        assert not any([desc.endswith('_MASK') for desc in ds.descriptions])
+
+
 def test_export_params(l8_image_id: str, region_25ha_file: pathlib.Path, runner: CliRunner):
     """ Test export starts ok, specifying all cli params"""
     cli_str = (
@@ -428,3 +467,42 @@ def test_search_composite_x2_download(region_25ha_file, runner: CliRunner, tmp_p
     with open(region_25ha_file) as f:
         region = json.load(f)
     _test_downloaded_file(out_files[0], region=region, crs='EPSG:3857', scale=30)
+
+
+def test_batch(l9_image_id: str, region_25ha_file: pathlib.Path, tmp_path: pathlib.Path, runner: CliRunner):
+    """ Test the batch command downloads the jobs in a job file, and skips completed jobs when it is re-run. """
+    job_file = tmp_path.joinpath('jobs.json')
+    jobs = [
+        dict(id=l9_image_id, region=str(region_25ha_file), download_dir=str(tmp_path)),
+        dict(id='unknown/image/id', region=str(region_25ha_file), download_dir=str(tmp_path)),
+    ]
+    with open(job_file, 'w') as f:
+        json.dump(jobs, f)
+
+    result = runner.invoke(cli, ['batch', str(job_file)])
+    assert result.exit_code != 0
+    assert '1 job(s) failed' in result.output
+    out_file = tmp_path.joinpath(l9_image_id.replace('/', '-') + '.tif')
+    assert out_file.exists()
+    assert tmp_path.joinpath('jobs.queue.db').exists()
+
+    # test the completed job is not re-run
+    out_file.unlink()
+    result = runner.invoke(cli, ['batch', str(job_file)])
+    assert '1 job(s) failed' in result.output
+    assert not out_file.exists()
+
+
+
+def test_stac_snapshot(runner: CliRunner, tmp_path: pathlib.Path):
+    """ Test the stac-snapshot command writes STAC entries for the supported collections. """
+    from geedim.schema import collection_schema
+
+    snapshot_file = tmp_path.joinpath('snapshot.json')
+    result = runner.invoke(cli, ['stac-snapshot', '--output', str(snapshot_file)])
+    assert result.exit_code == 0
+    with open(snapshot_file, 'r') as f:
+        snapshot = json.load(f)
+    assert 'LANDSAT/LC09/C02/T1_L2' in snapshot
+    assert set(snapshot.keys()).issubset(collection_schema.keys())
+    assert all(['summaries' in item_dict for item_dict in snapshot.values()])
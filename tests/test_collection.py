@@ -13,17 +13,20 @@
     See the License for the specific language governing permissions and
     limitations under the License.
 """
+import pathlib
 from datetime import datetime
 from typing import List, Union, Dict
 
 import ee
 import numpy as np
 import pytest
-from geedim import schema
+import rasterio as rio
+from geedim import schema, medoid
 from geedim.collection import MaskedCollection
+from geedim.download import BaseImage
 from geedim.enums import CompositeMethod, ResamplingMethod
 from geedim.errors import UnfilteredError, InputImageError
-from geedim.mask import MaskedImage
+from geedim.mask import MaskedImage, Sentinel2ClImage
 from geedim.utils import split_id, get_projection
 
 from .conftest import get_image_std
@@ -226,6 +229,154 @@ def test_search(
     assert np.all(sorted(im_dates) == im_dates)
 
 
+@pytest.mark.parametrize('name, cdi_thresh', [('COPERNICUS/S2_SR', None), ('COPERNICUS/S2_SR_HARMONIZED', -0.5)])
+def test_search_s2_join(name: str, cdi_thresh: float, region_100ha: Dict):
+    """
+    Test MaskedCollection joins cloud probability (and TOA) images to Sentinel-2 images, and that the joined images
+    give the same cloud masks as the corresponding images found image by image.
+    """
+    gd_collection = MaskedCollection.from_name(name)
+    filt_collection = gd_collection.search('2022-01-01', '2022-01-10', region_100ha, cdi_thresh=cdi_thresh)
+    first_image = filt_collection.ee_collection.first()
+    prop_names = first_image.propertyNames().getInfo()
+    assert Sentinel2ClImage._cloud_prob_property in prop_names
+    if cdi_thresh is not None:
+        assert Sentinel2ClImage._toa_property in prop_names
+
+    im_id, im_props = list(filt_collection.properties.items())[0]
+    gd_image = MaskedImage.from_id(im_id, cdi_thresh=cdi_thresh)
+    gd_image._set_region_stats(region_100ha, scale=gd_collection._stats_scale)
+    assert gd_image.properties['CLOUDLESS_PORTION'] == pytest.approx(im_props['CLOUDLESS_PORTION'], abs=1e-3)
+
+
+@pytest.mark.parametrize('page_size', [1, 2, 100])
+def test_iter_properties(page_size: int, region_100ha: Dict):
+    """ Test MaskedCollection.iter_properties() retrieves the same properties, in the same order, for any page size. """
+    gd_collection = MaskedCollection.from_name('LANDSAT/LC09/C02/T1_L2')
+    filt_collection = gd_collection.search('2022-01-01', '2022-04-01', region_100ha)
+    ref_properties = filt_collection._get_properties(filt_collection.ee_collection)
+    assert len(ref_properties) > 2
+
+    properties = dict(filt_collection.iter_properties(page_size=page_size, num_threads=2))
+    assert list(properties.keys()) == list(ref_properties.keys())
+    assert list(properties.values()) == list(ref_properties.values())
+    assert filt_collection.properties == ref_properties
+
+
+@pytest.mark.parametrize('split_days', [1, 10, 365])
+def test_search_split_days(split_days: int, region_100ha: Dict):
+    """ Test MaskedCollection.search() gives the same results with and without splitting the date range. """
+    gd_collection = MaskedCollection.from_name('LANDSAT/LC08/C02/T1_L2')
+    search_args = ('2022-01-01', '2022-03-01', region_100ha)
+    ref_collection = gd_collection.search(*search_args, cloudless_portion=20)
+    split_collection = gd_collection.search(*search_args, cloudless_portion=20, split_days=split_days)
+    assert len(split_collection.properties) > 0
+    assert split_collection.properties == ref_collection.properties
+    assert list(split_collection.properties.keys()) == list(ref_collection.properties.keys())
+    assert split_collection.ee_collection.size().getInfo() == len(ref_collection.properties)
+
+
+@pytest.mark.parametrize(
+    'start_date, end_date, split_days, exp_num', [
+        (datetime(2022, 1, 1), datetime(2022, 1, 11, 12), 5, 3),
+        (datetime(2022, 1, 1), datetime(2022, 1, 1, 0, 0, 0, 1000), 5, 1),
+        (datetime(2022, 1, 1), datetime(2022, 1, 2), 0.25, 4),
+        (datetime(2022, 1, 1), datetime(2022, 1, 11), 5, 2),
+    ]
+)  # yapf: disable
+def test_split_dates(start_date: datetime, end_date: datetime, split_days: float, exp_num: int):
+    """ Test MaskedCollection._split_dates() covers the whole date range, including sub-day and partial intervals. """
+    intervals = MaskedCollection._split_dates(start_date, end_date, split_days)
+    assert len(intervals) == exp_num
+    assert intervals[0][0] == start_date
+    assert intervals[-1][1] == end_date
+    assert all([intervals[i][1] == intervals[i + 1][0] for i in range(len(intervals) - 1)])
+    assert all([start < end for start, end in intervals])
+
+
+@pytest.mark.parametrize(
+    'name, cloud_cover_property', [
+        ('LANDSAT/LC08/C02/T1_L2', 'CLOUD_COVER'), ('COPERNICUS/S2_SR_HARMONIZED', 'CLOUDY_PIXEL_PERCENTAGE')
+    ]
+)
+def test_search_prefilter_margin(name: str, cloud_cover_property: str, region_100ha: Dict):
+    """ Test MaskedCollection.search() with ``prefilter_margin`` excludes images with too much granule cloud cover, and
+    retains images meeting the ``cloudless_portion`` threshold when the margin is sufficient.
+    """
+    gd_collection = MaskedCollection.from_name(name)
+    search_args = ('2022-01-01', '2022-03-01', region_100ha)
+    ref_collection = gd_collection.search(*search_args, cloudless_portion=50)
+    prefilt_collection = gd_collection.search(*search_args, cloudless_portion=50, prefilter_margin=100)
+    assert prefilt_collection.properties == ref_collection.properties
+
+    prefilt_collection = gd_collection.search(*search_args, cloudless_portion=50, prefilter_margin=0)
+    cover = prefilt_collection.ee_collection.aggregate_array(cloud_cover_property).getInfo()
+    assert all([c <= 50 for c in cover])
+    assert set(prefilt_collection.properties.keys()).issubset(ref_collection.properties.keys())
+
+
+def test_search_deferred_stats(region_100ha: Dict):
+    """ Test MaskedCollection.search() without portion thresholds defers region statistics to property retrieval. """
+    gd_collection = MaskedCollection.from_name('LANDSAT/LC08/C02/T1_L2')
+    searched_collection = gd_collection.search('2022-01-01', '2022-02-01', region_100ha)
+    assert searched_collection._region_stats is not None
+    first_props = searched_collection.ee_collection.first().propertyNames().getInfo()
+    assert 'FILL_PORTION' not in first_props and 'CLOUDLESS_PORTION' not in first_props
+
+    properties = searched_collection.properties
+    assert len(properties) > 0
+    for prop_dict in properties.values():
+        assert 'FILL_PORTION' in prop_dict and 'CLOUDLESS_PORTION' in prop_dict
+
+    # region statistics are found in the search when there is a threshold
+    searched_collection = gd_collection.search('2022-01-01', '2022-02-01', region_100ha, fill_portion=1)
+    assert searched_collection._region_stats is None
+    assert 'FILL_PORTION' in searched_collection.ee_collection.first().propertyNames().getInfo()
+
+
+def test_search_stats_scale(region_10000ha: Dict):
+    """ Test MaskedCollection.search() with coarse scale region statistics, with and without refining. """
+    gd_collection = MaskedCollection.from_name('COPERNICUS/S2_SR_HARMONIZED')
+    search_args = ('2022-01-01', '2022-02-01', region_10000ha)
+    ref_collection = gd_collection.search(*search_args, cloudless_portion=40)
+    coarse_collection = gd_collection.search(*search_args, cloudless_portion=40, stats_scale=200)
+    assert len(coarse_collection.properties) > 0
+    for prop_dict in coarse_collection.properties.values():
+        assert prop_dict['CLOUDLESS_PORTION'] >= 40
+
+    # a tolerance of 100% re-finds all portions at the nominal scale
+    refined_collection = gd_collection.search(
+        *search_args, cloudless_portion=40, stats_scale=200, stats_tolerance=100
+    )
+    assert refined_collection.properties == ref_collection.properties
+
+
+def test_search_incremental(region_100ha: Dict, tmp_path: pathlib.Path, monkeypatch: pytest.MonkeyPatch):
+    """ Test MaskedCollection.search() with ``incremental=True`` caches results, and merges them with new results. """
+    monkeypatch.setenv('GEEDIM_CACHE_DIR', str(tmp_path))
+    gd_collection = MaskedCollection.from_name('LANDSAT/LC08/C02/T1_L2')
+    ref_collection = gd_collection.search('2022-01-01', '2022-03-01', region_100ha, cloudless_portion=20)
+
+    # populate the cache with part of the date range, then search the whole date range
+    first_collection = gd_collection.search(
+        '2022-01-01', '2022-02-01', region_100ha, cloudless_portion=20, incremental=True
+    )
+    assert len(list(tmp_path.glob('search/*.json'))) == 1
+    inc_collection = gd_collection.search(
+        '2022-01-01', '2022-03-01', region_100ha, cloudless_portion=20, incremental=True
+    )
+    assert len(first_collection.properties) > 0
+    assert set(first_collection.properties.keys()).issubset(inc_collection.properties.keys())
+    assert list(inc_collection.properties.keys()) == list(ref_collection.properties.keys())
+    assert inc_collection.ee_collection.size().getInfo() == len(ref_collection.properties)
+
+    # test the cached results are filtered to the search dates
+    inc_collection = gd_collection.search(
+        '2022-01-01', '2022-02-01', region_100ha, cloudless_portion=20, incremental=True
+    )
+    assert list(inc_collection.properties.keys()) == list(first_collection.properties.keys())
+
+
 def test_empty_search(region_100ha):
     """ Test MaskedCollection.search() for empty search results. """
     gd_collection = MaskedCollection.from_name('LANDSAT/LC09/C02/T1_L2')
@@ -447,6 +598,34 @@ def test_composite(image_list, method, mask, region, date, cloud_kwargs, request
     assert 'INPUT_IMAGES' in comp_im.properties
 
 
+@pytest.mark.parametrize(
+    'method, exp_cloud_dist', [(CompositeMethod.q_mosaic, True), (CompositeMethod.median, False)]
+)  # yapf: disable
+def test_composite_cloud_dist(s2_sr_image_list: List, method: CompositeMethod, exp_cloud_dist: bool):
+    """ Test MaskedCollection.composite() only finds CLOUD_DIST for the q-mosaic method. """
+    gd_collection = MaskedCollection.from_list(s2_sr_image_list)
+    comp_im = gd_collection.composite(method=method)
+    assert ('CLOUD_DIST' in comp_im.ee_image.bandNames().getInfo()) == exp_cloud_dist
+
+
+@pytest.mark.parametrize('discard_zeros', [True, False])
+def test_array_medoid(s2_sr_image_list: List, discard_zeros: bool, region_100ha: Dict):
+    """ Test medoid.array_medoid() gives the same composite as the iterative medoid.medoid(). """
+    gd_collection = MaskedCollection.from_list(s2_sr_image_list)
+    ee_collection = gd_collection._prepare_for_composite(method=CompositeMethod.medoid)
+    bands = gd_collection.refl_bands
+    array_image = medoid.array_medoid(ee_collection, bands=bands, discard_zeros=discard_zeros)
+    iter_image = medoid.medoid(ee_collection, bands=bands, discard_zeros=discard_zeros)
+
+    def region_mean(ee_image: ee.Image) -> Dict:
+        return ee_image.select(bands).reduceRegion('mean', geometry=region_100ha, scale=10).getInfo()
+
+    array_mean = region_mean(array_image)
+    iter_mean = region_mean(iter_image)
+    assert array_mean == pytest.approx(iter_mean, rel=1e-3)
+    assert array_image.bandNames().getInfo() == iter_image.bandNames().getInfo()
+
+
 def test_composite_errors(gedi_image_list, region_100ha):
     """ Test MaskedCollection.composite() error conditions. """
     gedi_collection = MaskedCollection.from_list(gedi_image_list)
@@ -479,6 +658,22 @@ def test_composite_date(image_list: str, request: pytest.FixtureRequest):
     assert comp_im.date == first_date
 
 
+@pytest.mark.parametrize('cache_properties', [True, False])
+def test_composite_input_images(region_100ha: Dict, cache_properties: bool):
+    """ Test MaskedCollection.composite() lists all input images in INPUT_IMAGES, with and without cached properties. """
+    gd_collection = MaskedCollection.from_name('LANDSAT/LC08/C02/T1_L2')
+    filt_collection = gd_collection.search('2022-01-01', '2022-02-01', region_100ha)
+    if cache_properties:
+        _ = filt_collection.properties
+    else:
+        assert filt_collection._properties is None
+    comp_im = filt_collection.composite()
+    im_ids = filt_collection.ee_collection.aggregate_array('system:id').getInfo()
+    assert len(im_ids) > 0
+    for im_id in im_ids:
+        assert split_id(im_id)[1] in comp_im.properties['INPUT_IMAGES']
+
+
 def test_composite_mult_kwargs(region_100ha):
     """
     When a search filtered collection is composited, test that masks change with different cloud/shadow kwargs i.e.
@@ -496,3 +691,152 @@ def test_composite_mult_kwargs(region_100ha):
     cp_prob40 = comp_im_prob40.properties['CLOUDLESS_PORTION']
 
     assert cp_prob80 != pytest.approx(cp_prob40, abs=1e-1)
+
+
+@pytest.mark.parametrize('image_list, bands', [('s2_sr_image_list', ['B4', 'B8']), ('l8_9_image_list', None)])
+def test_download_stack(image_list: str, bands: List, region_25ha: Dict, tmp_path: pathlib.Path, request):
+    """ Test MaskedCollection.download_stack() downloads a stack of the collection images, with per-band metadata. """
+    image_list: List = request.getfixturevalue(image_list)
+    gd_collection = MaskedCollection.from_list(image_list)
+    filename = tmp_path.joinpath('test_stack.tif')
+    gd_collection.download_stack(filename, region=region_25ha, bands=bands)
+    assert filename.exists()
+
+    im_ids = list(gd_collection.properties.keys())
+    with rio.open(filename, 'r') as ds:
+        assert 'STACK_IMAGES' in ds.tags()
+        assert ds.count % len(im_ids) == 0
+        num_bands = ds.count // len(im_ids)
+        if bands:
+            assert num_bands == len(bands)
+        # test bands are ordered by image, and labelled with their source image id and capture time
+        for band_i in range(ds.count):
+            band_dict = ds.tags(band_i + 1)
+            im_id = im_ids[band_i // num_bands]
+            assert band_dict['system-id'] == im_id
+            assert int(band_dict['system-time_start']) == gd_collection.properties[im_id]['system:time_start']
+            assert ds.descriptions[band_i].startswith(split_id(im_id)[1])
+
+
+def test_download_stack_errors(gedi_image_list: List, region_25ha: Dict, tmp_path: pathlib.Path):
+    """ Test MaskedCollection.download_stack() error conditions. """
+    with pytest.raises(UnfilteredError):
+        # unfiltered collection
+        MaskedCollection.from_name('LARSE/GEDI/GEDI02_A_002_MONTHLY').download_stack(
+            tmp_path.joinpath('test_stack.tif'), region=region_25ha
+        )
+    with pytest.raises(ValueError):
+        # empty collection
+        gedi_collection = MaskedCollection.from_list(gedi_image_list)
+        empty_collection = gedi_collection.search('2000-01-01', '2000-01-02', region_25ha, 100)
+        empty_collection.download_stack(tmp_path.joinpath('test_stack.tif'), region=region_25ha)
+
+
+@pytest.mark.parametrize(
+    'image_list, method', [
+        ('s2_sr_image_list', CompositeMethod.q_mosaic), ('s2_sr_image_list', CompositeMethod.mosaic),
+        ('l8_9_image_list', CompositeMethod.median), ('l8_9_image_list', CompositeMethod.medoid),
+        ('l8_9_image_list', CompositeMethod.array_medoid), ('gedi_image_list', CompositeMethod.mean),
+    ]
+)  # yapf: disable
+def test_local_composite(
+    image_list: str, method: CompositeMethod, region_25ha: Dict, tmp_path: pathlib.Path, request: pytest.FixtureRequest
+):
+    """ Test MaskedCollection.local_composite() matches the Earth Engine composite. """
+    image_list: List = request.getfixturevalue(image_list)
+    gd_collection = MaskedCollection.from_list(image_list)
+    local_filename = tmp_path.joinpath('local_comp.tif')
+    gd_collection.local_composite(local_filename, method=method, region=region_25ha, dtype='float64')
+
+    ee_filename = tmp_path.joinpath('ee_comp.tif')
+    comp_im = gd_collection.composite(method=method)
+    first_im = MaskedImage(gd_collection.ee_collection.first())
+    comp_im.download(ee_filename, region=region_25ha, crs=first_im.crs, scale=first_im.scale, dtype='float64')
+
+    with rio.open(local_filename, 'r') as local_ds, rio.open(ee_filename, 'r') as ee_ds:
+        assert 'INPUT_IMAGES' in local_ds.tags()
+        assert local_ds.descriptions == ee_ds.descriptions
+        assert local_ds.shape == ee_ds.shape
+        local_array = local_ds.read()
+        ee_array = ee_ds.read()
+        assert np.all(np.isnan(local_array) == np.isnan(ee_array))
+        valid = ~np.isnan(ee_array)
+        assert local_array[valid] == pytest.approx(ee_array[valid], rel=1e-6)
+
+
+@pytest.mark.parametrize(
+    'image_list, method', [
+        ('s2_sr_image_list', CompositeMethod.mosaic), ('l8_9_image_list', CompositeMethod.medoid),
+    ]
+)  # yapf: disable
+def test_local_composite_default_dtype(
+    image_list: str, method: CompositeMethod, region_25ha: Dict, tmp_path: pathlib.Path, request: pytest.FixtureRequest
+):
+    """
+    Test MaskedCollection.local_composite() with the default (integer) data type matches the floating point composite
+    i.e. that valid pixels equal to the integer nodata value are not masked when compositing.
+    """
+    image_list: List = request.getfixturevalue(image_list)
+    gd_collection = MaskedCollection.from_list(image_list)
+    int_filename = tmp_path.joinpath('int_comp.tif')
+    float_filename = tmp_path.joinpath('float_comp.tif')
+    gd_collection.local_composite(int_filename, method=method, region=region_25ha)
+    gd_collection.local_composite(float_filename, method=method, region=region_25ha, dtype='float64')
+
+    with rio.open(int_filename, 'r') as int_ds, rio.open(float_filename, 'r') as float_ds:
+        assert np.issubdtype(np.dtype(int_ds.dtypes[0]), np.integer)
+        int_array = int_ds.read()
+        float_array = float_ds.read()
+        valid = ~np.isnan(float_array)
+        assert np.any(float_array[valid] == 0)
+        assert np.all(int_array[valid] == np.round(float_array[valid]))
+        assert np.all(int_array[~valid] == int_ds.nodata)
+
+
+@pytest.mark.parametrize(
+    'image_list, method', [
+        ('s2_sr_image_list', CompositeMethod.q_mosaic), ('l8_9_image_list', CompositeMethod.median),
+        ('gedi_image_list', CompositeMethod.mosaic),
+    ]
+)  # yapf: disable
+def test_download_composite(
+    image_list: str, method: CompositeMethod, region_100ha: Dict, tmp_path: pathlib.Path,
+    monkeypatch: pytest.MonkeyPatch, request: pytest.FixtureRequest
+):
+    """ Test MaskedCollection.download_composite() matches the downloaded composite() image, with multiple tiles. """
+    image_list: List = request.getfixturevalue(image_list)
+    gd_collection = MaskedCollection.from_list(image_list)
+    first_im = MaskedImage(gd_collection.ee_collection.first())
+    kwargs = dict(region=region_100ha, crs=first_im.crs, scale=first_im.scale, dtype='float32')
+
+    ref_filename = tmp_path.joinpath('ref_comp.tif')
+    gd_collection.composite(method=method).download(ref_filename, **kwargs)
+
+    # force multiple tiles
+    monkeypatch.setattr(BaseImage, '_get_tile_shape', staticmethod(lambda exp_image: ((16, 16), None)))
+    tile_filename = tmp_path.joinpath('tile_comp.tif')
+    gd_collection.download_composite(tile_filename, method=method, **kwargs)
+
+    with rio.open(ref_filename, 'r') as ref_ds, rio.open(tile_filename, 'r') as tile_ds:
+        assert tile_ds.descriptions == ref_ds.descriptions
+        assert tile_ds.shape == ref_ds.shape
+        ref_array = ref_ds.read()
+        tile_array = tile_ds.read()
+        assert np.all(np.isnan(tile_array) == np.isnan(ref_array))
+        valid = ~np.isnan(ref_array)
+        assert tile_array[valid] == pytest.approx(ref_array[valid], rel=1e-6)
+
+
+@pytest.mark.parametrize(
+    'kwargs', [dict(crs='EPSG:3857', scale=30), dict(region_arg=True, scale=30), dict(region_arg=True, crs='EPSG:3857')]
+)
+def test_download_composite_errors(
+    gedi_image_list: List, kwargs: Dict, region_100ha: Dict, tmp_path: pathlib.Path
+):
+    """ Test MaskedCollection.download_composite() raises an error when ``region``, ``crs`` or ``scale`` is missing. """
+    gd_collection = MaskedCollection.from_list(gedi_image_list)
+    if kwargs.pop('region_arg', False):
+        kwargs['region'] = region_100ha
+    with pytest.raises(ValueError) as ex:
+        gd_collection.download_composite(tmp_path.joinpath('tile_comp.tif'), **kwargs)
+    assert 'required' in str(ex.value)
@@ -0,0 +1,83 @@
+"""
+    Copyright 2021 Dugal Harris - dugalh@gmail.com
+
+    Licensed under the Apache License, Version 2.0 (the "License");
+    you may not use this file except in compliance with the License.
+    You may obtain a copy of the License at
+
+       http://www.apache.org/licenses/LICENSE-2.0
+
+    Unless required by applicable law or agreed to in writing, software
+    distributed under the License is distributed on an "AS IS" BASIS,
+    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+    See the License for the specific language governing permissions and
+    limitations under the License.
+"""
+import numpy as np
+import pytest
+from geedim import composite
+from geedim.enums import CompositeMethod
+
+
+@pytest.fixture
+def stack_array() -> np.ndarray:
+    """ A 4D (image, band, row, column) stack array with masked (NaN) pixels. """
+    array = np.random.default_rng(0).random((5, 3, 4, 4))
+    array[1, :, 0, 0] = np.nan
+    array[:, :, 1, 1] = np.nan
+    return array
+
+
+def test_mosaic():
+    """ Test composite.mosaic() selects the last unmasked pixel in the stack. """
+    array = np.array([[1, np.nan, 3], [2, 2, np.nan], [5, np.nan, np.nan], [2, 4, np.nan]]).reshape(4, 1, 1, 3)
+    assert composite.mosaic(array).ravel().tolist() == [2, 4, 3]
+
+
+def test_median_mean_mode():
+    """ Test composite.median(), composite.mean() and composite.mode() ignore masked pixels. """
+    array = np.array([[1, np.nan, 3], [2, 2, np.nan], [5, np.nan, np.nan], [2, 4, np.nan]]).reshape(4, 1, 1, 3)
+    assert composite.median(array).ravel().tolist() == [2, 3, 3]
+    assert composite.mean(array).ravel().tolist() == [2.5, 3, 3]
+    assert composite.mode(array).ravel().tolist() == [2, 2, 3]
+    assert np.all(np.isnan(composite.median(np.full((2, 1, 1, 1), np.nan))))
+
+
+def test_q_mosaic(stack_array: np.ndarray):
+    """ Test composite.q_mosaic() selects all bands from the pixel with the maximum cloud distance band. """
+    comp_array = composite.q_mosaic(stack_array, 0)
+    max_index = np.nanargmax(stack_array[:, 0, 0, 0])
+    assert comp_array[:, 0, 0] == pytest.approx(stack_array[max_index, :, 0, 0])
+    assert np.all(np.isnan(comp_array[:, 1, 1]))
+
+
+def test_medoid(stack_array: np.ndarray):
+    """ Test composite.medoid() against a brute force medoid. """
+    comp_array = composite.medoid(stack_array, band_index=[0, 1])
+    for row, col in [(0, 0), (2, 3)]:
+        pixels = stack_array[:, :, row, col]
+        valid = ~np.any(np.isnan(pixels), axis=1)
+        sum_dist = [
+            np.sum([np.linalg.norm(pixels[i, :2] - pixels[j, :2]) for j in np.where(valid)[0]]) if valid[i] else np.inf
+            for i in range(pixels.shape[0])
+        ]
+        assert comp_array[:, row, col] == pytest.approx(pixels[np.argmin(sum_dist)])
+    assert np.all(np.isnan(comp_array[:, 1, 1]))
+
+
+def test_medoid_discard_zeros():
+    """ Test composite.medoid() ignores zero band values in distances when discard_zeros is True. """
+    # the first pixel is nearest the others when its zero band is ignored, and furthest when it is not
+    array = np.array([[0, 5], [4, 4], [6, 6], [5, 3]], dtype='float64').reshape(4, 2, 1, 1)
+    assert composite.medoid(array, discard_zeros=True)[:, 0, 0].tolist() == [0, 5]
+    assert composite.medoid(array, discard_zeros=False)[:, 0, 0].tolist() != [0, 5]
+
+
+def test_composite_array(stack_array: np.ndarray):
+    """ Test composite.composite_array() dispatches methods and raises errors. """
+    band_names = ['B1', 'B2', 'CLOUD_DIST']
+    for method in CompositeMethod:
+        comp_array = composite.composite_array(stack_array, method, band_names, refl_bands=['B1', 'B2'])
+        assert comp_array.shape == stack_array.shape[1:]
+    with pytest.raises(ValueError):
+        composite.composite_array(stack_array, CompositeMethod.q_mosaic, ['B1', 'B2', 'B3'])
@@ -23,11 +23,12 @@ import pytest
 import rasterio as rio
 from geedim.download import BaseImage
 from geedim.enums import ResamplingMethod
+from geedim.mask import MaskedImage
 from rasterio import Affine
 from rasterio.coords import BoundingBox
 from rasterio.features import bounds
 from rasterio.warp import transform_geom
-from rasterio.windows import union
+from rasterio.windows import union, Window
 
 
 class BaseImageLike:
@@ -158,6 +159,8 @@ def test_has_fixed_projection(user_base_image: BaseImage, user_fix_base_image: B
         ([{'precision': 'int', 'min': 10, 'max': 11}, {'precision': 'int', 'min': 100, 'max': 101}], 'uint8'),
         ([{'precision': 'int', 'min': -128, 'max': -100}, {'precision': 'int', 'min': 0, 'max': 127}], 'int8'),
         ([{'precision': 'int', 'min': 256, 'max': 257}], 'uint16'),
+        ([{'precision': 'int', 'min': 0, 'max': 256}], 'uint16'),
+        ([{'precision': 'int', 'min': -1, 'max': 200}], 'int16'),
         ([{'precision': 'int', 'min': -32768, 'max': 32767}], 'int16'),
         ([{'precision': 'int', 'min': 2 << 15, 'max': 2 << 32}], 'uint32'),
         ([{'precision': 'int', 'min': -2 << 31, 'max': 2 << 31}], 'int32'),
@@ -174,6 +177,47 @@ def test_min_dtype(ee_data_type_list: List, exp_dtype: str):
     assert BaseImage._get_min_dtype(ee_info) == exp_dtype
 
 
+@pytest.mark.parametrize(
+    'band_values, band_dtypes, exp_dtype', [
+        ([200], ['uint32'], 'uint8'),
+        ([-1], ['int32'], 'int8'),
+        ([1000], ['float32'], 'float32'),
+        ([0.5], ['float64'], 'float32'),
+        ([1e200], ['float64'], 'float64'),
+        ([300, -300], ['uint32', 'int32'], 'int16'),
+    ]
+)  # yapf: disable
+def test_data_min_dtype(band_values: List, band_dtypes: List, exp_dtype: str, region_25ha: Dict):
+    """ Test BaseImage._get_data_min_dtype() finds the data type from actual pixel values. """
+    ee_image = ee.Image([
+        BaseImage._convert_dtype(ee.Image(band_value), band_dtype)
+        for band_value, band_dtype in zip(band_values, band_dtypes)
+    ])  # yapf: disable
+    assert BaseImage._get_data_min_dtype(ee_image, region_25ha, 'EPSG:3857', 30) == exp_dtype
+
+
+@pytest.mark.parametrize(
+    'band_value, band_dtype, exp_dtype', [(250, 'uint32', 'uint16'), (250, 'uint8', 'uint8'), (-120, 'int32', 'int16')]
+)
+def test_data_min_dtype_margin(band_value: float, band_dtype: str, exp_dtype: str, region_25ha: Dict):
+    """
+    Test BaseImage._get_data_min_dtype() widens the estimated pixel value ranges by the margin, within the declared
+    data type ranges.
+    """
+    ee_image = BaseImage._convert_dtype(ee.Image(band_value), band_dtype)
+    assert BaseImage._get_data_min_dtype(ee_image, region_25ha, 'EPSG:3857', 30) == exp_dtype
+
+
+def test_prepare_data_dtype(l9_base_image: BaseImage, region_25ha: Dict):
+    """ Test BaseImage._prepare_for_export(data_dtype=True) gives a data type no bigger than the default. """
+    exp_image = l9_base_image._prepare_for_export(region=region_25ha)
+    data_exp_image = l9_base_image._prepare_for_export(region=region_25ha, data_dtype=True)
+    assert np.dtype(data_exp_image.dtype).itemsize <= np.dtype(exp_image.dtype).itemsize
+    # test data_dtype has no effect when dtype is specified
+    data_exp_image = l9_base_image._prepare_for_export(region=region_25ha, dtype='int32', data_dtype=True)
+    assert data_exp_image.dtype == 'int32'
+
+
 def test_convert_dtype_error():
     """ Test BaseImage.test_convert_dtype() raises an error with incorrect dtype. """
     with pytest.raises(TypeError):
@@ -306,7 +350,7 @@ def test_scale_offset(src_image: str, dtype: str, region_100ha: Dict, request: p
     assert exp_image.crs == src_image.crs
     assert exp_image.scale == src_image.scale
     assert exp_image.band_properties == src_image.band_properties
-    assert exp_image.dtype == dtype or 'float64'
+    assert exp_image.dtype == (dtype or 'float64')
 
     def get_min_max_refl(base_image: BaseImage) -> Dict:
         """ Get the min & max of each reflectance band of base_image.  """
@@ -328,6 +372,109 @@ def test_scale_offset(src_image: str, dtype: str, region_100ha: Dict, request: p
     assert all(np.array(list(exp_max.values())) <= 1.5)
 
 
+@pytest.mark.parametrize('dtype, nodata', [('uint16', 0), ('int16', -2**15), ('float32', float('nan'))])
+def test_scale_offset_array(dtype: str, nodata: float):
+    """
+    Test BaseImage._scale_offset_array() applies band scales and offsets, and converts nodata to nan in scaled bands
+    only.
+    """
+    band_properties = [dict(name='B1', scale=2.75e-05, offset=-0.2), dict(name='B2', scale=0.1), dict(name='B3')]
+    array = np.arange(1, 3 * 4 * 5 + 1).reshape(3, 4, 5).astype(dtype)
+    array[:, 0, 0] = nodata
+    adj_array = BaseImage._scale_offset_array(array, band_properties, nodata=nodata, dtype='float64')
+
+    assert adj_array.dtype == 'float64'
+    assert adj_array.shape == array.shape
+    assert np.all(np.isnan(adj_array[:2, 0, 0]))
+    assert (adj_array[2, 0, 0] == nodata) or np.isnan(nodata)
+    valid_mask = ~np.isnan(adj_array)
+    for band_i, bp in enumerate(band_properties):
+        exp_band = array[band_i].astype('float64') * bp.get('scale', 1.) + bp.get('offset', 0.)
+        assert adj_array[band_i][valid_mask[band_i]] == pytest.approx(exp_band[valid_mask[band_i]])
+
+
+
+def test_scale_offset_array_mask():
+    """ Test BaseImage._scale_offset_array() masks pixels from ``mask``, rather than from the nodata value. """
+    band_properties = [dict(name='B1', scale=0.1, offset=1), dict(name='MASK')]
+    array = np.zeros((2, 3, 3), dtype='uint16')
+    mask = np.zeros(array.shape, dtype=bool)
+    mask[:, 1, 1] = True
+    adj_array = BaseImage._scale_offset_array(array, band_properties, nodata=0, dtype='float64', mask=mask)
+
+    assert np.all(np.isnan(adj_array) == mask)
+    assert np.all(adj_array[0][~mask[0]] == 1)
+    assert np.all(adj_array[1][~mask[1]] == 0)
+
+
+@pytest.mark.parametrize('dtype', ['float32', None])
+def test_client_scale_offset(l9_base_image: BaseImage, dtype: str, region_100ha: Dict, tmp_path: pathlib.Path):
+    """ Test BaseImage.download(scale_offset=True) gives the same result as applying scales and offsets server-side. """
+    kwargs = dict(region=region_100ha, scale_offset=True, dtype=dtype)
+    exp_image, profile = l9_base_image._prepare_for_download(**kwargs)
+    # test the prepared image retains its native data type
+    assert exp_image.dtype == l9_base_image.dtype
+    assert profile['dtype'] == (dtype or 'float64')
+
+    filename = tmp_path.joinpath('test_client_scale_offset.tif')
+    l9_base_image.download(filename, **kwargs)
+    server_exp_image = l9_base_image._prepare_for_export(region=region_100ha, scale_offset=True, dtype='float64')
+    server_array = next(l9_base_image._tiles(server_exp_image)).download()
+    with rio.open(filename, 'r') as ds:
+        assert ds.dtypes[0] == profile['dtype']
+        client_array = ds.read(window=Window(0, 0, server_array.shape[2], server_array.shape[1]))
+    valid_mask = ~np.isnan(client_array) & ~np.isnan(server_array)
+    assert client_array[valid_mask] == pytest.approx(server_array[valid_mask], rel=1e-6)
+
+
+@pytest.mark.parametrize('masked_image', ['l9_masked_image', 's2_sr_masked_image'])
+def test_client_scale_offset_masked_image(
+    masked_image: str, region_100ha: Dict, tmp_path: pathlib.Path, request: pytest.FixtureRequest
+):
+    """
+    Test MaskedImage.download(scale_offset=True) gives the same result as applying scales and offsets server-side,
+    including the mask bands, and the masked pixels.
+    """
+    masked_image: MaskedImage = request.getfixturevalue(masked_image)
+    filename = tmp_path.joinpath('test_client_scale_offset.tif')
+    masked_image.download(filename, region=region_100ha, scale_offset=True)
+    server_exp_image = masked_image._prepare_for_export(region=region_100ha, scale_offset=True, dtype='float64')
+    server_array = next(masked_image._tiles(server_exp_image)).download()
+    with rio.open(filename, 'r') as ds:
+        client_array = ds.read(window=Window(0, 0, server_array.shape[2], server_array.shape[1]))
+    assert np.all(np.isnan(client_array) == np.isnan(server_array))
+    valid_mask = ~np.isnan(server_array)
+    assert np.any(server_array[valid_mask] == 0)
+    assert client_array[valid_mask] == pytest.approx(server_array[valid_mask], rel=1e-6)
+
+
+@pytest.mark.parametrize(
+    'scale_offset, dtype, resampling, exp_client', [
+        (True, None, None, True),
+        (True, 'float32', ResamplingMethod.near, True),
+        (True, 'uint16', None, False),
+        (False, None, None, False),
+        (True, None, ResamplingMethod.bilinear, False),
+        (True, 'float64', 'bicubic', False),
+    ]
+)
+def test_client_scale_offset_params(
+    scale_offset: bool, dtype: str, resampling: ResamplingMethod, exp_client: bool
+):
+    """ Test scales and offsets are only applied client-side for floating point dtypes, and near resampling. """
+    assert BaseImage._client_scale_offset(scale_offset, dtype, resampling) == exp_client
+
+
+@pytest.mark.parametrize('resampling', [ResamplingMethod.bilinear, ResamplingMethod.average])
+def test_resample_scale_offset(l9_base_image: BaseImage, resampling: ResamplingMethod, region_100ha: Dict):
+    """ Test BaseImage._prepare_for_download() applies scales and offsets server-side when resampling. """
+    exp_image, profile = l9_base_image._prepare_for_download(
+        region=region_100ha, scale_offset=True, resampling=resampling
+    )
+    assert exp_image.dtype == 'float64'
+    assert profile['dtype'] == 'float64'
+
+
 def test_tile_shape():
     """ Test BaseImage._get_tile_shape() satisfies the EE download limit for different image shapes. """
     max_download_size = 32 << 20
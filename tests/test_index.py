@@ -0,0 +1,76 @@
+"""
+    Copyright 2021 Dugal Harris - dugalh@gmail.com
+
+    Licensed under the Apache License, Version 2.0 (the "License");
+    you may not use this file except in compliance with the License.
+    You may obtain a copy of the License at
+
+       http://www.apache.org/licenses/LICENSE-2.0
+
+    Unless required by applicable law or agreed to in writing, software
+    distributed under the License is distributed on an "AS IS" BASIS,
+    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+    See the License for the specific language governing permissions and
+    limitations under the License.
+"""
+import pathlib
+from datetime import datetime
+from typing import Dict
+
+import pytest
+from geedim.collection import MaskedCollection
+from geedim.index import SearchIndex
+
+
+@pytest.fixture
+def index_props() -> Dict:
+    """ Synthetic search result properties and footprints for two images. """
+    properties = {
+        'A/B/image1': {
+            'system:id': 'A/B/image1', 'system:time_start': SearchIndex._timestamp(datetime(2022, 1, 2)),
+            'FILL_PORTION': 100., 'CLOUDLESS_PORTION': 40.
+        },
+        'A/B/image2': {
+            'system:id': 'A/B/image2', 'system:time_start': SearchIndex._timestamp(datetime(2022, 1, 1)),
+            'FILL_PORTION': 90., 'CLOUDLESS_PORTION': 80.
+        },
+    }  # yapf: disable
+    footprints = {
+        'A/B/image1': dict(type='Polygon', coordinates=[[[0, 0], [1, 0], [1, 1], [0, 1], [0, 0]]]),
+        'A/B/image2': dict(type='Polygon', coordinates=[[[5, 5], [6, 5], [6, 6], [5, 6], [5, 5]]]),
+    }
+    return dict(properties=properties, footprints=footprints)
+
+
+def test_index_query(index_props: Dict, tmp_path: pathlib.Path):
+    """ Test SearchIndex.query() filters and orders indexed images. """
+    with SearchIndex(tmp_path.joinpath('index.db')) as index:
+        index.add('A/B', **index_props)
+        index.add('A/B', **index_props)  # test re-adding replaces existing entries
+        assert list(index.query().keys()) == ['A/B/image2', 'A/B/image1']
+        assert index.query() == {k: index_props['properties'][k] for k in ['A/B/image2', 'A/B/image1']}
+        assert list(index.query(cloudless_portion=50).keys()) == ['A/B/image2']
+        assert list(index.query(fill_portion=95).keys()) == ['A/B/image1']
+        assert list(index.query(start_date=datetime(2022, 1, 2)).keys()) == ['A/B/image1']
+        assert list(index.query(end_date=datetime(2022, 1, 2)).keys()) == ['A/B/image2']
+        region = dict(type='Polygon', coordinates=[[[0.5, 0.5], [2, 0.5], [2, 2], [0.5, 2], [0.5, 0.5]]])
+        assert list(index.query(region=region).keys()) == ['A/B/image1']
+        assert len(index.query(name='C/D')) == 0
+
+
+def test_to_from_index(region_100ha: Dict, tmp_path: pathlib.Path):
+    """ Test MaskedCollection.to_index() and MaskedCollection.from_index() re-create search results. """
+    filename = tmp_path.joinpath('index.db')
+    gd_collection = MaskedCollection.from_name('LANDSAT/LC08/C02/T1_L2')
+    searched_collection = gd_collection.search('2022-01-01', '2022-03-01', region_100ha)
+    searched_collection.to_index(filename)
+
+    index_collection = MaskedCollection.from_index(filename, name='LANDSAT/LC08/C02/T1_L2', region=region_100ha)
+    assert index_collection.properties == searched_collection.properties
+    assert index_collection.ee_collection.size().getInfo() == len(searched_collection.properties)
+
+    cloudless_portion = sorted([p['CLOUDLESS_PORTION'] for p in searched_collection.properties.values()])[-1]
+    index_collection = MaskedCollection.from_index(filename, cloudless_portion=cloudless_portion)
+    assert all([p['CLOUDLESS_PORTION'] >= cloudless_portion for p in index_collection.properties.values()])
+    with pytest.raises(ValueError):
+        MaskedCollection.from_index(filename, start_date='2023-01-01')
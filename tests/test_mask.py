@@ -13,13 +13,15 @@
     See the License for the specific language governing permissions and
     limitations under the License.
 """
-from typing import Dict
+from typing import Dict, List
 
 import ee
 import numpy as np
 import pytest
 import rasterio as rio
-from geedim.mask import MaskedImage, get_projection, class_from_id
+from geedim.mask import (
+    MaskedImage, get_projection, class_from_id, unpack_masks, landsat_qa_masks, sentinel2_qa_masks
+)
 
 
 def test_class_from_id(landsat_image_ids, s2_sr_image_id, s2_toa_hm_image_id, generic_image_ids):
@@ -67,6 +69,15 @@ def test_cloud_mask_aux_bands_exist(masked_image: str, request: pytest.FixtureRe
         assert exp_band_name in band_names
 
 
+@pytest.mark.parametrize('image_id', ['s2_sr_image_id', 'l9_image_id'])
+def test_cloud_dist_param(image_id: str, request: pytest.FixtureRequest):
+    """ Test the `cloud_dist` parameter omits the CLOUD_DIST band from cloud masked images. """
+    image_id: str = request.getfixturevalue(image_id)
+    band_names = MaskedImage.from_id(image_id, cloud_dist=False).ee_image.bandNames().getInfo()
+    assert 'CLOUD_DIST' not in band_names
+    assert 'CLOUDLESS_MASK' in band_names
+
+
 @pytest.mark.parametrize(
     'masked_image', [
         's2_sr_masked_image', 's2_toa_masked_image', 's2_sr_hm_masked_image', 's2_toa_hm_masked_image',
@@ -322,3 +333,110 @@ def test_mask_clouds(masked_image: str, region_100ha: Dict, tmp_path, request: p
         # test that cloudless_mask is the same as the nodata/dataset mask for each bands
         ds_masks = ds.read_masks().astype('bool')
         assert np.all(cloudless_mask == ds_masks)
+
+
+def test_unpack_masks():
+    """ Test unpack_masks() extracts the mask bits, and treats nan as zero. """
+    mask_bits = np.array([[0b0001, 0b1001], [0b0110, np.nan]])
+    masks = unpack_masks(mask_bits)
+    assert list(masks.keys()) == ['FILL_MASK', 'CLOUD_MASK', 'SHADOW_MASK', 'CLOUDLESS_MASK']
+    assert np.all(masks['FILL_MASK'] == [[True, True], [False, False]])
+    assert np.all(masks['CLOUD_MASK'] == [[False, False], [True, False]])
+    assert np.all(masks['SHADOW_MASK'] == [[False, False], [True, False]])
+    assert np.all(masks['CLOUDLESS_MASK'] == [[False, True], [False, False]])
+
+
+def test_landsat_qa_masks():
+    """ Test landsat_qa_masks() decodes QA_PIXEL bits, with and without cirrus and shadow masking. """
+    qa_pixel = np.array([0b00001, 0b00100, 0b01000, 0b10000, 0, np.nan])
+    masks = landsat_qa_masks(qa_pixel)
+    assert np.all(masks['FILL_MASK'] == [False, True, True, True, True, False])
+    assert np.all(masks['CLOUD_MASK'] == [False, True, True, False, False, False])
+    assert np.all(masks['SHADOW_MASK'] == [False, False, False, True, False, False])
+    assert np.all(masks['CLOUDLESS_MASK'] == [False, False, False, False, True, False])
+
+    masks = landsat_qa_masks(qa_pixel, fill_mask=[True] * 4 + [False] * 2, mask_shadows=False, mask_cirrus=False)
+    assert np.all(masks['CLOUD_MASK'] == [False, False, True, False, False, False])
+    assert np.all(masks['CLOUDLESS_MASK'] == [False, True, False, True, False, False])
+
+
+def test_sentinel2_qa_masks():
+    """ Test sentinel2_qa_masks() decodes QA60 bits and the SCL shadow class. """
+    qa60 = np.array([1 << 10, 1 << 11, 0, 0])
+    scl = np.array([8, 10, 3, 4])
+    masks = sentinel2_qa_masks(qa60, scl=scl)
+    assert np.all(masks['CLOUD_MASK'] == [True, True, False, False])
+    assert np.all(masks['SHADOW_MASK'] == [False, False, True, False])
+    assert np.all(masks['CLOUDLESS_MASK'] == [False, False, False, True])
+
+    masks = sentinel2_qa_masks(qa60, mask_cirrus=False, fill_mask=[True, True, True, False])
+    assert np.all(masks['CLOUD_MASK'] == [True, False, False, False])
+    assert np.all(masks['CLOUDLESS_MASK'] == [False, True, True, False])
+
+
+def test_sentinel2_qa_masks_nodata():
+    """ Test sentinel2_qa_masks() treats NaN QA60 and SCL pixels, and the SCL no data class, as unfilled. """
+    qa60 = np.array([0, np.nan, 0, 0, 1 << 10])
+    scl = np.array([4, 4, np.nan, 0, 8])
+    masks = sentinel2_qa_masks(qa60, scl=scl)
+    assert np.all(masks['FILL_MASK'] == [True, False, False, False, True])
+    assert np.all(masks['CLOUDLESS_MASK'] == [True, False, False, False, False])
+
+    masks = sentinel2_qa_masks(qa60)
+    assert np.all(masks['FILL_MASK'] == [True, False, True, True, True])
+    assert np.all(masks['CLOUDLESS_MASK'] == [True, False, True, True, False])
+
+
+# yapf: disable
+@pytest.mark.parametrize(
+    'image_id, qa_bands, mask_names, kwargs', [
+        ('l9_image_id', ['QA_PIXEL'], ['FILL_MASK', 'CLOUD_MASK', 'SHADOW_MASK', 'CLOUDLESS_MASK'], {}),
+        ('l8_image_id', ['QA_PIXEL'], ['CLOUD_MASK', 'CLOUDLESS_MASK'], dict(mask_cirrus=False, mask_shadows=False)),
+        ('s2_sr_image_id', ['QA60'], ['CLOUD_MASK'], dict(mask_method='qa')),
+    ]
+)
+# yapf: enable
+def test_qa_masks_ee(
+    image_id: str, qa_bands: List[str], mask_names: List[str], kwargs: Dict, region_100ha: Dict, tmp_path,
+    request: pytest.FixtureRequest
+):
+    """ Test locally derived QA masks are identical to the Earth Engine masks. """
+    image_id: str = request.getfixturevalue(image_id)
+    masked_image = MaskedImage.from_id(image_id, **kwargs)
+    masked_image.ee_image = masked_image.ee_image.select(qa_bands + mask_names)
+    filename = tmp_path.joinpath('test_image.tif')
+    masked_image.download(filename, region=region_100ha, dtype='uint16')
+
+    with rio.open(filename, 'r') as ds:
+        qa_arrays = [ds.read(ds.descriptions.index(qa_band) + 1) for qa_band in qa_bands]
+        if 'QA_PIXEL' in qa_bands:
+            masks = landsat_qa_masks(*qa_arrays, **kwargs)
+        else:
+            masks = sentinel2_qa_masks(*qa_arrays, mask_cirrus=kwargs.get('mask_cirrus', True))
+        for mask_name in mask_names:
+            ee_mask = ds.read(ds.descriptions.index(mask_name) + 1).astype(bool)
+            assert np.all(masks[mask_name] == ee_mask)
+
+
+@pytest.mark.parametrize('image_id', ['s2_sr_image_id', 'l9_image_id', 'modis_nbar_image_id'])
+def test_pack_masks(image_id: str, region_100ha: Dict, tmp_path, request: pytest.FixtureRequest):
+    """ Test MaskedImage.pack_masks() by comparing downloaded packed, and unpacked masks. """
+    image_id: str = request.getfixturevalue(image_id)
+    masked_image = MaskedImage.from_id(image_id)
+    proj_scale = get_projection(masked_image.ee_image, min_scale=False).nominalScale()
+    kwargs = dict(region=region_100ha, dtype='uint16', crs='EPSG:3857', scale=proj_scale)
+    filename = tmp_path.joinpath(f'test_image.tif')
+    masked_image.download(filename, **kwargs)
+    packed_filename = tmp_path.joinpath(f'test_packed_image.tif')
+    masked_image.pack_masks()
+    masked_image.download(packed_filename, **kwargs)
+
+    with rio.open(filename, 'r') as ds, rio.open(packed_filename, 'r') as packed_ds:
+        mask_names = [desc for desc in ds.descriptions if desc.endswith('_MASK')]
+        assert 'MASK_BITS' in packed_ds.descriptions
+        assert not any([desc.endswith('_MASK') for desc in packed_ds.descriptions])
+        assert packed_ds.count == ds.count - len(mask_names) + 1
+        masks = unpack_masks(packed_ds.read(packed_ds.descriptions.index('MASK_BITS') + 1))
+        for mask_name in mask_names:
+            mask = ds.read(ds.descriptions.index(mask_name) + 1).astype('bool')
+            assert np.all(mask == masks[mask_name])
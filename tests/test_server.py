@@ -0,0 +1,89 @@
+"""
+    Copyright 2021 Dugal Harris - dugalh@gmail.com
+
+    Licensed under the Apache License, Version 2.0 (the "License");
+    you may not use this file except in compliance with the License.
+    You may obtain a copy of the License at
+
+       http://www.apache.org/licenses/LICENSE-2.0
+
+    Unless required by applicable law or agreed to in writing, software
+    distributed under the License is distributed on an "AS IS" BASIS,
+    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+    See the License for the specific language governing permissions and
+    limitations under the License.
+"""
+import pathlib
+import threading
+import time
+from typing import Dict
+
+import pytest
+from geedim import batch
+from geedim.batch import JobQueue
+from geedim.server import Client, JobServer
+
+
+@pytest.fixture
+def run_job(monkeypatch: pytest.MonkeyPatch):
+    """ Replace batch.run_job() with a fake that records the jobs it runs, and fails jobs with a 'fail' ID. """
+    run = []
+
+    def _run_job(job: Dict, num_threads: int = None):
+        run.append(job)
+        if job['id'] == 'fail':
+            raise ValueError('error')
+
+    monkeypatch.setattr(batch, 'run_job', _run_job)
+    return run
+
+
+@pytest.fixture
+def server(tmp_path: pathlib.Path, run_job) -> JobServer:
+    """ A job server running in a background thread, on a free port. """
+    server = JobServer(tmp_path.joinpath('queue.db'), port=0, max_jobs=2)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def test_submit(server: JobServer, run_job):
+    """ Test submitting jobs to a server, and retrieving their states. """
+    client = Client(f'http://127.0.0.1:{server.server_address[1]}')
+    jobs = [dict(id='A/B/image1'), dict(id='fail')]
+    keys = client.submit(jobs)
+    assert len(keys) == 2
+    statuses = client.wait(keys, interval=0.1, timeout=10)
+    assert statuses[keys[0]]['state'] == JobQueue.done
+    assert statuses[keys[1]] == dict(key=keys[1], state=JobQueue.failed, error='error')
+    assert client.counts() == {JobQueue.pending: 0, JobQueue.running: 0, JobQueue.done: 1, JobQueue.failed: 1}
+
+    # test re-submitting does not re-run jobs, and a single job can be submitted
+    assert client.submit(jobs[0]) == keys[:1]
+    assert sorted(run_job, key=jobs.index) == jobs
+
+
+def test_submit_error(server: JobServer):
+    """ Test the client raises errors for invalid jobs and unknown job keys. """
+    client = Client(f'http://127.0.0.1:{server.server_address[1]}')
+    with pytest.raises(ValueError):
+        client.submit(dict(unknown='A/B/image1'))
+    with pytest.raises(ValueError):
+        client.status('unknown')
+
+
+def test_resume(tmp_path: pathlib.Path, run_job):
+    """ Test a server resumes unfinished jobs from its queue file. """
+    filename = tmp_path.joinpath('queue.db')
+    with JobQueue(filename) as queue:
+        keys = queue.add([dict(id='A/B/image1'), dict(id='A/B/image2')])
+        queue.set_state(keys[0], queue.running)
+
+    server = JobServer(filename, port=0)
+    start = time.time()
+    while (server.queue.get_counts()[JobQueue.done] < 2) and (time.time() - start < 10):
+        time.sleep(0.1)
+    server.server_close()
+    assert run_job == [dict(id='A/B/image1'), dict(id='A/B/image2')]
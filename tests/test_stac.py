@@ -14,8 +14,11 @@
     limitations under the License.
 """
 import re
+import time
+from concurrent.futures import ThreadPoolExecutor
 
 import pytest
+import requests
 from geedim.stac import StacCatalog, StacItem
 from geedim.utils import split_id
 
@@ -53,6 +56,63 @@ def test_traverse_stac(stac_catalog: StacCatalog):
     assert 'COPERNICUS/S2_SR' in url_dict
 
 
+def test_traverse_stac_incremental(stac_catalog: StacCatalog, tmp_path, monkeypatch: pytest.MonkeyPatch):
+    """ Test _traverse_stac() persists its crawl state, and re-uses it to give the same result on a second traversal. """
+    monkeypatch.setenv('GEEDIM_CACHE_DIR', str(tmp_path))
+    url = 'https://storage.googleapis.com/earthengine-stac/catalog/COPERNICUS/catalog.json'
+    url_dict = stac_catalog._traverse_stac(url, {})
+    state = stac_catalog._read_crawl_state()
+    assert stac_catalog._crawl_state_filename().exists()
+    assert url in state
+    assert set(url_dict.values()).issubset(state.keys())
+
+    url_dict2 = stac_catalog._traverse_stac(url, {})
+    assert url_dict2 == url_dict
+
+
+def test_traverse_stac_changed_subtree(stac_catalog: StacCatalog, tmp_path, monkeypatch: pytest.MonkeyPatch):
+    """
+    Test _traverse_stac() finds collections added below an unchanged node, and drops collections removed from EE STAC.
+    """
+    tree = {
+        'root': dict(type='Catalog', links=[dict(rel='child', href='sub'), dict(rel='child', href='coll1')]),
+        'sub': dict(type='Catalog', links=[dict(rel='child', href='coll2')]),
+        'coll1': {'type': 'Collection', 'gee:type': 'image_collection', 'id': 'A/coll1'},
+        'coll2': {'type': 'Collection', 'gee:type': 'image', 'id': 'A/B/coll2'},
+    }  # yapf: disable
+    etags = {url: '1' for url in tree}
+
+    class Response:
+        def __init__(self, url, headers):
+            self.status_code = 304 if headers.get('If-None-Match', None) == etags[url] else 200
+            self.ok = True
+            self.headers = dict(ETag=etags[url])
+            self._url = url
+
+        def json(self):
+            return tree[self._url]
+
+    class Session:
+        def get(self, url, headers=None):
+            return Response(url, headers or {})
+
+    monkeypatch.setenv('GEEDIM_CACHE_DIR', str(tmp_path))
+    monkeypatch.setattr(stac_catalog, '_session', Session())
+    assert stac_catalog._traverse_stac('root', {}) == {'A/coll1': 'coll1', 'A/B/coll2': 'coll2'}
+
+    # add a collection to the sub-catalog, leaving the root unchanged
+    tree['sub']['links'].append(dict(rel='child', href='coll3'))
+    tree['coll3'] = {'type': 'Collection', 'gee:type': 'image', 'id': 'A/B/coll3'}
+    etags.update(sub='2', coll3='1')
+    assert 'A/B/coll3' in stac_catalog._traverse_stac('root', {})
+
+    # remove a collection from the root
+    tree['root']['links'].pop(1)
+    etags['root'] = '2'
+    assert 'A/coll1' not in stac_catalog._traverse_stac('root', {})
+    assert 'coll1' not in stac_catalog._read_crawl_state()
+
+
 @pytest.mark.parametrize(
     'image_id', [
         'l4_image_id', 'l5_image_id', 'l7_image_id', 'l8_image_id', 'l9_image_id', 'landsat_ndvi_image_id',
@@ -111,3 +171,86 @@ def test_stac_item_descriptions(image_id: str, stac_catalog: StacCatalog, reques
     assert stac_item.descriptions is not None
     assert len(stac_item.descriptions) > 0
     assert len(list(stac_item.descriptions.values())[0]) > 0
+
+
+def test_item_dict_disk_cache(
+    stac_catalog: StacCatalog, l9_image_id: str, tmp_path, monkeypatch: pytest.MonkeyPatch
+):
+    """ Test StacCatalog.get_item_dict() caches item dicts on disk, and revalidates stale entries. """
+    monkeypatch.setenv('GEEDIM_CACHE_DIR', str(tmp_path))
+    monkeypatch.setattr(stac_catalog, '_cache', {})
+    monkeypatch.setattr(stac_catalog, '_snapshot', {})
+    coll_name, _ = split_id(l9_image_id)
+    item_dict = stac_catalog.get_item_dict(coll_name)
+    assert item_dict is not None
+    cache_file = stac_catalog._cache_filename(coll_name)
+    assert cache_file.exists()
+
+    class NoSession:
+        def get(self, *args, **kwargs):
+            raise AssertionError('Unexpected request.')
+
+    # test the fresh disk cache is used without a request
+    monkeypatch.setattr(stac_catalog, '_cache', {})
+    monkeypatch.setattr(stac_catalog, '_session', NoSession())
+    assert stac_catalog.get_item_dict(coll_name) == item_dict
+
+    # test a stale entry is used if it cannot be revalidated
+    monkeypatch.setattr(stac_catalog, '_cache', {})
+    monkeypatch.setattr(stac_catalog, '_cache_ttl', 0)
+    assert stac_catalog.get_item_dict(coll_name) == item_dict
+
+    class ErrorSession:
+        def get(self, *args, **kwargs):
+            response = requests.Response()
+            response.status_code = 500
+            response._content = b'{"error": "server error"}'
+            return response
+
+    # test a stale entry is used, and not overwritten, if revalidating it returns an error response
+    cache_content = cache_file.read_text()
+    monkeypatch.setattr(stac_catalog, '_cache', {})
+    monkeypatch.setattr(stac_catalog, '_session', ErrorSession())
+    assert stac_catalog.get_item_dict(coll_name) == item_dict
+    assert cache_file.read_text() == cache_content
+
+
+def test_snapshot(stac_catalog: StacCatalog, l9_image_id: str, tmp_path, monkeypatch: pytest.MonkeyPatch):
+    """ Test StacCatalog.refresh_snapshot() and write_snapshot(), and that get_item() uses the snapshot. """
+    coll_name, _ = split_id(l9_image_id)
+    monkeypatch.setattr(stac_catalog, '_snapshot', None)
+    monkeypatch.setattr(stac_catalog, '_snapshot_filename', tmp_path.joinpath('snapshot.json'))
+    stac_catalog.refresh_snapshot()
+    assert coll_name in stac_catalog.snapshot
+    stac_catalog.write_snapshot()
+    assert stac_catalog._snapshot_filename.exists()
+
+    # test items are created from the snapshot without a request, with the same band properties and license
+    ref_item = StacItem(coll_name, stac_catalog._fetch_item_dict(coll_name))
+    monkeypatch.setattr(stac_catalog, '_snapshot', None)
+    monkeypatch.setattr(stac_catalog, '_cache', {})
+    monkeypatch.setattr(stac_catalog, '_session', None)
+    stac_item = stac_catalog.get_item(coll_name)
+    assert stac_item.band_props == ref_item.band_props
+    assert stac_item.license == ref_item.license
+    assert stac_item.descriptions == ref_item.descriptions
+
+
+def test_get_item_dict_single_flight(stac_catalog: StacCatalog, l9_image_id: str, monkeypatch: pytest.MonkeyPatch):
+    """ Test concurrent StacCatalog.get_item_dict() calls for the same item fetch it once only. """
+    coll_name, _ = split_id(l9_image_id)
+    fetch_item_dict = stac_catalog._fetch_item_dict
+    names = []
+
+    def _fetch_item_dict(name):
+        names.append(name)
+        time.sleep(0.2)
+        return fetch_item_dict(name)
+
+    monkeypatch.setattr(stac_catalog, '_cache', {})
+    monkeypatch.setattr(stac_catalog, '_snapshot', {})
+    monkeypatch.setattr(stac_catalog, '_fetch_item_dict', _fetch_item_dict)
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        item_dicts = list(executor.map(stac_catalog.get_item_dict, [coll_name] * 4))
+    assert names == [coll_name]
+    assert all([item_dict == item_dicts[0] for item_dict in item_dicts])
@@ -14,14 +14,16 @@
     limitations under the License.
 """
 
+import threading
 import time
+from concurrent.futures import ThreadPoolExecutor
 from typing import Dict
 
 import ee
 import pytest
 from geedim import MaskedImage
 from geedim.enums import ResamplingMethod
-from geedim.utils import split_id, get_projection, get_bounds, Spinner, resample
+from geedim.utils import split_id, get_projection, get_bounds, Spinner, resample, SingleFlight
 from rasterio.features import bounds
 
 from .conftest import get_image_std
@@ -67,6 +69,36 @@ def test_spinner():
     assert not spinner.is_alive()
 
 
+def test_single_flight():
+    """ Test SingleFlight de-duplicates concurrent calls with the same key, and shares their results and exceptions. """
+    single_flight = SingleFlight()
+    calls = []
+    release = threading.Event()
+
+    def func(key):
+        calls.append(key)
+        release.wait(5)
+        if key == 'error':
+            raise ValueError(key)
+        return key
+
+    with ThreadPoolExecutor(max_workers=12) as executor:
+        futures = [executor.submit(single_flight.do, key, func, key) for key in ['a', 'b', 'error'] * 4]
+        time.sleep(0.2)
+        release.set()
+    assert sorted(calls) == ['a', 'b', 'error']
+    for future, key in zip(futures, ['a', 'b', 'error'] * 4):
+        if key == 'error':
+            with pytest.raises(ValueError):
+                future.result()
+        else:
+            assert future.result() == key
+
+    # test a key can be called again once its call has completed
+    assert single_flight.do('a', func, 'a') == 'a'
+    assert calls.count('a') == 2
+
+
 # yapf: disable
 @pytest.mark.parametrize(
     'image_id, method, std_scale', [